@@ -1,29 +1,79 @@
+import os
+from functools import wraps
+
 import pandas as pd
-import numpy as np
 import streamlit as st
-import plotly.express as px
-from PIL import Image
 
-from graficos import grafico_barras, grafico_linha, grafico_funil
-from utils import carregar_dados
+from graficos import grafico_barras, grafico_funil, grafico_heatmap, grafico_linha
+from utils import (COLUNAS_ADS, COLUNAS_CRM, obter_cache_consultas, obter_gerenciador_lojas, obter_insights,
+                   obter_metadados)
+from cache import estado_filtros, normalizar_selecao
+from cubo import GRANULARIDADES, agregar_cubo
+from atribuicao import JANELA_PADRAO_DIAS, atribuir_leads, custo_por_anuncio, taxa_atribuicao
+from instrumentacao import Coletor, ativar, desativar, coletor_ativo, medir
 import data_processing as dp
 
+# Copy-on-write: os datasets, o cubo e os índices são compartilhados entre as
+# sessões (st.cache_resource); filtros e cópias derivadas não duplicam colunas
+# e uma alteração numa cópia nunca chega ao objeto compartilhado
+pd.set_option('mode.copy_on_write', True)
+
 # Configuração inicial
 st.set_page_config(
     layout="wide",
     page_title="Dashboard de Campanhas Meta Ads"
 )
 
-# Carregamento dos dados
-df_ads = carregar_dados("data/tratados/metaads_data.csv")
-df_crm = carregar_dados("data/tratados/crm_sales_data.csv")
+# Pontos por série nos gráficos de linha (séries mais longas são reduzidas no servidor)
+PONTOS_GRAFICO_LINHA = 1000
 
-# Tratamento de datas
-df_ads, df_crm = dp.tratar_datas_crm_ads(df_ads, df_crm)
+# Painel de desempenho (opcional, ligado na sidebar): mede carga, consultas,
+# funções de data_processing/graficos e abas de cada rerun desta sessão.
+# Com DASHBOARD_DESEMPENHO_JSONL definido, cada rerun também é gravado nesse arquivo.
+coletor = None
+if st.session_state.get('painel_desempenho', False):
+    if 'coletor_desempenho' not in st.session_state:
+        st.session_state['coletor_desempenho'] = Coletor(arquivo_jsonl=os.environ.get('DASHBOARD_DESEMPENHO_JSONL'))
+    coletor = st.session_state['coletor_desempenho']
+ativar(coletor, aba=st.session_state.get('aba'))
 
 # Layout - Logo na sidebar
-image = Image.open("img/logo.png")
-st.sidebar.image(image, width=150)
+st.sidebar.image("img/logo.png", width=150)
+
+# Lojas com dados tratados: cada uma é carregada quando escolhida e
+# descartada da memória (LRU) quando o orçamento de memória estoura. A lista
+# é lida uma vez por rerun (o gerenciador relista as pastas periodicamente)
+gerenciador = obter_gerenciador_lojas(COLUNAS_ADS, COLUNAS_CRM)
+lojas_disponiveis = gerenciador.lojas
+if not lojas_disponiveis:
+    st.error("Nenhuma loja com dados tratados encontrada (rode scripts/preprocessamento.py).")
+    st.stop()
+if len(lojas_disponiveis) > 1:
+    loja = st.sidebar.selectbox("Loja:", list(lojas_disponiveis), key='loja')
+else:
+    loja = next(iter(lojas_disponiveis))
+pasta_loja = lojas_disponiveis[loja]
+
+
+def carregar_loja():
+    """Dataset da loja escolhida (montado na primeira sessão que pede a loja, depois vem da memória)"""
+    with medir('carregar_loja', 'carga') as registro:
+        cargas = gerenciador.cargas
+        with st.spinner(f"Carregando os dados de {loja}..."):
+            dados = gerenciador.obter(loja)
+        registro['cache'] = 'falha' if gerenciador.cargas > cargas else 'acerto'
+    return dados
+
+
+# Domínios dos filtros e período dos dados: do metadados.json gravado pelo
+# pré-processamento, então a sidebar aparece antes da carga da loja. Sem o
+# arquivo, vêm do dataset (calculados uma vez por carga, não por sessão).
+dados_loja = None
+metadados = obter_metadados(pasta_loja)
+if metadados is None:
+    dados_loja = carregar_loja()
+    metadados = dados_loja['metadados']
+dominios = metadados['dominios']
 
 # ========================================== FILTROS ============================================================================
 
@@ -31,61 +81,150 @@ st.sidebar.image(image, width=150)
 st.sidebar.header("Filtros")
 
 # Filtro de campanha
-campanhas = df_ads['campanha'].dropna().unique()
-campanhas1 = df_crm['campanha_origem'].dropna().unique()
+campanhas = dominios['campanha']
+campanhas1 = dominios['campanha_origem']
 campanha_sel = st.sidebar.multiselect("Campanha:", campanhas, default=campanhas)
 
 # Filtro de canal de origem
-canais = df_crm['canal_origem'].dropna().unique()
+canais = dominios['canal_origem']
 canal_sel = st.sidebar.multiselect("Canal de Origem:", canais, default=canais)
 
 # Filtro por gênero
-generos = df_ads['sexo'].dropna().unique()
+generos = dominios['sexo']
 genero_sel = st.sidebar.multiselect("Gênero:", generos, default=generos)
 
 # Filtro por faixa etária
-idades = df_ads['idade'].dropna().unique()
+idades = dominios['idade']
 idade_sel = st.sidebar.multiselect("Conjunto de Anúncio:", idades, default=idades)
 
 # Período - usa datas do Meta Ads e do CRM
-min_data, max_data = dp.obter_limites_datas(df_ads, df_crm)
+min_data, max_data = pd.to_datetime(metadados['datas'])
 data_sel = st.sidebar.date_input("Período", value=(min_data, max_data))
 start_date, end_date = pd.to_datetime(data_sel[0]), pd.to_datetime(data_sel[1])
 
+# Grão dos gráficos ao longo do tempo
+granularidade = st.sidebar.radio("Granularidade", list(GRANULARIDADES), format_func=GRANULARIDADES.get,
+                                  horizontal=True)
+
+# Carregamento dos dados
+# (já tipados e validados pelos esquemas: datas, categorias e numéricos reduzidos)
+if dados_loja is None:
+    dados_loja = carregar_loja()
+
+# Versão dos arquivos no disco: muda a chave de todos os caches quando os dados são atualizados
+versao_ads, versao_crm = dados_loja.versao
+
+# Cópia rasa: colunas alteradas nesta sessão não chegam ao CRM compartilhado
+df_crm = dados_loja['df_crm'].copy(deep=False)
+# Cubo de métricas do Meta Ads (data x campanha x sexo x idade x anuncio)
+cubo_ads = dados_loja['cubo_ads']
+# Índices de filtro (ordenados por data + bitmaps por valor)
+indice_ads = dados_loja['indice_ads']
+indice_crm = dados_loja['indice_crm']
+# Rollups do cubo por dia, semana e mês (gráficos ao longo do tempo)
+indices_periodo = dados_loja['indices_periodo']
+# Leads/vendas distintos por célula do CRM (data x campanha x canal)
+contagem_crm = dados_loja['contagem_crm']
+# Coortes de leads (semana de captura x campanha x canal): funil e tempo até a compra
+coortes_leads = dados_loja['coortes_crm']
+
+# Cache das agregações: cada uma é recalculada só quando o estado que a afeta muda
+consultas = obter_cache_consultas()
+
+
+# Atribuição devolve uma linha por lead filtrado: refazer custa menos que ler do disco
+SO_MEMORIA = {atribuir_leads}
+
+
+def memo(funcao, estado, *args, **kwargs):
+    """
+    Executa funcao(*args, **kwargs) memoizada pelo estado (filtros/parâmetros) e pela versão dos dados.
+
+    Agregações também vão para o cache em disco (sobrevivem a reinícios); a atribuição fica só na memória.
+    """
+    with medir(funcao.__name__, 'consulta') as registro:
+        falhas, acertos_disco = consultas.falhas, consultas.acertos_disco
+        resultado = consultas.memoizar(funcao, (versao_ads, versao_crm), estado, *args,
+                                       persistir=funcao not in SO_MEMORIA, particao=loja, **kwargs)
+        if consultas.falhas > falhas:
+            registro['cache'] = 'falha'
+        else:
+            registro['cache'] = 'disco' if consultas.acertos_disco > acertos_disco else 'acerto'
+    return resultado
+
+
+# ========================================== FILTRAGEM ============================================================================
+
 # Métricas e campanhas auxiliares
 metricas_disponiveis = ['impressoes', 'cliques', 'conversões', 'gasto_total', 'ctr (%)', 'cpc (R$)', 'cpa (R$)', 'taxa_conversao (%)']
 campanha_origem = ['']  # ainda não usado aqui
 
-# Filtragem dos DataFrames
-metaads_filtrado = dp.filtrar_metaads(df_ads, start_date, end_date, campanha_sel, genero_sel, idade_sel)
-crm_filtrado = dp.filtrar_crm(df_crm, start_date, end_date, canal_sel, campanhas1)
+# Estado normalizado dos filtros (chave do cache de cada agregação)
+filtros_ads = estado_filtros(start_date, end_date, campanhas=campanha_sel, generos=genero_sel, idades=idade_sel)
+filtros_crm = estado_filtros(start_date, end_date, canais=canal_sel, campanhas_origem=campanhas1)
 
+# Filtragem dos DataFrames: fatias pelo índice a cada rerun, fora do cache
+# (custam uma busca binária; guardá-las ocuparia a memória de um dataset por estado)
+cubo_filtrado = dp.filtrar_metaads(cubo_ads, start_date, end_date, campanha_sel, genero_sel, idade_sel, indice=indice_ads)
+crm_filtrado = dp.filtrar_crm(df_crm, start_date, end_date, canal_sel, campanhas1, indice=indice_crm)
 
-# ========================================== INDICADORES ============================================================================
-# Cálculo de dias e indicadores principais
-dias = (end_date - start_date).days + 1
-ctr_medio, cpc_medio, cpa_medio = dp.calcular_metricas_media(metaads_filtrado)
-taxa_conversao = dp.calcular_taxa_conversao_geral(df_ads)
 
-# Agrupamentos
-metaads_diario = dp.agrupar_metaads_por_dia(metaads_filtrado)
-metaads_campanha = dp.agrupar_metaads_por_campanha(metaads_filtrado)
+def distintos_crm():
+    """Leads, vendas e compradores distintos nos filtros do CRM (união das células, sem varrer as linhas)"""
+    return memo(dp.contar_distintos_crm, filtros_crm,
+                crm_filtrado, start_date, end_date, canal_sel, campanhas1, contagem=contagem_crm)
 
-# Cálculo diário
-gasto_dia, cliques_dia, impressoes_dia, leads_dia, compras_dia = dp.calcular_metricas_diarias(metaads_filtrado, crm_filtrado, dias)
 
-# Métricas adicionais por dia
-metaads_diario = dp.calcular_metricas_diarias_metaads(metaads_diario)
+def coortes_crm(campanhas=None, por_semana=False):
+    """Somas das coortes de leads nos filtros do CRM (campanhas: seleção da aba; padrão, todas)"""
+    campanhas = campanhas1 if campanhas is None else campanhas
+    return memo(dp.agregar_coortes, (filtros_crm, normalizar_selecao(campanhas), por_semana),
+                coortes_leads, start_date, end_date, canal_sel, campanhas, por_semana=por_semana)
 
 
+def cubo_no_periodo():
+    """Cubo filtrado no grão selecionado (semana/mês vêm dos rollups; o diário é o próprio cubo_filtrado)"""
+    if granularidade == 'dia':
+        return cubo_filtrado
+    return dp.filtrar_metaads_granularidade(
+        indices_periodo, granularidade, start_date, end_date, campanha_sel, genero_sel, idade_sel)
+
 
 # ========================================== ABAS DO DASHBOARD ============================================================================
-# Tabs
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(['📊 Visão Geral' , '🏷️ Campanhas', '👥 Públicos', '📝 Funil de Vendas', '📢 Canais de Venda', '📋 Insights'])
+# Cada aba é uma função: só a aba selecionada é calculada e desenhada, e cada
+# uma roda como fragmento (widgets dentro da aba reexecutam só a própria aba).
+fragmento = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', lambda funcao: funcao)
+
+
+def aba(funcao):
+    """Aba do dashboard: roda como fragmento e é medida no painel de desempenho"""
+    @fragmento
+    @wraps(funcao)
+    def executar():
+        # Rerun só do fragmento: o script principal não ativou a coleta
+        isolado = coletor is not None and coletor_ativo() is None
+        if isolado:
+            ativar(coletor, 'fragmento', aba=funcao.__name__)
+        with medir(funcao.__name__, 'aba'):
+            funcao()
+        if isolado:
+            desativar()
+    return executar
 
 
 # --- ABA 1: VISÃO GERAL ---
-with tab1:
+@aba
+def aba_visao_geral():
+    # Cálculo de dias e indicadores principais
+    dias = (end_date - start_date).days + 1
+    ctr_medio, cpc_medio, cpa_medio = memo(dp.calcular_metricas_media, filtros_ads, cubo_filtrado)
+    taxa_conversao = memo(dp.calcular_taxa_conversao_geral, None, cubo_ads)
+
+    # Cálculo diário
+    gasto_dia, cliques_dia, impressoes_dia, leads_dia, compras_dia = memo(
+        dp.calcular_metricas_diarias, (filtros_ads, filtros_crm), cubo_filtrado, crm_filtrado, dias,
+        distintos=distintos_crm())
+
     with st.container():
         st.markdown("### 📌 Principais Indicadores")
 
@@ -111,34 +250,35 @@ with tab1:
 
         with col1:
             st.markdown("#### CTR")
-            st.dataframe(dp.gerar_ranking_campanhas(df_ads, 'ctr (%)', maior_valor=True))
+            st.dataframe(memo(dp.gerar_ranking_campanhas, ('ctr (%)', True), cubo_ads, 'ctr (%)', maior_valor=True))
 
         with col2:
             st.markdown("#### CPC")
-            st.dataframe(dp.gerar_ranking_campanhas(df_ads, 'cpc (R$)', maior_valor=False))
+            st.dataframe(memo(dp.gerar_ranking_campanhas, ('cpc (R$)', False), cubo_ads, 'cpc (R$)', maior_valor=False))
 
         with col3:
             st.markdown("#### CPA")
-            st.dataframe(dp.gerar_ranking_campanhas(df_ads, 'cpa (R$)', maior_valor=False))
+            st.dataframe(memo(dp.gerar_ranking_campanhas, ('cpa (R$)', False), cubo_ads, 'cpa (R$)', maior_valor=False))
 
         with col4:
             st.markdown("#### Taxa Conversão")
-            st.dataframe(dp.gerar_ranking_campanhas(df_ads, 'taxa_conversao (%)', maior_valor=True))
+            st.dataframe(memo(dp.gerar_ranking_campanhas, ('taxa_conversao (%)', True), cubo_ads, 'taxa_conversao (%)', maior_valor=True))
 
 
 
 # --- ABA 2: VISÃO CAMPANHA ---
-with tab2:
+@aba
+def aba_campanhas():
+    metaads_campanha = memo(dp.agrupar_metaads_por_campanha, filtros_ads, cubo_filtrado)
+
     with st.container():
         st.markdown("#### Média Métrica por Campanha")
 
         metrical_sel = st.selectbox('Selecione a Métrica', metricas_disponiveis, key='metricas_barras')
 
-        # Usa a função refatorada que já trata taxa de conversão e outras métricas
-        df_agrupado = dp.gerar_ranking_campanhas(metaads_filtrado, metrical_sel)
-
-        # Corrige a vírgula para ponto (float) para plotagem
-        df_agrupado[metrical_sel] = df_agrupado[metrical_sel].apply(lambda x: float(x.replace(',', '.')))
+        # Ranking sem formatação de texto: valores numéricos direto para o gráfico
+        df_agrupado = memo(dp.gerar_ranking_campanhas, (filtros_ads, metrical_sel, 'grafico'),
+                           cubo_filtrado, metrical_sel, formatar=False)
 
         fig = grafico_barras(df_agrupado, eixo_x='campanha', eixo_y=metrical_sel, text_auto=True)
         st.plotly_chart(fig, use_container_width=True)
@@ -151,18 +291,11 @@ with tab2:
 
         metrical_sel = st.selectbox('Selecione a Métrica', metricas_disponiveis, key='metricas_linha')
 
-        if metrical_sel == 'taxa_conversao (%)':
-            # Agrupa somando cliques e conversões por dia e campanha, e calcula a taxa
-            df_agrupado = metaads_filtrado.groupby(['data', 'campanha']).agg({
-                'cliques': 'sum',
-                'conversões': 'sum'
-            }).reset_index()
-            df_agrupado[metrical_sel] = (df_agrupado['conversões'] / df_agrupado['cliques'] * 100).round(2)
-        else:
-            df_agrupado = metaads_filtrado.groupby(['data', 'campanha'])[[metrical_sel]].mean().reset_index()
-            df_agrupado[metrical_sel] = df_agrupado[metrical_sel].round(2)
+        df_agrupado = memo(dp.calcular_metricas, (filtros_ads, granularidade, 'data_campanha', metrical_sel),
+                           cubo_no_periodo(), ['data', 'campanha'], [metrical_sel])
 
-        fig = grafico_linha(df_agrupado, eixo_x='data', eixo_y=metrical_sel, hue='campanha')
+        fig = grafico_linha(df_agrupado, eixo_x='data', eixo_y=metrical_sel, hue='campanha',
+                           max_pontos=PONTOS_GRAFICO_LINHA)
         st.plotly_chart(fig, use_container_width=True)
 
 
@@ -171,15 +304,7 @@ with tab2:
         col1, spacer, col2 = st.columns([3, 0.5, 3])
         
         # Agrupamento dos dados de CRM
-        df_agrupado = crm_filtrado.groupby(['campanha_origem']).agg({
-            'lead_id': 'count',
-            'status': lambda x: (x == 'Ganhou').sum(),
-            'sale_id': 'count',
-            'valor_total': 'sum'
-        }).reset_index()
-
-        df_agrupado.columns = ['campanha_origem', 'leads', 'vendas_leads', 'vendas', 'receita_total']
-        df_agrupado['taxa_conversao (%)'] = np.round((df_agrupado['vendas'] / df_agrupado['leads']) * 100, 2)
+        df_agrupado = memo(dp.agrupar_crm_por_campanha, filtros_crm, crm_filtrado)
 
         with col1:
             st.markdown("#### Vendas por Campanha")
@@ -201,7 +326,7 @@ with tab2:
 
         with col1:
             st.markdown("#### Gasto Total por Campanha")
-            gasto_df = metaads_filtrado.groupby('campanha')['gasto_total'].sum().reset_index()
+            gasto_df = metaads_campanha[['campanha', 'gasto_total']].copy()
             gasto_df['gasto_total'] = gasto_df['gasto_total'].round(2)
             gasto_df = gasto_df.sort_values('gasto_total', ascending=False)
             fig = grafico_barras(gasto_df, eixo_x='campanha', eixo_y='gasto_total', text_auto=True)
@@ -209,20 +334,30 @@ with tab2:
 
         with col2:
             st.markdown("#### Total Dias por Campanha")
-            # Métricas agrupadas por campanha e publico
-            campanha = metaads_filtrado.groupby('campanha').agg({
-                'impressoes': 'sum',
-                'cliques': 'sum',
-                'gasto_total': 'sum',                       
-                'conversões': 'sum',                               
-                'anuncio': 'count'
-            }).reset_index().rename(columns={'anuncio': 'dias_campanha'})
+            # Dias de campanha = linhas brutas somadas nas células do cubo
+            campanha = memo(agregar_cubo, (filtros_ads, 'campanha'), cubo_filtrado, ['campanha'])
+            campanha = campanha.rename(columns={'linhas': 'dias_campanha'})
             dias_df = campanha.sort_values('dias_campanha', ascending=False)
             fig = grafico_barras(dias_df, eixo_x='campanha', eixo_y='dias_campanha', text_auto=True)
             st.plotly_chart(fig, use_container_width=True)
 
+    with st.container():
+        st.markdown("#### Custo por Lead e por Venda por Anúncio")
+
+        # Cada lead vai para o anúncio clicado (ad_clicked) que rodou até N dias antes da captura
+        janela = st.slider('Janela de atribuição (dias)', 0, 30, JANELA_PADRAO_DIAS, key='janela_atribuicao')
+        atribuidos = memo(atribuir_leads, (filtros_ads, filtros_crm, janela), cubo_filtrado, crm_filtrado, janela)
+        custos = memo(custo_por_anuncio, (filtros_ads, filtros_crm, janela), cubo_filtrado, atribuidos)
+
+        st.caption(f"{taxa_atribuicao(atribuidos):.0%} dos leads do período atribuídos a um anúncio")
+        custo_sel = st.selectbox('Selecione o Custo', ['custo_por_lead (R$)', 'custo_por_venda (R$)'], key='custo_anuncio')
+        fig = grafico_barras(custos.dropna(subset=[custo_sel]), eixo_x='anuncio', eixo_y=custo_sel, hue='campanha',
+                             text_auto=True)
+        st.plotly_chart(fig, use_container_width=True)
+
 # --- ABA 3: VISÃO PÚBLICO ---
-with tab3:
+@aba
+def aba_publicos():
     with st.container():
         metrical_sel = st.selectbox('Selecione a Métrica', metricas_disponiveis, key='metricas_publico')
 
@@ -237,9 +372,9 @@ with tab3:
                 'Homens': '#007bff'     # azul
             }
 
-            df_agrupado_publico = metaads_filtrado.groupby(['sexo', 'idade'])[metrical_sel].mean().reset_index()
-            df_agrupado_publico[metrical_sel] = df_agrupado_publico[metrical_sel].round(2)
-            df_agrupado_publico.sort_values(by=metrical_sel, ascending=False, inplace=True)
+            df_agrupado_publico = memo(dp.calcular_metricas, (filtros_ads, 'sexo_idade', metrical_sel),
+                                       cubo_filtrado, ['sexo', 'idade'], [metrical_sel])
+            df_agrupado_publico = df_agrupado_publico.sort_values(by=metrical_sel, ascending=False)
 
             fig = grafico_barras(
                 df_agrupado_publico,
@@ -255,71 +390,76 @@ with tab3:
         with col2:
             st.markdown("#### Heatmap das métricas")
 
-            df_heat = metaads_filtrado.groupby(['sexo', 'idade'])[metrical_sel].mean().reset_index()
+            df_heat = df_agrupado_publico
 
-            fig = px.density_heatmap(
+            fig = grafico_heatmap(
                 df_heat,
-                x='idade',
-                y='sexo',
-                z=metrical_sel,
+                eixo_x='idade',
+                eixo_y='sexo',
+                valor=metrical_sel,
                 color_continuous_scale='Viridis'
             )
             st.plotly_chart(fig, use_container_width=True)
 
     # Linha com média das métricas por dia e sexo
     with st.container():
-        st.markdown("#### Média das métricas por dia")
-        df_agrupado_dia = metaads_filtrado.groupby(['data', 'sexo'])[[metrical_sel]].mean().reset_index()
-        df_agrupado_dia[metrical_sel] = df_agrupado_dia[metrical_sel].round(2)
+        st.markdown(f"#### Média das métricas por {GRANULARIDADES[granularidade].lower()}")
+        df_agrupado_dia = memo(dp.calcular_metricas, (filtros_ads, granularidade, 'data_sexo', metrical_sel),
+                               cubo_no_periodo(), ['data', 'sexo'], [metrical_sel])
 
         fig = grafico_linha(
             df_agrupado_dia,
             eixo_x='data',
             eixo_y=metrical_sel,
             hue='sexo',
+            max_pontos=PONTOS_GRAFICO_LINHA,
             color_discrete_map=color_map
         )
         st.plotly_chart(fig, use_container_width=True)
 
     # Linha com métrica normalizada por dia e sexo
     with st.container():
-        st.markdown("#### Métrica Normalizada por dia")
-        df_temp = metaads_filtrado.groupby(['data', 'sexo'])[[metrical_sel]].sum().reset_index()
-
-        df_norm = df_temp.groupby('data').apply(
-            lambda x: x.assign(
-                **{metrical_sel: x[metrical_sel] / x[metrical_sel].sum() if x[metrical_sel].sum() > 0 else 0}
-            )
-        ).reset_index(drop=True)
+        st.markdown(f"#### Métrica Normalizada por {GRANULARIDADES[granularidade].lower()}")
+        # Soma (medidas aditivas) ou razão das somas (CTR, CPC...) por período e sexo, dividida pelo total do período
+        df_norm = memo(dp.calcular_metrica_normalizada, (filtros_ads, granularidade, metrical_sel),
+                       cubo_no_periodo(), ['data', 'sexo'], metrical_sel)
 
         fig = grafico_linha(
             df_norm,
             eixo_x='data',
             eixo_y=metrical_sel,
             hue='sexo',
+            max_pontos=PONTOS_GRAFICO_LINHA,
             color_discrete_map=color_map
         )
         st.plotly_chart(fig, use_container_width=True)
 
 
 # --- ABA 4: VISÃO FUNIL VENDAS ---
-with tab4:
+@aba
+def aba_funil_vendas():
+    totais = coortes_crm()
+
     with st.container():
-        col1, col2 = st.columns(2)
+        col1, col2, col3, col4 = st.columns(4)
 
         # Métrica: Tempo médio até a compra
         with col1:
-            tempo_medio_compra = np.round(df_crm['dias_para_conversao'].mean(), 0)
-            st.metric("Tempo até a compra", f"{tempo_medio_compra:.0f} dias")
+            tempo_medio_compra = memo(dp.calcular_tempo_medio_compra, filtros_crm, crm_filtrado, totais=totais)
+            st.metric("Tempo até a compra", "-" if pd.isna(tempo_medio_compra) else f"{tempo_medio_compra:.0f} dias")
 
         # Métrica: Taxa de conversão
         with col2:
-            total_leads = crm_filtrado['lead_id'].nunique()
-            leads_compraram = crm_filtrado[crm_filtrado['sale_id'].notnull()]['lead_id'].nunique()
-
-            taxa_conversao = leads_compraram / total_leads if total_leads > 0 else 0
+            taxa_conversao = memo(dp.calcular_taxa_conversao_leads, filtros_crm, crm_filtrado, distintos=distintos_crm())
             st.metric("Taxa de Conversão (Compra/Lead)", f"{taxa_conversao:.2%}")
 
+        # Métricas: mediana e percentil 90 do tempo até a compra (histograma das coortes)
+        mediana_compra, p90_compra = memo(dp.calcular_percentis_compra, filtros_crm, totais)
+        with col3:
+            st.metric("Mediana até a compra", "-" if pd.isna(mediana_compra) else f"{mediana_compra:.0f} dias")
+        with col4:
+            st.metric("90% compram em até", "-" if pd.isna(p90_compra) else f"{p90_compra:.0f} dias")
+
     with st.container():
         st.markdown("### Funil de Vendas")
 
@@ -331,14 +471,51 @@ with tab4:
             key='funil_vendas'
         )
 
-        crm_filtrado_funil = crm_filtrado[crm_filtrado['campanha_origem'].isin(campanhas_selecionadas)]
+        selecao = normalizar_selecao(campanhas_selecionadas)
+        etapas = memo(dp.contar_etapas_funil, (filtros_crm, selecao), coortes_crm(campanhas_selecionadas))
 
-        fig = grafico_funil(crm_filtrado_funil, coluna_etapa='etapa_funil', titulo='Funil Leads')
+        fig = grafico_funil(etapas, coluna_etapa='etapa_funil', titulo='Funil Leads', coluna_quantidade='quantidade')
         st.plotly_chart(fig, use_container_width=True)
 
+    # Coortes por semana de captura, nas campanhas selecionadas acima
+    with st.container():
+        st.markdown("### Coortes de Leads (semana de captura)")
+        por_semana = coortes_crm(campanhas_selecionadas, por_semana=True)
+
+        col1, col2 = st.columns(2)
+
+        # Conversão acumulada de cada coorte pelos dias desde a captura
+        with col1:
+            curvas = memo(dp.calcular_curvas_conversao, (filtros_crm, selecao), por_semana)
+            fig = grafico_linha(
+                curvas,
+                eixo_x='dias',
+                eixo_y='convertidos (%)',
+                hue='semana',
+                titulo='Conversão acumulada por dias desde a captura'
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+        # Evolução das coortes ao longo das semanas
+        with col2:
+            metrica_coorte = st.selectbox(
+                'Métrica da coorte',
+                ['taxa_conversao (%)', 'mediana_dias', 'leads'],
+                key='metrica_coorte'
+            )
+            metricas_coortes = memo(dp.calcular_metricas_coortes, (filtros_crm, selecao), por_semana)
+            fig = grafico_linha(
+                metricas_coortes,
+                eixo_x='semana',
+                eixo_y=metrica_coorte,
+                titulo='Coortes por semana de captura'
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
 
 # --- ABA 5: VISÃO CANAL VENDAS ---
-with tab5:
+@aba
+def aba_canais_venda():
     with st.container():
         # Seleção de métrica
         metrica_selecionada = st.selectbox(
@@ -347,23 +524,17 @@ with tab5:
             key='metricas_canal_origem'
         )
 
-        # Merge de metaads e CRM
-        df_merge_canais = pd.merge(
-            metaads_filtrado,
-            crm_filtrado,
-            left_on='campanha',
-            right_on='campanha_origem',
-            how='inner'
+        modo_canal = st.radio(
+            'Ponderação',
+            ['compativel', 'ponderado'],
+            format_func={'compativel': 'Média por linha de anúncio', 'ponderado': 'Ponderada pelos leads do canal'}.get,
+            horizontal=True,
+            key='modo_canal_origem'
         )
 
-        # Agrupamento por canal e cálculo da métrica média
-        df_canais_metricas = (
-            df_merge_canais.groupby('canal_origem')[metrica_selecionada]
-            .mean()
-            .reset_index()
-            .sort_values(by=metrica_selecionada, ascending=False)
-        )
-        df_canais_metricas[metrica_selecionada] = df_canais_metricas[metrica_selecionada].round(2)
+        # Métrica por canal: ads e leads agregados por campanha antes do join
+        df_canais_metricas = memo(dp.calcular_metricas_canais, (filtros_ads, filtros_crm, metrica_selecionada, modo_canal),
+                                  cubo_filtrado, crm_filtrado, metrica_selecionada, modo=modo_canal)
 
         fig = grafico_barras(
             df_canais_metricas,
@@ -385,24 +556,12 @@ with tab5:
         col1, spacer, col2 = st.columns([3, 0.5, 3])
 
         # Agrupamento de vendas e leads por canal e campanha
-        df_canal_campanha = (
-            crm_filtrado.groupby(['canal_origem', 'campanha_origem'])
-            .agg(Vendas=('sale_id', 'count'), Leads=('lead_id', 'count'))
-            .reset_index()
-        )
-        df_canal_campanha['Taxa Conversão (%)'] = (
-            (df_canal_campanha['Vendas'] / df_canal_campanha['Leads']) * 100
-        ).round(2)
+        df_canal_campanha = memo(dp.agrupar_crm_por_canal_campanha, filtros_crm, crm_filtrado)
 
         with col1:
             st.markdown("#### Vendas por Canal")
-            df_vendas_canal = (
-                df_canal_campanha[df_canal_campanha['campanha_origem'].isin(campanhas_selecionadas)]
-                .groupby('canal_origem')
-                .agg(Vendas=('Vendas', 'sum'), Leads=('Leads', 'sum'))
-                .reset_index()
-                .sort_values(by='Vendas', ascending=False)
-            )
+            df_vendas_canal = memo(dp.agrupar_vendas_por_canal, (filtros_crm, normalizar_selecao(campanhas_selecionadas)),
+                                   df_canal_campanha, campanhas_selecionadas)
             fig = grafico_barras(
                 df_vendas_canal,
                 eixo_x='canal_origem',
@@ -424,13 +583,7 @@ with tab5:
 
     with st.container():
         st.markdown("#### Taxa de Conversão (Vendas/Leads)")
-        df_taxa_conversao = (
-            df_canal_campanha.groupby('canal_origem')
-            .agg({'Taxa Conversão (%)': 'mean'})
-            .reset_index()
-            .sort_values(by='Taxa Conversão (%)', ascending=False)
-        )
-        df_taxa_conversao['Taxa Conversão (%)'] = df_taxa_conversao['Taxa Conversão (%)'].round(2)
+        df_taxa_conversao = memo(dp.calcular_taxa_conversao_canais, filtros_crm, df_canal_campanha)
 
         fig = grafico_barras(
             df_taxa_conversao,
@@ -442,30 +595,98 @@ with tab5:
 
 
 # --- ABA 6: RECOMENDAÇÕES E INSIGHTS ---
-with tab6:
+@aba
+def aba_insights():
+    # Achados pré-calculados das tabelas-resumo da loja (todo o período, ver insights.py)
+    insights = obter_insights(pasta_loja)
+    achados = insights['achados']
+    # Alertas seguem os filtros da sidebar (mesmos valores exibidos na aba de funil)
+    taxa_conversao = memo(dp.calcular_taxa_conversao_leads, filtros_crm, crm_filtrado, distintos=distintos_crm())
+    tempo_medio_compra = memo(dp.calcular_tempo_medio_compra, filtros_crm, crm_filtrado, totais=coortes_crm())
+
     st.title("📊 Recomendações e Insights Estratégicos")
 
     with st.container():
         st.markdown("### 📌 Destaques de Desempenho")
-        st.success("Canal **Email** teve a maior taxa de conversão: **32,6%**.")
-        st.warning("Campanha **Acessórios** Possui um boa taxa de cliques, porém não gera vendas nem leads.")
-        st.info("Tempo médio até a compra: **5 dias**.")
+        destaques = [achado for achado in achados if achado['categoria'] != 'tendencia']
+        for achado in destaques:
+            getattr(st, achado['nivel'])(achado['texto'])
+        if not destaques:
+            st.info("Nenhum destaque encontrado nos dados da loja.")
 
     with st.container():
         st.markdown("### ✅ Recomendações de Ação")
-        # Lista de sugestões com markdown
-        st.markdown("- Rever campanha Acessórios para gerar leads.")
-        st.markdown("- Vamos investir em E-mails. Canal que possui maior taxa de conversão de leads para vendas.")
-        st.markdown("- Atrair mulheres tem um custo mais baixo, vamos anunciar segmentado para esse público")
+        for achado in achados:
+            if achado['recomendacao']:
+                st.markdown(f"- {achado['recomendacao']}")
+
+    with st.container():
+        st.markdown("### 📈 Mudanças de Tendência")
+        tendencias = [achado for achado in achados if achado['categoria'] == 'tendencia']
+        for achado in tendencias:
+            getattr(st, achado['nivel'])(achado['texto'])
+        if not tendencias:
+            st.info("Nenhuma mudança relevante de CTR ou de leads nos últimos dias.")
+
+    st.caption(f"Destaques, recomendações e tendências de todo o período, calculados em {insights['gerado_em']} "
+               "(atualizados a cada carga do pré-processamento).")
 
     with st.container():
-        st.markdown("### 🚨 Alertas e Oportunidades")
+        st.markdown("### 🚨 Alertas e Oportunidades (filtros atuais)")
         if taxa_conversao < 0.1:
             st.error("🚨 Taxa de conversão geral está abaixo de 10%. Reveja os filtros de qualificação de leads.")
         else:
             st.info("Taxa de conversão geral está dentro do Padrão.")
 
-        if tempo_medio_compra > 7:
+        if pd.isna(tempo_medio_compra):
+            st.info("Sem vendas nos filtros atuais para medir o tempo até a compra.")
+        elif tempo_medio_compra > 7:
             st.warning(f"⏱ Tempo médio até a compra está elevado ({tempo_medio_compra:.0f} dias). Considere lead perdido.")
         else:
             st.info("Tempo médio até a compra está normal")
+
+
+# Seletor de abas: só a aba escolhida é executada a cada rerun
+ABAS = {
+    '📊 Visão Geral': aba_visao_geral,
+    '🏷️ Campanhas': aba_campanhas,
+    '👥 Públicos': aba_publicos,
+    '📝 Funil de Vendas': aba_funil_vendas,
+    '📢 Canais de Venda': aba_canais_venda,
+    '📋 Insights': aba_insights,
+}
+aba_sel = st.radio('Aba', list(ABAS), horizontal=True, label_visibility='collapsed', key='aba')
+ABAS[aba_sel]()
+
+
+# ========================================== PAINEL DE DESEMPENHO ============================================================================
+st.sidebar.markdown("""___""")
+st.sidebar.checkbox("⏱️ Painel de desempenho", key='painel_desempenho',
+                    help="Mede tempo, linhas e memória de cada etapa deste rerun (ligar deixa o dashboard um pouco mais lento)")
+
+desativar()
+if coletor is not None:
+    with st.sidebar.expander("Desempenho do último rerun", expanded=True):
+        registros = coletor.ultima()
+        if not registros.empty:
+            total = registros.loc[registros['nivel'] == 0, 'tempo_ms'].sum()
+            st.caption(f"Total medido: {total:,.1f} ms".replace(",", "."))
+            registros['nome'] = registros['nivel'].map(lambda nivel: '· ' * nivel) + registros['nome']
+            colunas = [c for c in ['nome', 'secao', 'tempo_ms', 'linhas_entrada', 'linhas_saida', 'memoria_delta_mb', 'cache']
+                       if c in registros.columns]
+            st.dataframe(registros[colunas].round(2), hide_index=True, use_container_width=True)
+
+        estatisticas = consultas.estatisticas()
+        st.caption(f"Cache de consultas: {estatisticas['itens']} itens, {estatisticas['tamanho_mb']:.1f} de "
+                   f"{estatisticas['tamanho_max_mb']:.0f} MB, {estatisticas['taxa_acerto']:.0%} de acertos, "
+                   f"{estatisticas['despejos']} despejos")
+        if 'disco' in estatisticas:
+            disco = estatisticas['disco']
+            st.caption(f"Cache em disco: {disco['itens']} itens, {disco['tamanho_mb']:.1f} de "
+                       f"{disco['tamanho_max_mb']:.0f} MB, {estatisticas['acertos_disco']} acertos nesta execução do app")
+        lojas = gerenciador.estatisticas()
+        st.caption(f"Lojas na memória: {len(lojas['residentes'])} de {lojas['lojas']}, "
+                   f"{lojas['memoria_mb']:.0f} de {lojas['orcamento_mb']:.0f} MB, "
+                   f"{lojas['cargas']} cargas ({lojas['segundos_carga']:.1f}s), {lojas['despejos']} despejos")
+        st.download_button("Exportar JSONL", coletor.jsonl(), file_name="desempenho.jsonl",
+                           mime="application/x-ndjson")
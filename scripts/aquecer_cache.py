@@ -0,0 +1,81 @@
+"""
+Pré-aquece o cache de consultas em disco com o estado padrão dos filtros.
+
+Roda o dashboard sem navegador (streamlit.testing), passando por todas as
+abas de cada loja com os filtros padrão da sidebar; cada agregação calculada vai para a
+pasta do cache em disco (DASHBOARD_CACHE_DIR, padrão .cache/consultas). Os
+primeiros usuários depois de um deploy ou reinício já encontram os
+resultados prontos. As chaves levam o hash do código (ver
+cache.versao_codigo): depois de um deploy, o aquecimento calcula tudo de novo
+e os resultados do código anterior são apagados.
+
+Com --metricas, também passa por todas as opções de cada seletor de
+métrica das abas (mais lento, cobre mais estados).
+
+Uso (a partir da raiz do projeto, depois de atualizar data/tratados ou de um deploy):
+    python scripts/aquecer_cache.py
+    python scripts/aquecer_cache.py --metricas
+"""
+import argparse
+import os
+import time
+
+from streamlit.testing.v1 import AppTest
+
+CAMINHO_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+
+def _checar(app, etapa):
+    if app.exception:
+        raise RuntimeError(f"{etapa}: {app.exception[0].message}")
+
+
+def aquecer(metricas=False, tempo_limite=600):
+    """
+    Executa o dashboard em cada loja e aba (e, com metricas, em cada opção dos seletores).
+
+    Retorna:
+    - quantidade de execuções do script feitas
+    """
+    app = AppTest.from_file(CAMINHO_APP, default_timeout=tempo_limite)
+    app.run()
+    _checar(app, "carga inicial")
+    execucoes = 1
+
+    # O seletor de lojas só aparece com mais de uma loja
+    lojas = [s.options for s in app.sidebar.selectbox if s.key == 'loja']
+    for loja in (lojas[0] if lojas else [None]):
+        if loja is not None:
+            app.selectbox(key='loja').set_value(loja).run()
+            _checar(app, loja)
+            execucoes += 1
+
+        for aba in app.radio(key='aba').options:
+            app.radio(key='aba').set_value(aba).run()
+            _checar(app, f"{loja or ''} {aba}")
+            execucoes += 1
+            if not metricas:
+                continue
+
+            for seletor in [s.key for s in app.main.selectbox if s.key]:
+                padrao = app.selectbox(key=seletor).value
+                for opcao in app.selectbox(key=seletor).options:
+                    app.selectbox(key=seletor).set_value(opcao).run()
+                    _checar(app, f"{loja or ''} {aba} / {seletor} = {opcao}")
+                    execucoes += 1
+                app.selectbox(key=seletor).set_value(padrao)
+    return execucoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pré-aquece o cache de consultas em disco do dashboard.")
+    parser.add_argument('--metricas', action='store_true', help="passa também por todas as opções dos seletores")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    execucoes = aquecer(metricas=args.metricas)
+    print(f"Cache aquecido: {execucoes} execuções em {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+from cubo import agregar_cubo
+from data_processing import dividir
+from instrumentacao import instrumentar
+
+# ========================================== ATRIBUIÇÃO LEAD -> ANÚNCIO ==========================================
+# Cada lead do CRM é ligado ao anúncio de onde veio: mesma campanha
+# (campanha_origem = campanha), mesmo anúncio (ad_clicked = anuncio) e um dia
+# de veiculação dentro da janela [data_captura - janela, data_captura].
+#
+# Em vez de um merge cartesiano (leads x linhas de anúncio da campanha), o
+# Meta Ads é somado por (campanha, anuncio, data) e os dois lados, ordenados
+# pela data, passam por um merge_asof com uma chave inteira por anúncio: o
+# custo é ~linear e a saída tem no máximo uma linha por linha do CRM.
+
+JANELA_PADRAO_DIAS = 7
+
+
+def _codigos_anuncio(campanhas, anuncios, categorias_campanha, categorias_anuncio):
+    """Chave inteira de (campanha, anuncio) sobre categorias comuns aos dois datasets (-1 = sem chave)"""
+    cod_campanha = pd.Categorical(campanhas, categories=categorias_campanha).codes.astype(np.int64)
+    cod_anuncio = pd.Categorical(anuncios, categories=categorias_anuncio).codes.astype(np.int64)
+    chave = cod_campanha * len(categorias_anuncio) + cod_anuncio
+    chave[(cod_campanha < 0) | (cod_anuncio < 0)] = -1
+    return chave
+
+
+@instrumentar('atribuicao')
+def atribuir_leads(cubo, df_crm, janela_dias=JANELA_PADRAO_DIAS):
+    """
+    Liga cada linha do CRM ao dia de anúncio mais recente dentro da janela.
+
+    Parâmetros:
+    - cubo: cubo (ou linhas brutas) do Meta Ads; só os dias presentes nele
+      podem receber leads
+    - df_crm: CRM com campanha_origem, ad_clicked e data_captura
+    - janela_dias: quantos dias antes da captura o anúncio pode ter rodado
+
+    Retorna:
+    - o CRM ordenado por data_captura, com 'data_anuncio' (dia de veiculação
+      atribuído, NaT quando nenhum dia do anúncio cabe na janela)
+    """
+    dias = agregar_cubo(cubo, ['campanha', 'anuncio', 'data'])
+    dias = dias[dias['linhas'] > 0]
+
+    categorias_campanha = pd.Index(pd.unique(dias['campanha'].astype(str)))
+    categorias_anuncio = pd.Index(pd.unique(dias['anuncio'].astype(str)))
+
+    direita = pd.DataFrame({
+        'chave_anuncio': _codigos_anuncio(dias['campanha'].astype(str), dias['anuncio'].astype(str),
+                                          categorias_campanha, categorias_anuncio),
+        'data_anuncio': dias['data'].to_numpy(),
+    }).sort_values('data_anuncio', kind='stable')
+
+    leads = df_crm.assign(chave_anuncio=_codigos_anuncio(
+        df_crm['campanha_origem'].astype(object), df_crm['ad_clicked'].astype(object),
+        categorias_campanha, categorias_anuncio))
+    validos = leads['data_captura'].notna() & (leads['chave_anuncio'] >= 0)
+
+    atribuidos = pd.merge_asof(
+        leads[validos].sort_values('data_captura', kind='stable'),
+        direita,
+        left_on='data_captura',
+        right_on='data_anuncio',
+        by='chave_anuncio',
+        direction='backward',
+        tolerance=pd.Timedelta(days=janela_dias),
+    )
+    sem_chave = leads[~validos].assign(data_anuncio=pd.NaT)
+    return pd.concat([atribuidos, sem_chave], ignore_index=True).drop(columns='chave_anuncio')
+
+
+@instrumentar('atribuicao')
+def custo_por_anuncio(cubo, atribuidos):
+    """
+    Custo por lead e por venda de cada anúncio, com os leads atribuídos a ele.
+
+    Parâmetros:
+    - cubo: cubo do Meta Ads (gasto do período)
+    - atribuidos: saída de atribuir_leads
+
+    Retorna:
+    - DataFrame por campanha e anúncio com gasto_total, leads, vendas,
+      'custo_por_lead (R$)' e 'custo_por_venda (R$)' (NaN sem leads/vendas)
+    """
+    gasto = agregar_cubo(cubo, ['campanha', 'anuncio'])[['campanha', 'anuncio', 'gasto_total']]
+    gasto[['campanha', 'anuncio']] = gasto[['campanha', 'anuncio']].astype(str)
+
+    ligados = atribuidos[atribuidos['data_anuncio'].notna()]
+    chaves = [ligados['campanha_origem'].astype(str).rename('campanha'),
+              ligados['ad_clicked'].astype(str).rename('anuncio')]
+    contagem = ligados.groupby(chaves).agg(leads=('lead_id', 'nunique'), vendas=('sale_id', 'nunique'))
+
+    tabela = gasto.merge(contagem.reset_index(), on=['campanha', 'anuncio'], how='left')
+    tabela[['leads', 'vendas']] = tabela[['leads', 'vendas']].fillna(0).astype('int64')
+
+    tabela['custo_por_lead (R$)'] = np.round(dividir(tabela['gasto_total'], tabela['leads']), 2)
+    tabela['custo_por_venda (R$)'] = np.round(dividir(tabela['gasto_total'], tabela['vendas']), 2)
+    return tabela.sort_values(['campanha', 'anuncio'], ignore_index=True)
+
+
+def taxa_atribuicao(atribuidos):
+    """Fração dos leads (lead_id distintos) ligados a algum dia de anúncio"""
+    leads = atribuidos['lead_id'].nunique()
+    if not leads:
+        return 0.0
+    return atribuidos.loc[atribuidos['data_anuncio'].notna(), 'lead_id'].nunique() / leads
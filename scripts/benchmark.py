@@ -0,0 +1,397 @@
+"""
+Benchmark das funções de data_processing sobre dados sintéticos.
+
+Gera datasets reprodutíveis do Meta Ads e do CRM (mesmas campanhas, públicos,
+canais e proporções de notebooks/datasets.ipynb, mas vetorizados) em vários
+tamanhos, mede tempo e pico de memória de cada caso e grava o resultado em
+JSON. Com --baseline, compara as medianas com um resultado anterior e sai
+com código 1 se algum caso ficou mais lento que a tolerância.
+
+Cada tamanho roda com cardinalidade fixa (mais linhas nas mesmas células) e
+crescente (período, campanhas e anúncios crescem com o tamanho), já que os
+caminhos pré-agregados (cubo, rollups, coortes, contagens distintas)
+escalam com o número de células, não de linhas.
+
+Uso (a partir da raiz do projeto):
+    python scripts/benchmark.py --tamanhos 10k 1m --saida benchmark.json
+    python scripts/benchmark.py --tamanhos 10k 1m 10m --baseline benchmark.json
+    python scripts/benchmark.py --tamanhos 10k 1m --cardinalidade crescente
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import data_processing as dp
+from atribuicao import atribuir_leads, custo_por_anuncio
+from contagem_distinta import ContagemDistinta
+from coortes import CoortesLeads
+from cubo import GRANULARIDADES, construir_cubo_metaads, construir_rollup
+from esquema import ETAPAS_FUNIL, aplicar_esquema
+from indices import IndiceFiltro
+
+TAMANHOS = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# Leads do CRM por linha do Meta Ads (proporção dos dados reais: ~300 leads para 1000 linhas)
+PROPORCAO_CRM = 0.3
+
+# ========================================== DADOS SINTÉTICOS ==========================================
+# Listas e probabilidades de notebooks/datasets.ipynb
+
+CAMPANHAS = ['Camisetas Filmes', 'Camisetas Series', 'Blusas Inverno', 'Acessorios']
+P_CAMPANHAS = [0.4, 0.3, 0.2, 0.1]
+CONJUNTOS = ['Homens 18-24', 'Mulheres 18-24', 'Homens 24-30', 'Mulheres 24-30']
+P_CONJUNTOS = [0.4, 0.3, 0.15, 0.15]
+ANUNCIOS = ['Imagem 1', 'Video 1', 'Carrossel 1', 'Imagem 2', 'Video 2', 'Imagem 3', 'Video 3', 'Carrossel 2']
+CANAIS = ['Instagram', 'Facebook', 'Google', 'Tráfego Direto', 'Email']
+P_CANAIS = [0.3, 0.25, 0.25, 0.15, 0.05]
+P_ETAPAS = [0.4, 0.3, 0.2, 0.1]
+
+INICIO = pd.Timestamp('2025-01-01')
+DIAS = 120
+
+# ========================================== CARDINALIDADE ==========================================
+# Com cardinalidade 'fixa', todo tamanho usa o período e as listas acima e só
+# aumenta o número de linhas por célula. Com 'crescente', a partir de
+# LINHAS_REFERENCIA o período e o número de campanhas e anúncios crescem com o
+# tamanho (histórico mais longo, conta maior), e com eles o cubo, os rollups,
+# as coortes e as células das contagens distintas.
+
+CARDINALIDADES = ['fixa', 'crescente']
+LINHAS_REFERENCIA = 10_000
+DIAS_MAX = 3 * 365
+
+
+def dimensoes_sinteticas(n, cardinalidade='fixa'):
+    """
+    Período e listas de campanhas e anúncios dos dados de um tamanho (linhas do Meta Ads).
+
+    Na cardinalidade crescente, os dias crescem com a raiz do fator de
+    tamanho (até DIAS_MAX) e as campanhas e os anúncios com a raiz cúbica.
+    As campanhas novas dividem a probabilidade com as do notebook pela lei de
+    Zipf (poucas grandes, muitas pequenas).
+
+    Retorna:
+    - dict com dias, campanhas, p_campanhas e anuncios
+    """
+    fator = n / LINHAS_REFERENCIA
+    if cardinalidade == 'fixa' or fator <= 1:
+        return {'dias': DIAS, 'campanhas': CAMPANHAS, 'p_campanhas': P_CAMPANHAS, 'anuncios': ANUNCIOS}
+
+    def ampliar(valores, prefixo):
+        return valores + [f'{prefixo} {i}' for i in range(len(valores) + 1, int(len(valores) * fator ** (1 / 3)) + 1)]
+
+    campanhas = ampliar(CAMPANHAS, 'Campanha')
+    anuncios = ampliar(ANUNCIOS, 'Anuncio')
+    pesos = 1 / np.arange(1, len(campanhas) + 1)
+    return {
+        'dias': min(int(DIAS * fator ** 0.5), DIAS_MAX),
+        'campanhas': campanhas,
+        'p_campanhas': pesos / pesos.sum(),
+        'anuncios': anuncios,
+    }
+
+
+# ========================================== GERAÇÃO ==========================================
+
+def _categoria(rng, valores, n, p=None):
+    return pd.Categorical.from_codes(rng.choice(len(valores), size=n, p=p), categories=valores)
+
+
+def gerar_metaads(n, semente=42, dimensoes=None):
+    """
+    Gera n linhas do Meta Ads já no esquema do dashboard.
+
+    Campanhas e públicos seguem as proporções do notebook; as métricas são
+    sorteadas nas mesmas faixas (impressões 1000-20000, cliques até 10%...).
+    dimensoes (ver dimensoes_sinteticas) troca o período e as listas; o padrão
+    é a cardinalidade fixa.
+    """
+    dimensoes = dimensoes or dimensoes_sinteticas(n)
+    rng = np.random.default_rng(semente)
+    conjuntos = rng.choice(len(CONJUNTOS), size=n, p=P_CONJUNTOS)
+    impressoes = rng.integers(1000, 20001, size=n)
+    cliques = rng.integers(50, impressoes // 10 + 1)
+    gasto = np.round(rng.uniform(50, 1500, size=n), 2)
+    conversoes = rng.integers(0, cliques + 1)
+    receita = np.round(rng.uniform(0.5, 2.5, size=n) * conversoes * 50, 2)
+
+    df = pd.DataFrame({
+        'data': INICIO + pd.to_timedelta(rng.integers(0, dimensoes['dias'], size=n), unit='D'),
+        'campanha': _categoria(rng, dimensoes['campanhas'], n, dimensoes['p_campanhas']),
+        'conjunto_anuncio': pd.Categorical.from_codes(conjuntos, categories=CONJUNTOS),
+        'anuncio': _categoria(rng, dimensoes['anuncios'], n),
+        'sexo': pd.Categorical.from_codes(conjuntos % 2, categories=['Homens', 'Mulheres']),
+        'idade': pd.Categorical.from_codes(conjuntos // 2, categories=['18-24', '24-30']),
+        'impressoes': impressoes,
+        'cliques': cliques,
+        'conversões': conversoes,
+        'gasto_total': gasto,
+        'Receita': receita,
+        'ctr (%)': np.round(cliques / impressoes * 100, 2),
+        'cpc (R$)': np.round(gasto / cliques, 2),
+        'cpa (R$)': np.round(dp.dividir(gasto, conversoes, valor_vazio=0), 2),
+    })
+    return aplicar_esquema(df, 'ads')
+
+
+def gerar_crm(n, semente=42, dimensoes=None):
+    """
+    Gera n leads do CRM (mais as vendas repetidas) já no esquema do dashboard.
+
+    Canais e etapas seguem as proporções do notebook; quem chegou em
+    'Comprou' tem uma venda e 10% desses compradores têm uma segunda.
+    dimensoes deve ser a mesma do Meta Ads gerado junto.
+    """
+    dimensoes = dimensoes or dimensoes_sinteticas(n)
+    rng = np.random.default_rng(semente + 1)
+    etapas = rng.choice(len(ETAPAS_FUNIL), size=n, p=P_ETAPAS)
+    comprou = etapas == ETAPAS_FUNIL.index('Comprou')
+
+    # Comprou: 85% Ganhou; Visita: 70% Novo; Carrinho/Checkout: 60% Em negociação; o resto Perdido
+    sorteio = rng.random(n)
+    status = np.select(
+        [comprou, etapas == 0],
+        [np.where(sorteio < 0.85, 'Ganhou', 'Em negociação'), np.where(sorteio < 0.7, 'Novo', 'Perdido')],
+        np.where(sorteio < 0.6, 'Em negociação', 'Perdido'),
+    )
+
+    leads = pd.DataFrame({
+        'lead_id': np.char.add('lead_', np.arange(1, n + 1).astype(str)),
+        'data_captura': INICIO + pd.to_timedelta(rng.integers(0, dimensoes['dias'], size=n), unit='D'),
+        'campanha_origem': _categoria(rng, dimensoes['campanhas'], n, dimensoes['p_campanhas']),
+        'canal_origem': _categoria(rng, CANAIS, n, P_CANAIS),
+        'etapa_funil': pd.Categorical.from_codes(etapas, categories=ETAPAS_FUNIL),
+        'status': status,
+    })
+
+    # Uma linha por venda (10% dos compradores com duas); quem não comprou fica sem venda
+    compradores = np.flatnonzero(comprou)
+    repetidos = compradores[rng.random(compradores.size) < 0.1]
+    linhas = np.sort(np.concatenate([np.flatnonzero(~comprou), compradores, repetidos]))
+    df = leads.iloc[linhas].reset_index(drop=True)
+
+    tem_venda = comprou[linhas]
+    vendas = int(tem_venda.sum())
+    dias_compra = np.full(len(df), np.nan)
+    dias_compra[tem_venda] = rng.integers(1, 30, size=vendas)
+
+    df['sale_id'] = np.where(tem_venda, np.char.add('venda_', np.arange(len(df)).astype(str)), None)
+    df['valor_total'] = np.where(tem_venda, np.round(rng.uniform(50, 500, size=len(df)), 2), np.nan)
+    df['dias_para_conversao'] = dias_compra
+
+    # Anúncio clicado por lead (sorteado por último para não mudar os valores acima entre versões)
+    anuncios = rng.choice(len(dimensoes['anuncios']), size=n)
+    df['ad_clicked'] = pd.Categorical.from_codes(anuncios[linhas], categories=dimensoes['anuncios'])
+    return aplicar_esquema(df, 'crm')
+
+
+# ========================================== CASOS ==========================================
+# Cada caso recebe o contexto montado para um tamanho (dados, cubo, índices e
+# filtros com ~80% do período e ~3/4 das campanhas, alguns públicos) e chama
+# uma função pública de data_processing do jeito que o dashboard chama.
+
+def montar_contexto(n, semente=42, cardinalidade='fixa'):
+    """Dados sintéticos, cubo, índices, rollups, coortes e filtros usados pelos casos de um tamanho"""
+    dimensoes = dimensoes_sinteticas(n, cardinalidade)
+    ads = gerar_metaads(n, semente, dimensoes)
+    crm = gerar_crm(int(n * PROPORCAO_CRM), semente, dimensoes)
+    cubo = construir_cubo_metaads(ads)
+
+    dias = dimensoes['dias']
+    inicio = INICIO + pd.Timedelta(days=dias // 10)
+    fim = INICIO + pd.Timedelta(days=dias - dias // 10)
+    campanhas = dimensoes['campanhas'][:len(dimensoes['campanhas']) * 3 // 4]
+    indice_ads = IndiceFiltro(cubo, 'data', ['campanha', 'sexo', 'idade'])
+    indice_crm = IndiceFiltro(crm, 'data_captura', ['canal_origem', 'campanha_origem'])
+    return {
+        'dimensoes': dimensoes,
+        'ads': ads,
+        'crm': crm,
+        'cubo': cubo,
+        'indice_ads': indice_ads,
+        'indices_periodo': {
+            granularidade: indice_ads if granularidade == 'dia' else
+            IndiceFiltro(construir_rollup(cubo, granularidade), 'data', ['campanha', 'sexo', 'idade'])
+            for granularidade in GRANULARIDADES
+        },
+        'indice_crm': indice_crm,
+        'contagem_crm': ContagemDistinta(crm),
+        'coortes_crm': CoortesLeads(indice_crm),
+        'filtro_ads': (inicio, fim, campanhas, ['Homens', 'Mulheres'], ['18-24']),
+        'filtro_crm': (inicio, fim, CANAIS[:4], campanhas),
+    }
+
+
+CASOS = {
+    'construir_cubo_metaads': lambda c: construir_cubo_metaads(c['ads']),
+    'filtrar_metaads': lambda c: dp.filtrar_metaads(c['ads'], *c['filtro_ads']),
+    'filtrar_metaads[indice]': lambda c: dp.filtrar_metaads(c['cubo'], *c['filtro_ads'], indice=c['indice_ads']),
+    'filtrar_crm': lambda c: dp.filtrar_crm(c['crm'], *c['filtro_crm']),
+    'filtrar_crm[indice]': lambda c: dp.filtrar_crm(c['crm'], *c['filtro_crm'], indice=c['indice_crm']),
+    'filtrar_metaads_granularidade[semana]':
+        lambda c: dp.filtrar_metaads_granularidade(c['indices_periodo'], 'semana', *c['filtro_ads']),
+    'calcular_taxa_conversao_geral': lambda c: dp.calcular_taxa_conversao_geral(c['cubo']),
+    'agrupar_metaads_por_dia': lambda c: dp.agrupar_metaads_por_dia(c['cubo']),
+    'gerar_ranking_campanhas': lambda c: dp.gerar_ranking_campanhas(c['cubo'], 'ctr (%)'),
+    'calcular_metricas_canais': lambda c: dp.calcular_metricas_canais(c['cubo'], c['crm'], 'ctr (%)'),
+    'calcular_metricas_canais[ponderado]':
+        lambda c: dp.calcular_metricas_canais(c['cubo'], c['crm'], 'cliques', modo='ponderado'),
+    'contar_distintos_crm': lambda c: dp.contar_distintos_crm(dp.filtrar_crm(c['crm'], *c['filtro_crm']), *c['filtro_crm']),
+    'contar_distintos_crm[contagem]':
+        lambda c: dp.contar_distintos_crm(None, *c['filtro_crm'], contagem=c['contagem_crm']),
+    'agregar_coortes': lambda c: dp.agregar_coortes(c['coortes_crm'], *c['filtro_crm']),
+    'atribuir_leads': lambda c: custo_por_anuncio(c['cubo'], atribuir_leads(c['cubo'], c['crm'])),
+}
+
+
+# ========================================== MEDIÇÃO ==========================================
+
+def medir(funcao, contexto, repeticoes=5):
+    """
+    Mede um caso: tempos de várias execuções e o pico de memória de uma.
+
+    A memória é medida numa execução separada (tracemalloc atrasa o código),
+    como o maior volume alocado durante a chamada.
+
+    Retorna:
+    - dict com tempo mínimo, mediano e pico de memória (MB)
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(contexto)
+        tempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    try:
+        funcao(contexto)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'tempo_min_s': min(tempos),
+        'tempo_mediana_s': float(np.median(tempos)),
+        'memoria_pico_mb': pico / 2 ** 20,
+    }
+
+
+def executar(tamanhos, casos=None, repeticoes=5, semente=42, cardinalidades=('fixa',)):
+    """
+    Roda os casos em cada tamanho e cardinalidade.
+
+    Parâmetros:
+    - tamanhos: nomes em TAMANHOS (ex: ['10k', '1m'])
+    - casos: nomes em CASOS (None roda todos)
+    - repeticoes: execuções cronometradas por caso
+    - semente: semente dos dados sintéticos
+    - cardinalidades: nomes em CARDINALIDADES (ver dimensoes_sinteticas)
+
+    Retorna:
+    - dict pronto para JSON com o ambiente e uma entrada por caso x tamanho x cardinalidade
+    """
+    resultados = []
+    for cardinalidade in cardinalidades:
+        for tamanho in tamanhos:
+            inicio = time.perf_counter()
+            contexto = montar_contexto(TAMANHOS[tamanho], semente, cardinalidade)
+            dimensoes = contexto['dimensoes']
+            celulas = {'cubo': len(contexto['cubo']), 'coortes': len(contexto['coortes_crm'].indice.df),
+                       'celulas_crm': contexto['contagem_crm'].celulas}
+            print(f"[{tamanho}, {cardinalidade}] dados gerados em {time.perf_counter() - inicio:.1f}s "
+                  f"(ads: {len(contexto['ads'])}, crm: {len(contexto['crm'])}, {dimensoes['dias']} dias, "
+                  f"{len(dimensoes['campanhas'])} campanhas, {len(dimensoes['anuncios'])} anúncios; "
+                  f"cubo: {celulas['cubo']}, coortes: {celulas['coortes']}, células do CRM: {celulas['celulas_crm']})")
+
+            for nome in casos or CASOS:
+                medicao = medir(CASOS[nome], contexto, repeticoes)
+                resultados.append({'caso': nome, 'tamanho': tamanho, 'cardinalidade': cardinalidade,
+                                   'linhas': TAMANHOS[tamanho], **celulas, **medicao})
+                print(f"  {nome:<40} {medicao['tempo_mediana_s'] * 1000:>10.2f} ms "
+                      f"{medicao['memoria_pico_mb']:>10.1f} MB")
+
+    return {
+        'ambiente': {
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'maquina': platform.platform(),
+            'semente': semente,
+            'repeticoes': repeticoes,
+        },
+        'resultados': resultados,
+    }
+
+
+def comparar(atual, baseline, tolerancia=0.2):
+    """
+    Compara as medianas com a baseline.
+
+    Parâmetros:
+    - atual, baseline: saídas de executar (ou o JSON gravado)
+    - tolerancia: aumento relativo aceito (0.2 = até 20% mais lento)
+
+    Retorna:
+    - lista de regressões (caso, tamanho, cardinalidade, tempo da baseline, tempo atual, variação)
+    """
+    # Resultados gravados antes das cardinalidades são todos de cardinalidade fixa
+    def chave(r):
+        return r['caso'], r['tamanho'], r.get('cardinalidade', 'fixa')
+
+    anteriores = {chave(r): r for r in baseline['resultados']}
+    regressoes = []
+    for r in atual['resultados']:
+        anterior = anteriores.get(chave(r))
+        if anterior is None:
+            continue
+        variacao = r['tempo_mediana_s'] / anterior['tempo_mediana_s'] - 1
+        r['variacao_baseline'] = variacao
+        if variacao > tolerancia:
+            regressoes.append((*chave(r), anterior['tempo_mediana_s'], r['tempo_mediana_s'], variacao))
+    return regressoes
+
+
+# ========================================== LINHA DE COMANDO ==========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark das funções de data_processing com dados sintéticos.")
+    parser.add_argument('--tamanhos', nargs='+', default=['10k', '1m'], choices=list(TAMANHOS),
+                        help="tamanhos do Meta Ads (o CRM tem 30%% dessas linhas)")
+    parser.add_argument('--casos', nargs='+', choices=list(CASOS), help="casos a rodar (padrão: todos)")
+    parser.add_argument('--cardinalidade', nargs='+', default=CARDINALIDADES, choices=CARDINALIDADES,
+                        help="fixa (mesmas células, mais linhas) e/ou crescente (período, campanhas e anúncios "
+                             "crescem com o tamanho); padrão: as duas")
+    parser.add_argument('--repeticoes', type=int, default=5, help="execuções cronometradas por caso")
+    parser.add_argument('--semente', type=int, default=42, help="semente dos dados sintéticos")
+    parser.add_argument('--saida', help="arquivo JSON com os resultados")
+    parser.add_argument('--baseline', help="JSON de uma execução anterior para comparação")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="aumento relativo aceito antes de acusar regressão")
+    args = parser.parse_args(argv)
+
+    resultado = executar(args.tamanhos, args.casos, args.repeticoes, args.semente, args.cardinalidade)
+
+    regressoes = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as arquivo:
+            regressoes = comparar(resultado, json.load(arquivo), args.tolerancia)
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+    for caso, tamanho, cardinalidade, antes, depois, variacao in regressoes:
+        print(f"REGRESSÃO {caso} [{tamanho}, {cardinalidade}]: "
+              f"{antes * 1000:.2f} ms -> {depois * 1000:.2f} ms ({variacao:+.0%})")
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
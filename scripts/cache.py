@@ -0,0 +1,281 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from lojas import tamanho_em_memoria
+
+# ========================================== ESTADO DOS FILTROS ==========================================
+
+def normalizar_selecao(valores):
+    """Seleção de um multiselect como tupla ordenada (a ordem dos cliques não importa)"""
+    return tuple(sorted(str(v) for v in valores))
+
+
+def estado_filtros(inicio, fim, **selecoes):
+    """
+    Estado normalizado (hashable) dos filtros: período + seleções ordenadas.
+
+    A ordem em que os valores foram marcados no multiselect não muda a chave.
+    Ex: estado_filtros(inicio, fim, campanhas=[...], generos=[...])
+    """
+    periodo = ('periodo', pd.Timestamp(inicio).isoformat(), pd.Timestamp(fim).isoformat())
+    valores = tuple(
+        (nome, normalizar_selecao(selecao))
+        for nome, selecao in sorted(selecoes.items())
+    )
+    return (periodo,) + valores
+
+
+# ========================================== CACHE EM DISCO ==========================================
+
+def _hash(valor):
+    """Hash estável entre processos do repr de uma chave (tuplas de textos e números)"""
+    return hashlib.blake2b(repr(valor).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def versao_codigo(pasta):
+    """
+    Impressão digital do código: hash dos arquivos .py de uma pasta.
+
+    Muda a cada deploy que altere qualquer um deles (uma agregação, os
+    argumentos passados para um estado...), então resultados calculados por
+    outra versão do código não são reaproveitados.
+    """
+    impressao = hashlib.blake2b(digest_size=8)
+    for nome in sorted(os.listdir(pasta)):
+        if nome.endswith('.py'):
+            impressao.update(nome.encode('utf-8'))
+            with open(os.path.join(pasta, nome), 'rb') as arquivo:
+                impressao.update(arquivo.read())
+    return impressao.hexdigest()
+
+
+class CacheDisco:
+    """
+    Resultados de consultas gravados em disco, que sobrevivem a reinícios do app.
+
+    - Um arquivo pickle por chave, '<partição>-<versão>-<chave>.pkl'
+      (hashes); o arquivo guarda também o repr da chave, conferido na leitura.
+      A partição separa conjuntos de dados independentes (ex: uma loja).
+    - LRU pelo mtime dos arquivos (tocado a cada leitura): acima de
+      tamanho_max_mb, os menos usados são apagados.
+    - Quando a versão dos dados de uma partição muda, os arquivos das
+      versões anteriores dessa partição são apagados.
+    - Gravação atômica (arquivo temporário + os.replace): vários processos
+      podem usar a mesma pasta.
+    """
+
+    def __init__(self, pasta, tamanho_max_mb=256):
+        self.pasta = pasta
+        self.tamanho_max = int(tamanho_max_mb * 2 ** 20)
+        self._lock = threading.Lock()
+        self._versoes = {}
+        self.acertos = 0
+        self.gravacoes = 0
+        self.despejos = 0
+
+        os.makedirs(pasta, exist_ok=True)
+        # nome -> tamanho, do menos para o mais recentemente usado
+        arquivos = [a for a in os.scandir(pasta) if a.name.endswith('.pkl')]
+        arquivos.sort(key=lambda a: a.stat().st_mtime_ns)
+        self._itens = OrderedDict((a.name, a.stat().st_size) for a in arquivos)
+        self._tamanho = sum(self._itens.values())
+
+    def _apagar(self, nome):
+        """Apaga um arquivo do índice e do disco (chamado com o lock)"""
+        self._tamanho -= self._itens.pop(nome, 0)
+        try:
+            os.remove(os.path.join(self.pasta, nome))
+        except OSError:
+            pass
+
+    def _usar_versao(self, versao, particao=None):
+        """Apaga os arquivos de outras versões da partição na primeira consulta de uma versão nova"""
+        inicio_particao = _hash(particao) + '-'
+        prefixo = inicio_particao + _hash(versao) + '-'
+        if self._versoes.get(inicio_particao) != prefixo:
+            with self._lock:
+                for nome in [n for n in self._itens if n.startswith(inicio_particao) and not n.startswith(prefixo)]:
+                    self._apagar(nome)
+                    self.despejos += 1
+                self._versoes[inicio_particao] = prefixo
+        return prefixo
+
+    def obter(self, versao, chave, particao=None):
+        """
+        Valor gravado para a chave nesta versão dos dados.
+
+        Retorna:
+        - (True, valor) ou (False, None) se não houver (ou o arquivo estiver ilegível)
+        """
+        nome = self._usar_versao(versao, particao) + _hash(chave) + '.pkl'
+        caminho = os.path.join(self.pasta, nome)
+        with self._lock:
+            if nome not in self._itens:
+                return False, None
+
+        try:
+            with open(caminho, 'rb') as arquivo:
+                chave_gravada, valor = pickle.load(arquivo)
+            if chave_gravada != repr(chave):
+                return False, None
+            os.utime(caminho)
+        except Exception:
+            with self._lock:
+                self._apagar(nome)
+            return False, None
+
+        with self._lock:
+            if nome in self._itens:
+                self._itens.move_to_end(nome)
+            self.acertos += 1
+        return True, valor
+
+    def gravar(self, versao, chave, valor, particao=None):
+        """Grava o valor (se for serializável) e despeja os menos usados acima do limite"""
+        nome = self._usar_versao(versao, particao) + _hash(chave) + '.pkl'
+        try:
+            dados = pickle.dumps((repr(chave), valor), protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        if len(dados) > self.tamanho_max:
+            return
+
+        descritor, temporario = tempfile.mkstemp(dir=self.pasta, suffix='.tmp')
+        with os.fdopen(descritor, 'wb') as arquivo:
+            arquivo.write(dados)
+        os.replace(temporario, os.path.join(self.pasta, nome))
+
+        with self._lock:
+            self._tamanho += len(dados) - self._itens.pop(nome, 0)
+            self._itens[nome] = len(dados)
+            self.gravacoes += 1
+            while self._tamanho > self.tamanho_max and self._itens:
+                self._apagar(next(iter(self._itens)))
+                self.despejos += 1
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'itens': len(self._itens),
+                'tamanho_mb': self._tamanho / 2 ** 20,
+                'tamanho_max_mb': self.tamanho_max / 2 ** 20,
+                'acertos': self.acertos,
+                'gravacoes': self.gravacoes,
+                'despejos': self.despejos,
+            }
+
+
+# ========================================== CACHE DE CONSULTAS ==========================================
+
+class CacheConsultas:
+    """
+    Memoização das agregações do dashboard com despejo LRU por bytes.
+
+    O limite é a soma dos tamanhos dos resultados guardados (medidos com
+    lojas.tamanho_em_memoria), não o número de itens: um resultado do tamanho
+    de um dataset conta como tal. Resultados maiores que o limite são
+    devolvidos sem ficar na memória.
+
+    Cada resultado é guardado sob (função, versão do código, versão dos
+    dados, estado), em que o estado é a parte dos filtros/parâmetros que
+    realmente afeta a função. Os resultados são compartilhados: quem recebe
+    não deve alterá-los.
+
+    Com um CacheDisco, as falhas da memória são procuradas no disco antes de
+    calcular, e os resultados calculados também vão para o disco. Como a
+    versão do código faz parte da versão gravada, os arquivos de um código
+    anterior são apagados na primeira consulta após um deploy.
+    """
+
+    def __init__(self, tamanho_max_mb=128, disco=None, versao_codigo=None):
+        self.tamanho_max = int(tamanho_max_mb * 2 ** 20)
+        self.disco = disco
+        self.versao_codigo = versao_codigo
+        # chave -> (valor, bytes), do menos para o mais recentemente usado
+        self._itens = OrderedDict()
+        self._tamanho = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.acertos_disco = 0
+        self.falhas = 0
+        self.despejos = 0
+
+    def obter(self, chave, calcular, versao_disco=None, particao=None):
+        """
+        Retorna o valor da chave, calculando (e guardando) só se ainda não existir.
+
+        Com versao_disco (e um CacheDisco configurado), usa também o disco,
+        na partição informada.
+        """
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave][0]
+
+        usar_disco = self.disco is not None and versao_disco is not None
+        encontrado, valor = self.disco.obter(versao_disco, chave, particao) if usar_disco else (False, None)
+        if not encontrado:
+            valor = calcular()
+            if usar_disco:
+                self.disco.gravar(versao_disco, chave, valor, particao)
+
+        tamanho = tamanho_em_memoria(valor)
+        with self._lock:
+            if encontrado:
+                self.acertos_disco += 1
+            else:
+                self.falhas += 1
+            if chave in self._itens:
+                self._tamanho -= self._itens.pop(chave)[1]
+            if tamanho <= self.tamanho_max:
+                self._itens[chave] = (valor, tamanho)
+                self._tamanho += tamanho
+            while self._tamanho > self.tamanho_max:
+                self._tamanho -= self._itens.popitem(last=False)[1][1]
+                self.despejos += 1
+        return valor
+
+    def memoizar(self, funcao, versao, estado, *args, persistir=True, particao=None, **kwargs):
+        """
+        Executa funcao(*args, **kwargs) uma vez por (partição, versão dos dados, estado),
+        na versão do código do cache.
+
+        Os argumentos em si (DataFrames) não entram na chave: o estado deve
+        identificar tudo o que muda o resultado (filtros, métrica, modo...).
+        A partição separa conjuntos de dados independentes (ex: a loja).
+        Com persistir=False, o resultado fica só na memória.
+        """
+        chave = (funcao.__module__, funcao.__qualname__, self.versao_codigo, particao, versao, estado)
+        versao_disco = (self.versao_codigo, versao) if persistir else None
+        return self.obter(chave, lambda: funcao(*args, **kwargs), versao_disco=versao_disco, particao=particao)
+
+    def estatisticas(self):
+        """Contadores de acertos, falhas e despejos"""
+        with self._lock:
+            total = self.acertos + self.acertos_disco + self.falhas
+            estatisticas = {
+                'itens': len(self._itens),
+                'tamanho_mb': self._tamanho / 2 ** 20,
+                'tamanho_max_mb': self.tamanho_max / 2 ** 20,
+                'versao_codigo': self.versao_codigo,
+                'acertos': self.acertos,
+                'acertos_disco': self.acertos_disco,
+                'falhas': self.falhas,
+                'despejos': self.despejos,
+                'taxa_acerto': (self.acertos + self.acertos_disco) / total if total else 0.0,
+            }
+        if self.disco is not None:
+            estatisticas['disco'] = self.disco.estatisticas()
+        return estatisticas
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._tamanho = 0
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+from indices import IndiceFiltro
+
+# ========================================== CONTAGENS DISTINTAS DO CRM ==========================================
+# Leads, vendas e compradores distintos não somam entre linhas de um
+# agregado. Aqui o CRM vira células (data_captura x campanha_origem x
+# canal_origem) e cada célula guarda, para cada medida:
+#
+# - o conjunto exato dos IDs, como códigos inteiros (uint32) ordenados por
+#   célula (layout CSR: um vetor de códigos e os deslocamentos de cada célula);
+# - um sketch HyperLogLog (2^precisao registradores de 1 byte), montado só
+#   na primeira consulta que passa de limite_exato IDs.
+#
+# Qualquer combinação dos filtros da sidebar vira uma seleção de células: a
+# contagem exata une os conjuntos e a aproximada faz o máximo dos
+# registradores (erro relativo ~1.04/sqrt(2^precisao)). Os sketches custam
+# 2^precisao bytes por célula e medida, bem mais que os conjuntos exatos;
+# abaixo de limite_exato eles não existem.
+
+CELULAS_CRM = ['data_captura', 'campanha_origem', 'canal_origem']
+
+# Medida -> (coluna do ID, só linhas com venda)
+MEDIDAS_DISTINTAS = {
+    'leads': ('lead_id', False),
+    'vendas': ('sale_id', False),
+    'compradores': ('lead_id', True),
+}
+
+
+def _registros_hll(hashes, precisao):
+    """Registrador (bits mais altos do hash) e posição do primeiro bit 1 no restante de cada hash"""
+    bits_resto = 64 - precisao
+    registrador = (hashes >> np.uint64(bits_resto)).astype(np.int64)
+    resto = hashes & np.uint64((1 << bits_resto) - 1)
+    # bit_length(resto) pelo expoente do float (resto = 0 -> posição bits_resto + 1)
+    _, expoente = np.frexp(resto.astype(np.float64))
+    posicao = (bits_resto - expoente + 1).astype(np.uint8)
+    return registrador, posicao
+
+
+def estimar_hll(registradores):
+    """Estimativa HyperLogLog de um vetor de registradores (com a correção de linear counting)"""
+    m = registradores.size
+    alfa = 0.7213 / (1 + 1.079 / m)
+    estimativa = alfa * m * m / np.sum(np.ldexp(1.0, -registradores.astype(np.int64)))
+    zeros = int(np.count_nonzero(registradores == 0))
+    if estimativa <= 2.5 * m and zeros:
+        estimativa = m * np.log(m / zeros)
+    return float(estimativa)
+
+
+class ContagemDistinta:
+    """
+    Conjuntos exatos e sketches HyperLogLog de IDs do CRM por célula.
+
+    Montada uma vez por versão do CRM; as consultas recebem os mesmos filtros
+    de filtrar_crm e respondem sem voltar às linhas. Dos IDs, só o hash fica
+    guardado (8 bytes por ID distinto), para montar os sketches se preciso.
+    """
+
+    def __init__(self, df_crm, precisao=12, limite_exato=2_000_000):
+        self.precisao = precisao
+        self.limite_exato = limite_exato
+
+        df = df_crm[df_crm['data_captura'].notna()]
+        celula = df.groupby(CELULAS_CRM, observed=True, dropna=False, sort=False).ngroup().to_numpy()
+        _, primeiras = np.unique(celula, return_index=True)
+        chaves = df[CELULAS_CRM].iloc[primeiras].reset_index(drop=True)
+        chaves['celula'] = np.arange(len(chaves))
+        self.indice = IndiceFiltro(chaves, 'data_captura', ['campanha_origem', 'canal_origem'])
+        self.celulas = len(chaves)
+
+        self.codigos = {}
+        self.total_ids = {}
+        self.deslocamentos = {}
+        self.hashes = {}
+        self.sketches = {}
+        for medida, (coluna, so_vendas) in MEDIDAS_DISTINTAS.items():
+            linhas = df[coluna].notna().to_numpy()
+            if so_vendas:
+                linhas = linhas & df['sale_id'].notna().to_numpy()
+            codigos, ids = pd.factorize(df[coluna].to_numpy()[linhas])
+            # Pares (célula, ID) únicos, já ordenados por célula
+            pares = np.unique(celula[linhas].astype(np.int64) * max(len(ids), 1) + codigos)
+            celula_par, codigo_par = np.divmod(pares, max(len(ids), 1))
+
+            self.codigos[medida] = codigo_par.astype(np.uint32)
+            self.total_ids[medida] = len(ids)
+            self.deslocamentos[medida] = np.searchsorted(celula_par, np.arange(self.celulas + 1))
+            self.hashes[medida] = pd.util.hash_array(np.asarray(ids, dtype=object))
+
+    def _sketch(self, medida):
+        """Sketches HyperLogLog de todas as células da medida, montados na primeira consulta que os usa"""
+        if medida not in self.sketches:
+            deslocamentos = self.deslocamentos[medida]
+            celula_par = np.repeat(np.arange(self.celulas), np.diff(deslocamentos))
+            registrador, posicao = _registros_hll(self.hashes[medida][self.codigos[medida]], self.precisao)
+            sketch = np.zeros((self.celulas, 1 << self.precisao), dtype=np.uint8)
+            np.maximum.at(sketch, (celula_par, registrador), posicao)
+            self.sketches[medida] = sketch
+        return self.sketches[medida]
+
+    def selecionar(self, inicio, fim, **selecoes):
+        """Células dentro do período e dos valores selecionados (ver IndiceFiltro.filtrar)"""
+        return self.indice.filtrar(inicio, fim, **selecoes)['celula'].to_numpy()
+
+    def contar(self, medida, celulas, modo='auto'):
+        """
+        IDs distintos da medida nas células.
+
+        - modo: 'exato' (une os conjuntos), 'hll' (mescla os sketches) ou
+          'auto' (exato até limite_exato IDs na seleção, HLL acima)
+        """
+        inicio = self.deslocamentos[medida][celulas]
+        tamanhos = self.deslocamentos[medida][celulas + 1] - inicio
+        total = int(tamanhos.sum())
+        if total == 0:
+            return 0
+
+        if modo == 'exato' or (modo == 'auto' and total <= self.limite_exato):
+            # Posições de todas as fatias selecionadas sem laço por célula; a
+            # união é um bitmap sobre os códigos (sem ordenar)
+            posicoes = np.repeat(inicio - np.cumsum(tamanhos) + tamanhos, tamanhos) + np.arange(total)
+            presentes = np.zeros(self.total_ids[medida], dtype=bool)
+            presentes[self.codigos[medida][posicoes]] = True
+            return int(np.count_nonzero(presentes))
+
+        registradores = self._sketch(medida)[celulas].max(axis=0)
+        return int(round(estimar_hll(registradores)))
+
+    def contar_filtros(self, inicio, fim, canais, campanhas_origem, modo='auto'):
+        """Leads, vendas e compradores distintos para os filtros do CRM (como filtrar_crm)"""
+        celulas = self.selecionar(inicio, fim, canal_origem=canais, campanha_origem=campanhas_origem)
+        return {medida: self.contar(medida, celulas, modo) for medida in MEDIDAS_DISTINTAS}
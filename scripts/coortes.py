@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+from cubo import periodos_inteiros, truncar_datas
+from esquema import ETAPAS_FUNIL
+from indices import IndiceFiltro
+
+# ========================================== COORTES DE LEADS ==========================================
+# Cada coorte é um grupo de leads captados na mesma semana, pela mesma
+# campanha e pelo mesmo canal. Por coorte ficam só somas:
+#
+# - linhas por etapa do funil, leads, compraram e vendas;
+# - um histograma compacto dos dias até a compra (faixas de LIMITES_DIAS),
+#   mais a soma e a quantidade de conversões (média exata).
+#
+# Somas se juntam por adição: o funil, a taxa de conversão e a mediana ou os
+# percentis do tempo até a compra de qualquer seleção saem da soma de
+# algumas coortes, sem voltar às linhas. O pré-processamento mantém a mesma
+# tabela em coorte_leads.csv, atualizada só com o delta a cada carga.
+
+CELULAS_COORTE = ['semana', 'campanha_origem', 'canal_origem']
+
+# Faixas do histograma de dias até a compra: um dia por faixa na primeira
+# semana, depois faixas crescentes. Abaixo de 0 (venda registrada antes da
+# captura) e a partir do último limite, faixas abertas.
+LIMITES_DIAS = [0, 1, 2, 3, 4, 5, 6, 7, 10, 14, 21, 30, 45, 60, 90]
+
+
+def _nome_faixa(inicio, fim):
+    """Coluna do histograma para os dias em [inicio, fim)"""
+    if inicio is None:
+        return 'dias_neg'
+    if fim is None:
+        return f'dias_{inicio}_mais'
+    if fim - inicio == 1:
+        return f'dias_{inicio}'
+    return f'dias_{inicio}_{fim - 1}'
+
+
+FAIXAS_DIAS = [_nome_faixa(inicio, fim)
+               for inicio, fim in zip([None] + LIMITES_DIAS, LIMITES_DIAS + [None])]
+ETAPAS_COORTE = [f'etapa_{etapa}' for etapa in ETAPAS_FUNIL]
+MEDIDAS_COORTE = ['leads', 'compraram', 'vendas', *ETAPAS_COORTE, 'convertidos', 'soma_dias', *FAIXAS_DIAS]
+
+
+def resumir_coortes(df_crm):
+    """
+    Somas por coorte (semana de captura x campanha de origem x canal de origem) de linhas do CRM.
+
+    Retorna:
+    - DataFrame indexado por CELULAS_COORTE com as colunas de MEDIDAS_COORTE
+    """
+    df = df_crm[df_crm['data_captura'].notna()]
+    tem_lead = df['lead_id'].notna()
+    dias = df['dias_para_conversao']
+    convertidos = dias.notna()
+    medidas = {
+        'leads': tem_lead,
+        'compraram': tem_lead & (df['etapa_funil'] == 'Comprou'),
+        'vendas': df['sale_id'].notna(),
+        **{coluna: df['etapa_funil'] == etapa for coluna, etapa in zip(ETAPAS_COORTE, ETAPAS_FUNIL)},
+        'convertidos': convertidos,
+        'soma_dias': dias.where(convertidos, 0).astype('float64'),
+    }
+    # Posição da faixa de cada conversão (0 = abaixo de 0 dias, len(LIMITES_DIAS) = a partir do último)
+    faixa = np.searchsorted(LIMITES_DIAS, dias.to_numpy(), side='right')
+    for posicao, coluna in enumerate(FAIXAS_DIAS):
+        medidas[coluna] = convertidos.to_numpy() & (faixa == posicao)
+
+    semana = truncar_datas(df['data_captura'], 'semana').rename('semana')
+    return (pd.DataFrame(medidas, index=df.index)
+            .groupby([semana, df['campanha_origem'], df['canal_origem']], observed=True).sum())
+
+
+def percentis_dias(histogramas, quantil):
+    """
+    Dias até a compra no quantil pedido (0 a 1) de cada linha de histogramas.
+
+    Parâmetros:
+    - histogramas: DataFrame com as colunas FAIXAS_DIAS (uma linha por coorte)
+    - quantil: entre 0 e 1
+
+    Retorna:
+    - array com um valor por linha; faixas de um dia dão o dia exato, nas
+      maiores o valor é interpolado dentro da faixa, nas abertas vale o
+      limite. Linhas sem conversões dão NaN.
+    """
+    contagens = np.asarray(histogramas[FAIXAS_DIAS], dtype='float64').reshape(-1, len(FAIXAS_DIAS))
+    limites = np.array(LIMITES_DIAS, dtype='float64')
+    total = contagens.sum(axis=1)
+    acumulado = np.cumsum(contagens, axis=1)
+    alvo = quantil * total
+
+    # searchsorted(side='left') de cada linha: faixas com acumulado abaixo do alvo
+    posicao = np.minimum((acumulado < alvo[:, None]).sum(axis=1), len(FAIXAS_DIAS) - 1)
+    anterior = np.maximum(posicao - 1, 0)
+    inicio = limites[np.minimum(anterior, len(LIMITES_DIAS) - 1)]
+    fim = limites[np.minimum(posicao, len(LIMITES_DIAS) - 1)]
+    antes = np.take_along_axis(acumulado, anterior[:, None], axis=1)[:, 0]
+    na_faixa = np.take_along_axis(contagens, posicao[:, None], axis=1)[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        interpolado = inicio + (fim - inicio) * (alvo - antes) / na_faixa
+
+    dias = np.where(fim - inicio == 1, inicio, interpolado)
+    dias = np.where(posicao == 0, limites[0], dias)
+    dias = np.where(posicao == len(LIMITES_DIAS), limites[-1], dias)
+    return np.where(total == 0, np.nan, dias)
+
+
+def percentil_dias(totais, quantil):
+    """Dias até a compra no quantil pedido pelo histograma somado (totais: Series com FAIXAS_DIAS, ver percentis_dias)"""
+    return float(percentis_dias(totais, quantil)[0])
+
+
+class CoortesLeads:
+    """
+    Coortes semanais de leads do CRM, com índice pelos filtros da sidebar.
+
+    Montada uma vez por versão do CRM, a partir das linhas (indice_crm.df) ou
+    do resumo coorte_leads.csv gravado pelo pré-processamento. As consultas
+    recebem os mesmos filtros de filtrar_crm.
+    """
+
+    def __init__(self, indice_crm, resumo=None):
+        self.indice_crm = indice_crm
+        if resumo is None or not set(CELULAS_COORTE + MEDIDAS_COORTE) <= set(resumo.columns):
+            resumo = resumir_coortes(indice_crm.df).reset_index()
+        else:
+            resumo = resumo.assign(semana=pd.to_datetime(resumo['semana']))
+        self.indice = IndiceFiltro(resumo[CELULAS_COORTE + MEDIDAS_COORTE], 'semana',
+                                   ['campanha_origem', 'canal_origem'])
+
+    def selecionar(self, inicio, fim, canais, campanhas_origem):
+        """
+        Coortes dentro do período e dos filtros (semana x campanha x canal).
+
+        As semanas inteiras no período vêm da tabela; as semanas cortadas
+        pelo início ou pelo fim do período (ex: meia semana) são resumidas das
+        linhas do CRM só dos dias selecionados.
+        """
+        selecoes = {'canal_origem': canais, 'campanha_origem': campanhas_origem}
+        inteiros = periodos_inteiros(inicio, fim, 'semana')
+        if inteiros is None:
+            pontas = [(inicio, fim)]
+            partes = []
+        else:
+            primeira, ultima, fim_ultima = inteiros
+            um_dia = pd.Timedelta(days=1)
+            pontas = [(inicio, primeira - um_dia), (fim_ultima + um_dia, fim)]
+            partes = [self.indice.filtrar(primeira, ultima, **selecoes)]
+
+        for inicio_ponta, fim_ponta in pontas:
+            linhas = self.indice_crm.filtrar(inicio_ponta, fim_ponta, **selecoes)
+            if len(linhas):
+                partes.append(resumir_coortes(linhas).reset_index())
+        partes = [parte for parte in partes if len(parte)]
+        if not partes:
+            return self.indice.df.iloc[:0]
+        return pd.concat(partes, ignore_index=True)
@@ -0,0 +1,103 @@
+import pandas as pd
+
+# ========================================== CUBO META ADS ==========================================
+# Somas aditivas materializadas no grão dos filtros da sidebar. Filtros e
+# agrupamentos do dashboard rodam sobre as células do cubo, não sobre as
+# linhas brutas; as métricas saem das somas pelo registro METRICAS
+# (data_processing).
+
+DIMENSOES_CUBO = ['data', 'campanha', 'sexo', 'idade', 'anuncio']
+MEDIDAS_CUBO = ['impressoes', 'cliques', 'conversões', 'gasto_total', 'Receita']
+
+# Razões exportadas linha a linha pelo Meta Ads; o cubo guarda a soma delas
+# ('soma_ctr (%)', ...) para quem precisa da média por linha bruta
+RAZOES_LINHA = ['ctr (%)', 'cpc (R$)', 'cpa (R$)']
+
+
+def construir_cubo_metaads(df):
+    """
+    Materializa o cubo do Meta Ads (data x campanha x sexo x idade x anuncio).
+
+    Cada célula guarda as somas das medidas aditivas, a soma das razões
+    exportadas por linha e a quantidade de linhas brutas ('linhas'), usada
+    para médias por linha e para os dias de campanha.
+    """
+    medidas = [m for m in MEDIDAS_CUBO if m in df.columns]
+    razoes = [m for m in RAZOES_LINHA if m in df.columns]
+    agregacoes = {m: (m, 'sum') for m in medidas}
+    agregacoes.update({f'soma_{m}': (f'soma_{m}', 'sum') for m in razoes})
+    agregacoes['linhas'] = (DIMENSOES_CUBO[0], 'size')
+
+    # Somas das razões sempre em float64: os valores exportados têm 2 casas, e
+    # somá-los num tipo mais estreito muda a média arredondada
+    df = df.assign(**{f'soma_{m}': df[m].astype('float64') for m in razoes})
+    cubo = df.groupby(DIMENSOES_CUBO, observed=True, dropna=False).agg(**agregacoes).reset_index()
+    return cubo.sort_values('data', ignore_index=True)
+
+
+def agregar_cubo(cubo, chaves):
+    """
+    Soma as células do cubo no nível das chaves informadas.
+
+    Também aceita linhas brutas do Meta Ads (cada linha conta como uma célula).
+    Sem chaves, devolve uma única linha com o total.
+    """
+    medidas = [m for m in MEDIDAS_CUBO + [f'soma_{r}' for r in RAZOES_LINHA] if m in cubo.columns]
+    if not chaves:
+        total = cubo[medidas].sum()
+        total['linhas'] = cubo['linhas'].sum() if 'linhas' in cubo.columns else len(cubo)
+        return total.to_frame().T
+
+    grupos = cubo.groupby(chaves, observed=True)
+    agregado = grupos[medidas].sum()
+    agregado['linhas'] = grupos['linhas'].sum() if 'linhas' in cubo.columns else grupos.size()
+    return agregado.reset_index()
+
+
+# ========================================== ROLLUPS POR PERÍODO ==========================================
+# O mesmo cubo materializado também por semana ISO (segunda a domingo) e por
+# mês, com a data truncada para o início do período. Como guardam somas,
+# as razões (CTR, CPC...) continuam saindo certas do registro METRICAS em
+# qualquer grão.
+
+GRANULARIDADES = {'dia': 'Dia', 'semana': 'Semana', 'mes': 'Mês'}
+FREQUENCIAS = {'dia': 'D', 'semana': 'W-SUN', 'mes': 'M'}
+
+
+def truncar_datas(datas, granularidade):
+    """Início do período (dia, semana ISO ou mês) de cada data de uma Series"""
+    if granularidade == 'dia':
+        return datas.dt.normalize()
+    return datas.dt.to_period(FREQUENCIAS[granularidade]).dt.start_time
+
+
+def periodos_inteiros(inicio, fim, granularidade):
+    """
+    Primeiro e último período inteiramente contidos em [inicio, fim].
+
+    Retorna:
+    - (início do primeiro, início do último, fim do último) como Timestamps,
+      ou None se nenhum período cabe inteiro no intervalo
+    """
+    frequencia = FREQUENCIAS[granularidade]
+    primeiro = pd.Period(inicio, frequencia)
+    if primeiro.start_time < pd.Timestamp(inicio):
+        primeiro += 1
+    ultimo = pd.Period(fim, frequencia)
+    if ultimo.end_time.normalize() > pd.Timestamp(fim):
+        ultimo -= 1
+
+    if primeiro > ultimo:
+        return None
+    return primeiro.start_time, ultimo.start_time, ultimo.end_time.normalize()
+
+
+def construir_rollup(cubo, granularidade):
+    """Cubo somado por período (a coluna 'data' vira o início do período)"""
+    if granularidade == 'dia':
+        return cubo
+
+    medidas = [c for c in cubo.columns if c not in DIMENSOES_CUBO]
+    aux = cubo.assign(data=truncar_datas(cubo['data'], granularidade))
+    rollup = aux.groupby(DIMENSOES_CUBO, observed=True, dropna=False)[medidas].sum().reset_index()
+    return rollup.sort_values('data', ignore_index=True)
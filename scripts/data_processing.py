@@ -1,23 +1,32 @@
-# data_processing.py
+from collections import namedtuple
+
+import numpy as np
 import pandas as pd
 
+from coortes import ETAPAS_COORTE, FAIXAS_DIAS, LIMITES_DIAS, MEDIDAS_COORTE, percentil_dias, percentis_dias
+from cubo import agregar_cubo, periodos_inteiros, truncar_datas
+from esquema import ESQUEMA_ADS, ESQUEMA_CRM, ETAPAS_FUNIL, aplicar_esquema
+from instrumentacao import instrumentar
+
 # ========================================== FUNÇÕES TRATAMENTO DADOS ==========================================
 
+@instrumentar('data_processing')
 def tratar_datas_crm_ads(df_ads: pd.DataFrame, df_crm: pd.DataFrame):
-    # Tratamento de datas para df_ads
-    if 'data' in df_ads.columns:
-        df_ads['data'] = pd.to_datetime(df_ads['data'], errors='coerce')
-
-    # Tratamento de datas para df_crm
-    for col in ['ultima_interacao', 'data_captura', 'data_venda']:
-        if col in df_crm.columns:
-            df_crm[col] = pd.to_datetime(df_crm[col], errors='coerce')
+    """
+    Aplica os esquemas declarados (datas, categorias e numéricos) aos dois datasets.
 
+    O dashboard já recebe os dados tipados de carregar_dados; aqui só há
+    trabalho para DataFrames lidos por fora (ex: notebooks). Os DataFrames
+    recebidos não são alterados: as colunas convertidas vão para cópias rasas.
+    """
+    df_ads = aplicar_esquema(df_ads.copy(deep=False), ESQUEMA_ADS)
+    df_crm = aplicar_esquema(df_crm.copy(deep=False), ESQUEMA_CRM)
     return df_ads, df_crm
 
 
 # ========================================== FUNÇÕES FILTRO DADOS ==========================================
 
+@instrumentar('data_processing')
 def obter_limites_datas(df_ads, df_crm):
     """Retorna as datas mínima e máxima combinadas de ads e crm"""
     min_data = min(df_ads['data'].min(), df_crm['data_captura'].min())
@@ -25,8 +34,17 @@ def obter_limites_datas(df_ads, df_crm):
     return min_data, max_data
 
 
-def filtrar_metaads(df, start_date, end_date, campanhas, generos, idades):
-    """Filtra o DataFrame do Meta Ads com base nos filtros selecionados"""
+@instrumentar('data_processing')
+def filtrar_metaads(df, start_date, end_date, campanhas, generos, idades, indice=None):
+    """
+    Filtra o DataFrame do Meta Ads com base nos filtros selecionados.
+
+    Se um IndiceFiltro montado sobre df for informado, o filtro usa o índice
+    (fatia por data + bitmaps por valor) em vez de varrer todas as linhas.
+    """
+    if indice is not None:
+        return indice.filtrar(start_date, end_date, campanha=campanhas, sexo=generos, idade=idades)
+
     return df[
         (df['data'].between(start_date, end_date)) &
         (df['campanha'].isin(campanhas)) &
@@ -35,38 +53,156 @@ def filtrar_metaads(df, start_date, end_date, campanhas, generos, idades):
     ]
 
 
-def filtrar_crm(df, start_date, end_date, canais, campanhas_origem):
-    """Filtra o DataFrame do CRM com base nos filtros selecionados"""
+@instrumentar('data_processing')
+def filtrar_metaads_granularidade(indices, granularidade, start_date, end_date, campanhas, generos, idades):
+    """
+    Filtra o cubo do Meta Ads já no grão pedido ('dia', 'semana' ou 'mes').
+
+    Os períodos inteiros dentro do intervalo vêm prontos do rollup; as pontas
+    cortadas pelo intervalo (ex: meia semana) são somadas a partir das
+    células diárias, só com os dias selecionados.
+
+    Parâmetros:
+    - indices: {granularidade: IndiceFiltro} (ver utils.carregar_indices_rollups)
+
+    Retorna:
+    - células do cubo com 'data' = início do período
+    """
+    def filtrar(grao, inicio, fim):
+        return filtrar_metaads(indices[grao].df, inicio, fim, campanhas, generos, idades, indice=indices[grao])
+
+    if granularidade == 'dia':
+        return filtrar('dia', start_date, end_date)
+
+    inteiros = periodos_inteiros(start_date, end_date, granularidade)
+    if inteiros is None:
+        pontas = [filtrar('dia', start_date, end_date)]
+        partes = []
+    else:
+        primeiro, ultimo, fim_ultimo = inteiros
+        um_dia = pd.Timedelta(days=1)
+        pontas = [filtrar('dia', start_date, primeiro - um_dia), filtrar('dia', fim_ultimo + um_dia, end_date)]
+        partes = [filtrar(granularidade, primeiro, ultimo)]
+
+    for ponta in pontas:
+        if len(ponta):
+            partes.append(ponta.assign(data=truncar_datas(ponta['data'], granularidade)))
+    if not partes:
+        return pontas[0]
+    return pd.concat(partes, ignore_index=True).sort_values('data', kind='stable', ignore_index=True)
+
+
+@instrumentar('data_processing')
+def filtrar_crm(df, start_date, end_date, canais, campanhas_origem, indice=None):
+    """
+    Filtra o DataFrame do CRM com base nos filtros selecionados.
+
+    Aceita um IndiceFiltro montado sobre df, como filtrar_metaads.
+    """
+    if indice is not None:
+        return indice.filtrar(start_date, end_date, canal_origem=canais, campanha_origem=campanhas_origem)
+
     return df[
         (df['data_captura'].between(start_date, end_date)) &
         (df['canal_origem'].isin(canais)) &
         (df['campanha_origem'].isin(campanhas_origem))
     ]
 
+# ========================================== REGISTRO DE MÉTRICAS ==========================================
+# Toda métrica é numerador / denominador (x escala) sobre somas. Medidas
+# aditivas usam 'linhas' como denominador, ou seja, viram média por linha
+# bruta do Meta Ads (como o antigo .mean() sobre as linhas).
+
+Metrica = namedtuple('Metrica', ['numerador', 'denominador', 'escala'])
+
+METRICAS = {
+    'impressoes': Metrica('impressoes', 'linhas', 1),
+    'cliques': Metrica('cliques', 'linhas', 1),
+    'conversões': Metrica('conversões', 'linhas', 1),
+    'gasto_total': Metrica('gasto_total', 'linhas', 1),
+    'Receita': Metrica('Receita', 'linhas', 1),
+    'ctr (%)': Metrica('cliques', 'impressoes', 100),
+    'cpc (R$)': Metrica('gasto_total', 'cliques', 1),
+    'cpa (R$)': Metrica('gasto_total', 'conversões', 1),
+    'taxa_conversao (%)': Metrica('conversões', 'cliques', 100),
+    'roas': Metrica('Receita', 'gasto_total', 1),
+}
+
+
+def eh_aditiva(metrica):
+    """True para medidas aditivas (impressões, cliques...), False para razões (CTR, CPC...)"""
+    return METRICAS[metrica].denominador == 'linhas'
+
+
+def dividir(numerador, denominador, valor_vazio=np.nan):
+    """Divisão vetorizada que devolve valor_vazio onde o denominador é zero"""
+    numerador = np.asarray(numerador, dtype='float64')
+    denominador = np.asarray(denominador, dtype='float64')
+    resultado = np.full(numerador.shape, valor_vazio, dtype='float64')
+    np.divide(numerador, denominador, out=resultado, where=denominador != 0)
+    return resultado
+
+
+@instrumentar('data_processing')
+def aplicar_metricas(df, metricas, casas=None, valor_vazio=np.nan, somar_aditivas=False):
+    """
+    Adiciona ao DataFrame já agregado (somas) as colunas das métricas pedidas.
+
+    - casas: arredondamento (None = sem arredondar)
+    - valor_vazio: resultado quando o denominador é zero
+    - somar_aditivas: se True, medidas aditivas ficam como soma em vez de média por linha
+    """
+    for nome in metricas:
+        metrica = METRICAS[nome]
+        if somar_aditivas and eh_aditiva(nome):
+            valores = df[metrica.numerador].to_numpy(dtype='float64')
+        else:
+            valores = dividir(df[metrica.numerador], df[metrica.denominador], valor_vazio) * metrica.escala
+        df[nome] = valores.round(casas) if casas is not None else valores
+    return df
+
+
+@instrumentar('data_processing')
+def calcular_metricas(df, chaves, metricas, casas=2, somar_aditivas=False):
+    """
+    Calcula um conjunto de métricas para qualquer agrupamento, em uma passada.
+
+    Parâmetros:
+    - df: cubo do Meta Ads (ou linhas brutas)
+    - chaves: colunas de agrupamento (lista vazia = total geral)
+    - metricas: nomes do registro METRICAS
+    - casas: arredondamento
+    - somar_aditivas: medidas aditivas como soma em vez de média por linha
+
+    Retorna:
+    - DataFrame com as chaves e uma coluna por métrica
+    """
+    agregado = agregar_cubo(df, chaves)
+    aplicar_metricas(agregado, metricas, casas=casas, somar_aditivas=somar_aditivas)
+    return agregado[list(chaves) + list(metricas)]
+
+
 # ========================================== FUNÇÕES CALCULO INDICADORES ==========================================
 
+@instrumentar('data_processing')
 def calcular_metricas_media(df):
-    """Retorna CTR, CPC e CPA médios"""
-    ctr_medio = df['ctr (%)'].mean()
-    cpc_medio = df['cpc (R$)'].mean()
-    cpa_medio = df['cpa (R$)'].mean()
-    return ctr_medio, cpc_medio, cpa_medio
+    """Retorna CTR, CPC e CPA médios (razão das somas de cliques, impressões, gasto e conversões)"""
+    total = calcular_metricas(df, [], ['ctr (%)', 'cpc (R$)', 'cpa (R$)'], casas=None)
+    return tuple(total.iloc[0])
 
 
+@instrumentar('data_processing')
 def calcular_taxa_conversao_geral(df):
     """Calcula taxa de conversão média por campanha"""
-    taxa_campanha = df.groupby('campanha').agg({
-        'cliques': 'sum',
-        'impressoes': 'sum',
-        'conversões': 'sum',
-        'gasto_total': 'sum'}).reset_index()
-
-    taxa_campanha['taxa_conversao (%)'] = (taxa_campanha['conversões'] / taxa_campanha['cliques'] * 100).round(2)
+    taxa_campanha = calcular_metricas(df, ['campanha'], ['taxa_conversao (%)'])
     return taxa_campanha['taxa_conversao (%)'].mean()
 
 
-def agrupar_metaads_por_dia(df):
-    """Agrupa os dados do Meta Ads por dia"""
+@instrumentar('data_processing')
+def agrupar_metaads_por_dia(df, granularidade='dia'):
+    """Agrupa os dados do Meta Ads por dia (ou por semana/mês, com 'data' = início do período)"""
+    if granularidade != 'dia':
+        df = df.assign(data=truncar_datas(df['data'], granularidade))
     return df.groupby('data').agg({
         'cliques': 'sum',
         'impressoes': 'sum',
@@ -74,9 +210,10 @@ def agrupar_metaads_por_dia(df):
         'gasto_total': 'sum'}).reset_index()
 
 
+@instrumentar('data_processing')
 def agrupar_metaads_por_campanha(df):
     """Agrupa os dados do Meta Ads por campanha"""
-    return df.groupby('campanha').agg({
+    return df.groupby('campanha', observed=True).agg({
         'cliques': 'sum',
         'impressoes': 'sum',
         'conversões': 'sum',
@@ -84,47 +221,273 @@ def agrupar_metaads_por_campanha(df):
 
 
 
-def calcular_metricas_diarias(df_metaads, df_crm, dias):
-    """Calcula os KPIs diários"""
-    gasto_dia = df_metaads.groupby('campanha')['gasto_total'].sum().mean() / dias
+@instrumentar('data_processing')
+def contar_distintos_crm(df_crm, start_date, end_date, canais, campanhas_origem, contagem=None):
+    """
+    Leads, vendas e compradores (leads com venda) distintos nos filtros do CRM.
+
+    Com uma ContagemDistinta (contagem_distinta) montada sobre o CRM inteiro,
+    a contagem sai da união das células selecionadas pelos filtros; sem ela,
+    conta direto nas linhas de df_crm, que já deve estar filtrado.
+
+    Retorna:
+    - {'leads': ..., 'vendas': ..., 'compradores': ...}
+    """
+    if contagem is not None:
+        return contagem.contar_filtros(start_date, end_date, canais, campanhas_origem)
+
+    return {
+        'leads': df_crm['lead_id'].nunique(),
+        'vendas': df_crm['sale_id'].nunique(),
+        'compradores': df_crm.loc[df_crm['sale_id'].notna(), 'lead_id'].nunique(),
+    }
+
+
+@instrumentar('data_processing')
+def calcular_metricas_diarias(df_metaads, df_crm, dias, distintos=None):
+    """Calcula os KPIs diários (distintos: contagens já feitas por contar_distintos_crm)"""
+    if distintos is None:
+        distintos = contar_distintos_crm(df_crm, None, None, None, None)
+    gasto_dia = df_metaads.groupby('campanha', observed=True)['gasto_total'].sum().mean() / dias
     cliques_dia = df_metaads['cliques'].sum() / dias
     impressoes_dia = df_metaads['impressoes'].sum() / dias
-    leads_dia = df_crm['lead_id'].nunique() / dias
-    compras_dia = df_crm['sale_id'].nunique() / dias
+    leads_dia = distintos['leads'] / dias
+    compras_dia = distintos['vendas'] / dias
     return gasto_dia, cliques_dia, impressoes_dia, leads_dia, compras_dia
 
 
+@instrumentar('data_processing')
 def calcular_metricas_diarias_metaads(df):
-    """Adiciona métricas calculadas por dia ao DataFrame agrupado"""
-    df['ctr (%)'] = (df['cliques'] / df['impressoes']) * 100
-    df['cpc (R$)'] = df.apply(lambda row: row['gasto_total'] / row['cliques'] if row['cliques'] != 0 else 0, axis=1)
-    df['ctr (%)'] = pd.to_numeric(df['ctr (%)'], errors='coerce')
-    return df
+    """Retorna o DataFrame agrupado por dia com as métricas calculadas (CTR e CPC)"""
+    return aplicar_metricas(df.copy(), ['ctr (%)', 'cpc (R$)'], valor_vazio=0)
 
 
 # ======================= ABA VISÃO GERAL =====================================================
-def gerar_ranking_campanhas(df, coluna, maior_valor=True):
+@instrumentar('data_processing')
+def gerar_ranking_campanhas(df, coluna, maior_valor=True, formatar=True):
     """
     Gera ranking de campanhas baseado em uma métrica específica.
 
     Parâmetros:
-    - df: DataFrame com os dados
-    - coluna: coluna para ordenação (ex: 'ctr (%)', 'taxa_conversao (%)')
+    - df: cubo do Meta Ads (ou linhas brutas)
+    - coluna: métrica para ordenação (ex: 'ctr (%)', 'taxa_conversao (%)')
     - maior_valor: bool, se True ordena do maior para o menor
+    - formatar: bool, se True devolve os valores como texto com vírgula decimal
 
     Retorna:
     - DataFrame formatado
     """
-    if coluna == 'taxa_conversao (%)':
-        aux = df.groupby('campanha').agg({
-            'cliques': 'sum',
-            'conversões': 'sum'
-        }).reset_index()
-        aux[coluna] = (aux['conversões'] / aux['cliques'] * 100).round(2)
-        aux = aux[['campanha', coluna]]
-    else:
-        aux = df.groupby('campanha')[coluna].mean().round(2).reset_index()
-
+    aux = calcular_metricas(df, ['campanha'], [coluna])
     aux = aux.sort_values(by=coluna, ascending=not maior_valor)
-    aux[coluna] = aux[coluna].apply(lambda x: f"{x:.2f}".replace('.', ','))
+    if formatar:
+        aux[coluna] = np.char.replace(np.char.mod('%.2f', aux[coluna].to_numpy()), '.', ',')
+    return aux
+
+
+# ======================= ABA CAMPANHAS =====================================================
+@instrumentar('data_processing')
+def agrupar_crm_por_campanha(df):
+    """Leads, vendas (lead ganho e vendas registradas), receita e taxa de conversão por campanha de origem"""
+    aux = df.assign(ganhou=df['status'] == 'Ganhou').groupby('campanha_origem', observed=True).agg(
+        leads=('lead_id', 'count'),
+        vendas_leads=('ganhou', 'sum'),
+        vendas=('sale_id', 'count'),
+        receita_total=('valor_total', 'sum')
+    ).reset_index()
+
+    aux['taxa_conversao (%)'] = np.round(dividir(aux['vendas'], aux['leads']) * 100, 2)
+    return aux
+
+
+# ======================= ABA PÚBLICOS =====================================================
+@instrumentar('data_processing')
+def calcular_metrica_normalizada(df, chaves, metrica):
+    """
+    Métrica por chaves (ex: ['data', 'sexo']) como fração do total de cada valor da primeira chave.
+
+    Medidas aditivas entram como soma; razões (CTR, CPC...) como razão das somas.
+    """
+    aux = calcular_metricas(df, chaves, [metrica], casas=None, somar_aditivas=True)
+    total = aux.groupby(chaves[0], observed=True)[metrica].transform('sum')
+    aux[metrica] = dividir(aux[metrica], total, valor_vazio=0)
+    return aux
+
+
+# ======================= ABA FUNIL DE VENDAS =====================================================
+@instrumentar('data_processing')
+def agregar_coortes(coortes, start_date, end_date, canais, campanhas_origem, por_semana=False):
+    """
+    Somas das coortes de leads nos filtros do CRM (ver coortes.CoortesLeads).
+
+    Retorna:
+    - Series com o total de cada medida de coortes.MEDIDAS_COORTE, ou, com
+      por_semana, um DataFrame com as somas por semana de captura
+    """
+    tabela = coortes.selecionar(start_date, end_date, canais, campanhas_origem)
+    if por_semana:
+        return tabela.groupby('semana')[MEDIDAS_COORTE].sum().reset_index()
+    return tabela[MEDIDAS_COORTE].sum()
+
+
+@instrumentar('data_processing')
+def calcular_tempo_medio_compra(df_crm, totais=None):
+    """Média de dias entre captura e venda, arredondada em dias (totais: somas de agregar_coortes)"""
+    if totais is not None:
+        return np.round(dividir(totais['soma_dias'], totais['convertidos'])[()], 0)
+    return np.round(df_crm['dias_para_conversao'].mean(), 0)
+
+
+@instrumentar('data_processing')
+def calcular_percentis_compra(totais, quantis=(0.5, 0.9)):
+    """Dias até a compra em cada quantil, pelo histograma das coortes (ver coortes.percentil_dias)"""
+    return tuple(np.round(percentil_dias(totais, quantil), 0) for quantil in quantis)
+
+
+@instrumentar('data_processing')
+def contar_etapas_funil(totais):
+    """Linhas do CRM em cada etapa do funil, a partir das somas das coortes"""
+    return pd.DataFrame({
+        'etapa_funil': ETAPAS_FUNIL,
+        'quantidade': [int(totais[coluna]) for coluna in ETAPAS_COORTE],
+    })
+
+
+@instrumentar('data_processing')
+def calcular_metricas_coortes(por_semana):
+    """Leads, taxa de conversão (compraram/leads) e mediana de dias até a compra de cada coorte semanal"""
+    return pd.DataFrame({
+        'semana': por_semana['semana'],
+        'leads': por_semana['leads'],
+        'taxa_conversao (%)': np.round(dividir(por_semana['compraram'], por_semana['leads']) * 100, 2),
+        'mediana_dias': percentis_dias(por_semana, 0.5),
+    })
+
+
+@instrumentar('data_processing')
+def calcular_curvas_conversao(por_semana, coortes_max=8):
+    """
+    Conversão acumulada de cada coorte semanal pelos dias desde a captura.
+
+    Para cada faixa do histograma, o percentual dos leads da coorte que
+    compraram até o último dia da faixa; só as coortes_max coortes mais recentes.
+    """
+    recentes = por_semana.sort_values('semana').tail(coortes_max)
+    # Conversões abaixo de 0 dias entram já no primeiro ponto; a faixa aberta do fim não tem ponto
+    acumulado = recentes[FAIXAS_DIAS[:-1]].cumsum(axis=1).iloc[:, 1:]
+    percentual = dividir(acumulado.to_numpy(), recentes[['leads']].to_numpy()) * 100
+    return pd.DataFrame({
+        'semana': np.repeat(recentes['semana'].dt.strftime('%Y-%m-%d').to_numpy(), acumulado.shape[1]),
+        'dias': np.tile([fim - 1 for fim in LIMITES_DIAS[1:]], len(recentes)),
+        'convertidos (%)': np.round(percentual.ravel(), 2),
+    })
+
+
+@instrumentar('data_processing')
+def calcular_taxa_conversao_leads(df_crm, distintos=None):
+    """Fração dos leads (distintos) que têm alguma venda (distintos: ver contar_distintos_crm)"""
+    if distintos is None:
+        distintos = contar_distintos_crm(df_crm, None, None, None, None)
+    total_leads = distintos['leads']
+    leads_compraram = distintos['compradores']
+    return leads_compraram / total_leads if total_leads > 0 else 0
+
+
+@instrumentar('data_processing')
+def filtrar_campanhas_crm(df_crm, campanhas):
+    """Filtra o CRM pelas campanhas de origem selecionadas"""
+    return df_crm[df_crm['campanha_origem'].isin(campanhas)]
+
+
+# ======================= ABA CANAIS DE VENDA =====================================================
+@instrumentar('data_processing')
+def agrupar_crm_por_canal_campanha(df_crm):
+    """Vendas, leads e taxa de conversão por canal e campanha de origem"""
+    aux = (
+        df_crm.groupby(['canal_origem', 'campanha_origem'], observed=True)
+        .agg(Vendas=('sale_id', 'count'), Leads=('lead_id', 'count'))
+        .reset_index()
+    )
+    aux['Taxa Conversão (%)'] = np.round(dividir(aux['Vendas'], aux['Leads']) * 100, 2)
     return aux
+
+
+@instrumentar('data_processing')
+def agrupar_vendas_por_canal(df_canal_campanha, campanhas):
+    """Soma vendas e leads por canal, só nas campanhas selecionadas"""
+    return (
+        df_canal_campanha[df_canal_campanha['campanha_origem'].isin(campanhas)]
+        .groupby('canal_origem', observed=True)
+        .agg(Vendas=('Vendas', 'sum'), Leads=('Leads', 'sum'))
+        .reset_index()
+        .sort_values(by='Vendas', ascending=False)
+    )
+
+
+@instrumentar('data_processing')
+def calcular_taxa_conversao_canais(df_canal_campanha):
+    """Média, por canal, das taxas de conversão de cada campanha"""
+    aux = (
+        df_canal_campanha.groupby('canal_origem', observed=True)
+        .agg({'Taxa Conversão (%)': 'mean'})
+        .reset_index()
+        .sort_values(by='Taxa Conversão (%)', ascending=False)
+    )
+    aux['Taxa Conversão (%)'] = aux['Taxa Conversão (%)'].round(2)
+    return aux
+
+
+@instrumentar('data_processing')
+def calcular_metricas_canais(cubo, df_crm, metrica, modo='compativel'):
+    """
+    Calcula uma métrica do Meta Ads por canal de origem dos leads.
+
+    Em vez do merge linha a linha (anúncios x leads de cada campanha), os dois
+    lados são agregados por campanha e só então combinados, então o custo é
+    proporcional a campanhas x canais.
+
+    Parâmetros:
+    - cubo: cubo do Meta Ads filtrado
+    - df_crm: CRM filtrado
+    - metrica: métrica do Meta Ads (ex: 'cliques', 'ctr (%)')
+    - modo:
+        'compativel' reproduz a média do antigo merge: cada linha de anúncio
+        da campanha pesa pela quantidade de leads do canal nessa campanha.
+        'ponderado' distribui os totais de cada campanha entre os canais pela
+        participação do canal nos leads da campanha; razões saem das somas
+        atribuídas e medidas aditivas viram o total atribuído ao canal.
+
+    Retorna:
+    - DataFrame com canal_origem e a métrica, ordenado do maior para o menor
+    """
+    ads = agregar_cubo(cubo, ['campanha'])
+    leads = df_crm.groupby(['campanha_origem', 'canal_origem'], observed=True).size().rename('leads').reset_index()
+
+    base = leads.merge(ads, left_on='campanha_origem', right_on='campanha', how='inner')
+    base['canal_origem'] = base['canal_origem'].astype(str)
+
+    if modo == 'ponderado':
+        peso = base['leads'] / base.groupby('campanha_origem', observed=True)['leads'].transform('sum')
+    else:
+        peso = base['leads']
+
+    numerador, denominador, escala = METRICAS[metrica]
+    if modo != 'ponderado' and f'soma_{metrica}' in base.columns:
+        # Média por linha de anúncio das razões exportadas pelo Meta Ads, como no merge
+        numerador, denominador, escala = f'soma_{metrica}', 'linhas', 1
+
+    if modo == 'ponderado' and eh_aditiva(metrica):
+        # Medida aditiva: total de cada campanha atribuído ao canal
+        canais = (peso * base[numerador]).groupby(base['canal_origem']).sum()
+    else:
+        somas = pd.DataFrame({
+            'num': peso * base[numerador] * escala,
+            'den': peso * base[denominador],
+        }).groupby(base['canal_origem']).sum()
+        canais = pd.Series(dividir(somas['num'], somas['den']), index=somas.index)
+
+    return (
+        canais.round(2)
+        .rename(metrica)
+        .reset_index()
+        .sort_values(by=metrica, ascending=False)
+    )
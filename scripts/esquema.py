@@ -0,0 +1,122 @@
+import pandas as pd
+
+# ========================================== ESQUEMAS DOS DATASETS ==========================================
+
+ETAPAS_FUNIL = ["Visita", "Carrinho", "Checkout", "Comprou"]
+
+# Público do Meta Ads, ex: "Mulheres 24-30" -> sexo "Mulheres", idade "24-30"
+PADRAO_PUBLICO = r'(?P<sexo>\w+)\s(?P<idade>\d{2}-\d{2})'
+
+ESQUEMA_ADS = {
+    # Datas
+    'data': 'datetime64[ns]',
+    # Categorias (baixa cardinalidade)
+    'campanha': 'category',
+    'conjunto_anuncio': 'category',
+    'anuncio': 'category',
+    'sexo': 'category',
+    'idade': 'category',
+    'dia_da_semana': 'category',
+    # Contagens
+    'impressoes': 'int32',
+    'cliques': 'int32',
+    'conversões': 'int32',
+    # Valores (razões e dinheiro exportados com 2 casas: em float32, 1.23 vira
+    # 1.2300000190734863 e as somas e médias arredondadas mudam)
+    'gasto_total': 'float64',
+    'Receita': 'float64',
+    'ctr (%)': 'float64',
+    'cpc (R$)': 'float64',
+    'cpa (R$)': 'float64',
+    'roas': 'float64',
+}
+
+ESQUEMA_CRM = {
+    # Datas
+    'data_captura': 'datetime64[ns]',
+    'ultima_interacao': 'datetime64[ns]',
+    'data_venda': 'datetime64[ns]',
+    # Categorias (baixa cardinalidade)
+    'campanha_origem': 'category',
+    'ad_clicked': 'category',
+    'canal_origem': 'category',
+    'etapa_funil': pd.CategoricalDtype(ETAPAS_FUNIL, ordered=True),
+    'status': 'category',
+    'produto': 'category',
+    'meio_pagamento': 'category',
+    'status_pagamento': 'category',
+    'utm_source': 'category',
+    'utm_campaign': 'category',
+    # Valores (pontuação e dias são inteiros com ausentes: exatos em float32)
+    'pontuacao': 'float32',
+    'valor_total': 'float64',
+    'quantidade': 'int16',
+    'dias_para_conversao': 'float32',
+}
+
+# Esquemas por nome (usado por carregar_dados, que precisa de argumentos hasheáveis)
+ESQUEMAS = {
+    'ads': ESQUEMA_ADS,
+    'crm': ESQUEMA_CRM,
+}
+
+
+# ========================================== APLICAÇÃO E VALIDAÇÃO ==========================================
+
+def _converter_coluna(serie, tipo):
+    """Converte uma coluna para o tipo declarado, validando os valores"""
+    nome = serie.name
+    tipo = pd.api.types.pandas_dtype(tipo)
+
+    if isinstance(tipo, pd.CategoricalDtype):
+        convertida = serie.astype(tipo)
+        if tipo.categories is not None:
+            invalidos = convertida.isna() & serie.notna()
+            if invalidos.any():
+                valores = ", ".join(map(str, serie[invalidos].unique()[:5]))
+                raise ValueError(f"Coluna '{nome}' possui valores fora do esperado: {valores}")
+        return convertida
+
+    if pd.api.types.is_datetime64_any_dtype(tipo):
+        convertida = pd.to_datetime(serie, errors='coerce')
+    else:
+        convertida = pd.to_numeric(serie, errors='coerce')
+
+    invalidos = convertida.isna() & serie.notna()
+    if invalidos.any():
+        raise ValueError(f"Coluna '{nome}' possui {invalidos.sum()} valores inválidos para o tipo {tipo}")
+
+    if pd.api.types.is_integer_dtype(tipo) and convertida.isna().any():
+        raise ValueError(f"Coluna '{nome}' possui valores ausentes e deve ser inteira")
+
+    return convertida.astype(tipo)
+
+
+def aplicar_esquema(df, esquema, obrigatorias=None):
+    """
+    Aplica um esquema declarado ao DataFrame (in place).
+
+    Parâmetros:
+    - df: DataFrame carregado
+    - esquema: dict coluna -> tipo (ex: ESQUEMA_ADS) ou o nome de um deles em ESQUEMAS
+    - obrigatorias: colunas que precisam existir no arquivo
+
+    Retorna:
+    - o próprio DataFrame com os tipos aplicados
+
+    Colunas que já estão no tipo certo não são reprocessadas, então aplicar
+    o esquema duas vezes não custa nada.
+    """
+    if isinstance(esquema, str):
+        esquema = ESQUEMAS[esquema]
+
+    if obrigatorias:
+        faltando = [col for col in obrigatorias if col not in df.columns]
+        if faltando:
+            raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(faltando)}")
+
+    for col, tipo in esquema.items():
+        if col in df.columns and df[col].dtype != tipo:
+            df[col] = _converter_coluna(df[col], tipo)
+
+    return df
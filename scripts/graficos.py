@@ -1,7 +1,36 @@
-import plotly.express as px
+import importlib.util
+import sys
+
+import numpy as np
 import pandas as pd
 
+from instrumentacao import instrumentar
+
+
+def _importar_tardio(nome):
+    """
+    Módulo que só é executado no primeiro acesso a um atributo.
+
+    O plotly.express leva uma fração de segundo para importar; a abertura do
+    dashboard (sidebar, indicadores da Visão Geral) não depende dele.
+    """
+    if nome in sys.modules:
+        return sys.modules[nome]
+    spec = importlib.util.find_spec(nome)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nome] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+px = _importar_tardio('plotly.express')
+
+# Acima desse total de pontos o gráfico de linha usa traços WebGL (scattergl) em vez de SVG
+LIMITE_WEBGL = 5000
+
 # 📊 Gráfico de barras
+@instrumentar('graficos')
 def grafico_barras(df, eixo_x, eixo_y, hue=None, titulo="", text_auto=False, **kwargs):
     """
     Gera gráfico de barras com ou sem separação por hue (ex: sexo).
@@ -21,27 +50,124 @@ def grafico_barras(df, eixo_x, eixo_y, hue=None, titulo="", text_auto=False, **k
     return fig
 
 
+# 📉 Redução de pontos (séries longas)
+def _indices_lttb(x, y, pontos):
+    """
+    Índices escolhidos pelo Largest-Triangle-Three-Buckets.
+
+    Mantém o primeiro e o último ponto e, em cada balde intermediário, o
+    ponto que forma o maior triângulo com o ponto escolhido antes e a média
+    do balde seguinte (preserva picos e vales).
+    """
+    n = len(x)
+    if pontos >= n or pontos < 3:
+        return np.arange(n)
+
+    bordas = np.linspace(1, n - 1, pontos - 1).astype(np.int64)
+    indices = np.empty(pontos, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    anterior = 0
+    for i in range(pontos - 2):
+        inicio, fim = bordas[i], bordas[i + 1]
+        prox_inicio, prox_fim = (bordas[i + 1], bordas[i + 2]) if i + 2 < len(bordas) else (n - 1, n)
+        media_x, media_y = x[prox_inicio:prox_fim].mean(), y[prox_inicio:prox_fim].mean()
+
+        areas = np.abs((x[anterior] - media_x) * (y[inicio:fim] - y[anterior])
+                       - (x[anterior] - x[inicio:fim]) * (media_y - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        indices[i + 1] = anterior
+    return indices
+
+
+def _indices_minmax(y, pontos):
+    """Índices do mínimo e do máximo de cada balde (pontos / 2 baldes), mais as pontas"""
+    n = len(y)
+    if pontos >= n:
+        return np.arange(n)
+
+    baldes = max(pontos // 2, 1)
+    balde = np.arange(n) * baldes // n
+    ordem = np.lexsort((y, balde))  # por balde e, dentro dele, por valor
+    primeiros = np.searchsorted(balde[ordem], np.arange(baldes), side='left')
+    ultimos = np.searchsorted(balde[ordem], np.arange(baldes), side='right') - 1
+    return np.unique(np.concatenate([ordem[primeiros], ordem[ultimos], [0, n - 1]]))
+
+
+@instrumentar('graficos')
+def reduzir_pontos(df, eixo_x, eixo_y, hue=None, max_pontos=1000, metodo='lttb'):
+    """
+    Reduz cada série (uma por valor de hue) a no máximo ~max_pontos pontos.
+
+    Parâmetros:
+    - df: dados do gráfico
+    - eixo_x, eixo_y: colunas dos eixos (eixo_x numérico ou data)
+    - hue: coluna que separa as séries
+    - max_pontos: pontos mantidos por série
+    - metodo: 'lttb' (forma da curva) ou 'minmax' (mínimo e máximo de cada balde)
+
+    Retorna:
+    - DataFrame só com os pontos escolhidos (valores reais, não interpolados);
+      séries curtas passam inteiras
+    """
+    series = df.groupby(hue, observed=True, sort=False) if hue else [(None, df)]
+    partes = []
+    for _, serie in series:
+        if len(serie) <= max_pontos:
+            partes.append(serie)
+            continue
+
+        serie = serie[serie[eixo_y].notna()].sort_values(eixo_x)
+        y = serie[eixo_y].to_numpy(dtype=float)
+        if metodo == 'minmax':
+            indices = _indices_minmax(y, max_pontos)
+        else:
+            x = serie[eixo_x].to_numpy()
+            x = x.astype('datetime64[ns]').astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+            indices = _indices_lttb(x.astype(float), y, max_pontos)
+        partes.append(serie.iloc[indices])
+
+    if not partes:
+        return df
+    return pd.concat(partes)
+
+
 # 📈 Gráfico de linha
-def grafico_linha(df, eixo_x, eixo_y, hue=None, titulo="", text_auto=False, **kwargs):
+@instrumentar('graficos')
+def grafico_linha(df, eixo_x, eixo_y, hue=None, titulo="", text_auto=False,
+                  max_pontos=None, metodo='lttb', limite_webgl=LIMITE_WEBGL, **kwargs):
     """
     Gera gráfico de linha para evolução temporal, com ou sem hue.
+
+    Com max_pontos, séries longas são reduzidas no servidor (ver
+    reduzir_pontos) antes de irem para o navegador. Acima de limite_webgl
+    pontos no total, os traços são desenhados em WebGL.
     """
+    if max_pontos:
+        df = reduzir_pontos(df, eixo_x, eixo_y, hue=hue, max_pontos=max_pontos, metodo=metodo)
+    render_mode = 'webgl' if len(df) > limite_webgl else 'svg'
+
     if hue:
-        fig = px.line(df, x=eixo_x, y=eixo_y, color=hue, markers=True, title=titulo, **kwargs)
+        fig = px.line(df, x=eixo_x, y=eixo_y, color=hue, markers=True, title=titulo, render_mode=render_mode, **kwargs)
     else:
-        fig = px.line(df, x=eixo_x, y=eixo_y, markers=True, title=titulo)
+        fig = px.line(df, x=eixo_x, y=eixo_y, markers=True, title=titulo, render_mode=render_mode)
     
     fig.update_layout(xaxis_title=eixo_x, yaxis_title=eixo_y)
     return fig
 
 
 # 🪜 Gráfico de funil (etapas do funil de vendas ou marketing)
-def grafico_funil(df, coluna_etapa, titulo="Funil de Leads"):
+@instrumentar('graficos')
+def grafico_funil(df, coluna_etapa, titulo="Funil de Leads", coluna_quantidade=None):
     """
     Gera gráfico de funil com base nas etapas.
-    Espera uma coluna categórica indicando a etapa de cada lead.
+    Espera uma coluna categórica indicando a etapa de cada lead, ou, com
+    coluna_quantidade, uma linha por etapa já contada (ex: somas das coortes).
     """
-    funil = df[coluna_etapa].value_counts().reset_index()
+    if coluna_quantidade is None:
+        funil = df[coluna_etapa].value_counts().reset_index()
+    else:
+        funil = df[[coluna_etapa, coluna_quantidade]].reset_index(drop=True)
     funil.columns = ['Etapa', 'Quantidade']
 
     total = funil['Quantidade'].sum()
@@ -54,3 +180,13 @@ def grafico_funil(df, coluna_etapa, titulo="Funil de Leads"):
 
     fig = px.funnel(funil, x='Quantidade', y='Etapa', title=titulo, hover_data=['Percentual'])
     return fig
+
+
+# 🟩 Heatmap (ex: métrica por idade x sexo)
+@instrumentar('graficos')
+def grafico_heatmap(df, eixo_x, eixo_y, valor, titulo="", **kwargs):
+    """
+    Gera heatmap de densidade com a soma de 'valor' em cada célula eixo_x x eixo_y.
+    """
+    fig = px.density_heatmap(df, x=eixo_x, y=eixo_y, z=valor, title=titulo or None, **kwargs)
+    return fig
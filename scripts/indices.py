@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# ========================================== ÍNDICE DE FILTROS ==========================================
+
+class IndiceFiltro:
+    """
+    Índice montado uma vez por dataset para os filtros da sidebar.
+
+    - As linhas ficam ordenadas pela coluna de data, então o período vira
+      uma fatia contínua encontrada por busca binária (np.searchsorted).
+    - Linhas com nulo em alguma coluna filtrável (que nenhum filtro por essa
+      coluna aceita, como no isin) ficam num bloco à parte, no fim, também
+      ordenado pela data. Sem elas no meio, a seleção padrão é uma fatia.
+    - Cada coluna filtrável guarda os códigos de categoria por linha; a
+      seleção vira uma tabela booleana por categoria (o "bitmap" de cada
+      valor) aplicada só dentro da fatia do período.
+    - Colunas com todos os valores selecionados (o padrão da sidebar) nem
+      entram no filtro, e o resultado é uma fatia de df (sem cópia).
+    - Se o DataFrame já vem ordenado pela data e sem nulos nas colunas
+      filtráveis (ex: o cubo), o índice usa o próprio DataFrame. Do contrário,
+      use indice.df no lugar do original, para não guardar os dois.
+    """
+
+    def __init__(self, df, coluna_data, colunas):
+        datas = df[coluna_data].to_numpy()
+        completas = df[colunas].notna().all(axis=1).to_numpy()
+        if not completas.all() or (len(datas) > 1 and not (datas[1:] >= datas[:-1]).all()):
+            df = df.iloc[np.lexsort((datas, ~completas))]
+        self.df = df
+        self.coluna_data = coluna_data
+        self.datas = self.df[coluna_data].to_numpy()
+        # Linhas [0, completas) sem nulos; [completas, len(df)) com algum nulo
+        self.completas = int(completas.sum())
+
+        self.codigos = {}
+        self.categorias = {}
+        for col in colunas:
+            categorico = pd.Categorical(self.df[col])
+            self.codigos[col] = categorico.codes
+            self.categorias[col] = categorico.categories
+
+    def _fatia(self, inicio, fim, primeira, ultima):
+        """Posições [lo, hi) das linhas de [primeira, ultima) dentro do período"""
+        datas = self.datas[primeira:ultima]
+        return (primeira + np.searchsorted(datas, np.datetime64(pd.Timestamp(inicio), 'ns'), side='left'),
+                primeira + np.searchsorted(datas, np.datetime64(pd.Timestamp(fim), 'ns'), side='right'))
+
+    def fatia_periodo(self, inicio, fim):
+        """Posições [inicio, fim) das linhas sem nulos dentro do período (inclusivo nas duas pontas)"""
+        return self._fatia(inicio, fim, 0, self.completas)
+
+    def _mascara(self, lo, hi, selecoes, todas_validas):
+        """Linhas de [lo, hi) que passam pelas seleções, ou None se todas passam"""
+        mascara = None
+        for col, valores in selecoes.items():
+            selecionadas = self.categorias[col].isin(list(valores))
+            if selecionadas.all() and todas_validas:
+                continue
+
+            # Código -1 (valor nulo) cai na última posição, sempre False
+            tabela = np.append(selecionadas, False)
+            linhas = tabela[self.codigos[col][lo:hi]]
+            mascara = linhas if mascara is None else mascara & linhas
+        return mascara
+
+    def filtrar(self, inicio, fim, **selecoes):
+        """
+        Filtra pelo período e pelos valores selecionados em cada coluna.
+
+        Ex: indice.filtrar(inicio, fim, campanha=[...], sexo=[...])
+        """
+        lo, hi = self.fatia_periodo(inicio, fim)
+        mascara = self._mascara(lo, hi, selecoes, todas_validas=True)
+
+        # O bloco com nulos só tem o que devolver se alguma coluna não for filtrada
+        nulas = None
+        if self.completas < len(self.df) and not set(self.codigos) <= set(selecoes):
+            lo_nulas, hi_nulas = self._fatia(inicio, fim, self.completas, len(self.df))
+            mascara_nulas = self._mascara(lo_nulas, hi_nulas, selecoes, todas_validas=False)
+            nulas = (np.arange(lo_nulas, hi_nulas) if mascara_nulas is None
+                     else lo_nulas + np.flatnonzero(mascara_nulas))
+
+        if mascara is None and (nulas is None or not len(nulas)):
+            return self.df.iloc[lo:hi]
+        posicoes = np.arange(lo, hi) if mascara is None else lo + np.flatnonzero(mascara)
+        if nulas is not None:
+            posicoes = np.concatenate([posicoes, nulas])
+        return self.df.iloc[posicoes]
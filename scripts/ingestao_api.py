@@ -0,0 +1,394 @@
+"""
+Ingestão do Meta Ads e do CRM direto das APIs HTTP, sem exports intermediários.
+
+As páginas são buscadas em paralelo (asyncio + aiohttp) por uma sessão HTTP
+com pool de conexões, com limite de requisições simultâneas e novas
+tentativas com espera exponencial (429, 5xx e falhas de rede). Cada página
+vira linhas no formato dos exports brutos (data/raw); as linhas são juntadas
+em blocos de tamanho fixo e entregues, por uma fila limitada, ao mesmo
+tratamento/gravação de scripts/preprocessamento.py. A memória depende do
+tamanho do bloco e da fila, não do tamanho do export.
+
+- Meta Ads (insights): paginação por cursor ({"data": [...], "paging":
+  {"next": url}}). O período é dividido em um fluxo por dia, e os fluxos
+  correm em paralelo (cada um segue seus cursores em sequência).
+- CRM (leads): paginação numerada (?pagina=N&por_pagina=M), com várias
+  páginas em voo até aparecer uma página incompleta.
+
+Para testar, basta apontar as URLs para um servidor local que responda no
+mesmo formato.
+
+Uso (a partir da raiz do projeto):
+    python scripts/ingestao_api.py --ads-url https://graph.facebook.com/v19.0/act_123/insights \\
+        --inicio 2025-04-01 --fim 2025-04-30 --crm-url https://crm.exemplo.com/api/leads
+    python scripts/ingestao_api.py --incremental --ads-url ... --inicio 2025-05-01 --fim 2025-05-01
+"""
+import argparse
+import asyncio
+import json
+import os
+import queue
+import random
+import tempfile
+import threading
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+from data_processing import dividir
+from insights import gravar_insights
+from metadados import gravar_metadados
+from preprocessamento import LINHAS_POR_BLOCO, ingerir_crm, ingerir_metaads, processar_crm, processar_metaads
+
+CONCORRENCIA = 8
+POR_PAGINA = 500
+TENTATIVAS = 5
+ESPERA_BASE = 0.5
+
+# Blocos prontos aguardando gravação (limita a memória quando a API é mais rápida que o disco)
+BLOCOS_NA_FILA = 4
+
+# ========================================== FORMATO DOS EXPORTS ==========================================
+# Campo da API -> coluna do export bruto. Campos ausentes na resposta viram nulos.
+
+CAMPOS_ADS = {
+    'campaign_name': 'campanha',
+    'adset_name': 'conjunto_anuncio',
+    'ad_name': 'anuncio',
+    'impressions': 'impressoes',
+    'clicks': 'cliques',
+    'spend': 'gasto_total',
+    'conversions': 'conversões',
+    'purchase_value': 'Receita',
+    'date_start': 'data',
+}
+
+COLUNAS_ADS = ['campanha', 'conjunto_anuncio', 'anuncio', 'impressoes', 'cliques', 'gasto_total', 'ctr (%)',
+               'cpc (R$)', 'conversões', 'cpa (R$)', 'Receita', 'roas', 'data', 'dia_da_semana']
+
+COLUNAS_CRM = ['lead_id', 'nome', 'email', 'telefone', 'data_captura', 'campanha_origem', 'ad_clicked',
+               'canal_origem', 'etapa_funil', 'ultima_interacao', 'status', 'pontuacao', 'sale_id', 'data_venda',
+               'produto', 'valor_total', 'quantidade', 'meio_pagamento', 'status_pagamento', 'utm_source',
+               'utm_campaign', 'dias_para_conversao']
+
+DIAS_SEMANA = ['Segunda-feira', 'Terça-feira', 'Quarta-feira', 'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo']
+
+
+def _valor(campo):
+    """Valor numérico de um campo; listas de ações do Meta ([{'action_type', 'value'}]) são somadas"""
+    if isinstance(campo, list):
+        return sum(float(acao.get('value', 0)) for acao in campo)
+    return campo
+
+
+def linhas_ads(registros):
+    """Registros de insights da API -> DataFrame com as colunas do export bruto do Meta Ads"""
+    df = pd.DataFrame([{coluna: _valor(r.get(campo)) for campo, coluna in CAMPOS_ADS.items()} for r in registros])
+    for col in ['impressoes', 'cliques', 'gasto_total', 'conversões', 'Receita']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # Razões derivadas das somas, como no export (0 quando o denominador é zero)
+    def razao(numerador, denominador, escala=1):
+        return np.round(dividir(df[numerador], df[denominador], valor_vazio=0) * escala, 2)
+
+    df['ctr (%)'] = razao('cliques', 'impressoes', 100)
+    df['cpc (R$)'] = razao('gasto_total', 'cliques')
+    df['cpa (R$)'] = razao('gasto_total', 'conversões')
+    df['roas'] = razao('Receita', 'gasto_total')
+    df['dia_da_semana'] = pd.to_datetime(df['data']).dt.weekday.map(dict(enumerate(DIAS_SEMANA)))
+    return df[COLUNAS_ADS]
+
+
+def linhas_crm(registros):
+    """Registros de leads da API (uma linha por lead x venda, como o export) -> DataFrame do export bruto"""
+    return pd.DataFrame(registros).reindex(columns=COLUNAS_CRM)
+
+
+# ========================================== CLIENTE HTTP ==========================================
+
+class ClienteAPI:
+    """
+    Sessão HTTP compartilhada pelas buscas de uma ingestão.
+
+    O conector mantém as conexões abertas (keep-alive) e limita as conexões
+    simultâneas; o semáforo limita as requisições em voo, inclusive as que
+    estão esperando uma nova tentativa.
+    """
+
+    def __init__(self, concorrencia=CONCORRENCIA, tentativas=TENTATIVAS, espera_base=ESPERA_BASE,
+                 cabecalhos=None, tempo_limite=60):
+        self.concorrencia = concorrencia
+        self.tentativas = tentativas
+        self.espera_base = espera_base
+        self._cabecalhos = cabecalhos or {}
+        self._tempo_limite = tempo_limite
+        self._semaforo = asyncio.Semaphore(concorrencia)
+        self._sessao = None
+        self.requisicoes = 0
+        self.repeticoes = 0
+
+    async def __aenter__(self):
+        self._sessao = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concorrencia),
+            timeout=aiohttp.ClientTimeout(total=self._tempo_limite),
+            headers=self._cabecalhos,
+        )
+        return self
+
+    async def __aexit__(self, *erro):
+        await self._sessao.close()
+
+    def _espera(self, tentativa, resposta=None):
+        """Segundos até a próxima tentativa: Retry-After da resposta, ou exponencial com jitter"""
+        if resposta is not None and resposta.headers.get('Retry-After', '').isdigit():
+            return float(resposta.headers['Retry-After'])
+        return self.espera_base * 2 ** tentativa + random.uniform(0, self.espera_base)
+
+    async def buscar(self, url, params=None):
+        """GET de uma página JSON, com novas tentativas para 429, 5xx e falhas de rede"""
+        async with self._semaforo:
+            for tentativa in range(self.tentativas):
+                self.requisicoes += 1
+                try:
+                    async with self._sessao.get(url, params=params) as resposta:
+                        if resposta.status == 429 or resposta.status >= 500:
+                            erro = aiohttp.ClientResponseError(
+                                resposta.request_info, resposta.history, status=resposta.status)
+                            espera = self._espera(tentativa, resposta)
+                        else:
+                            resposta.raise_for_status()
+                            return await resposta.json()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as falha:
+                    erro = falha
+                    espera = self._espera(tentativa)
+
+                if tentativa + 1 < self.tentativas:
+                    self.repeticoes += 1
+                    await asyncio.sleep(espera)
+            raise erro
+
+
+# ========================================== PAGINAÇÃO ==========================================
+
+async def paginas_cursor(cliente, url, params):
+    """Registros de cada página seguindo paging.next (Graph API) até a última página"""
+    while url:
+        pagina = await cliente.buscar(url, params)
+        yield pagina.get('data', [])
+        url = pagina.get('paging', {}).get('next')
+        params = None  # o link 'next' já traz os parâmetros e o cursor
+
+
+async def paginas_numeradas(cliente, url, params, por_pagina=POR_PAGINA):
+    """
+    Registros de páginas numeradas, várias em voo ao mesmo tempo.
+
+    Mantém até 'concorrencia' páginas pedidas à frente e as entrega na
+    ordem; para na primeira página incompleta (as pedidas além dela são
+    canceladas).
+    """
+    pendentes = {}
+    pedida = 0
+
+    def pedir():
+        nonlocal pedida
+        pedida += 1
+        pagina_params = {**params, 'pagina': pedida, 'por_pagina': por_pagina}
+        pendentes[pedida] = asyncio.ensure_future(cliente.buscar(url, pagina_params))
+
+    try:
+        for _ in range(cliente.concorrencia):
+            pedir()
+        numero = 1
+        while True:
+            resposta = await pendentes.pop(numero)
+            registros = resposta.get('data', [])
+            yield registros
+            if len(registros) < por_pagina:
+                break
+            numero += 1
+            pedir()
+    finally:
+        for tarefa in pendentes.values():
+            tarefa.cancel()
+
+
+async def intercalar(fluxos, limite=CONCORRENCIA * 2):
+    """Junta vários geradores assíncronos de páginas em um só, na ordem em que as páginas chegam"""
+    fila = asyncio.Queue(maxsize=limite)
+    fim = object()
+
+    async def consumir(fluxo):
+        try:
+            async for item in fluxo:
+                await fila.put(item)
+        finally:
+            await fila.put(fim)
+
+    tarefas = [asyncio.ensure_future(consumir(fluxo)) for fluxo in fluxos]
+    ativos = len(tarefas)
+    try:
+        while ativos:
+            item = await fila.get()
+            if item is fim:
+                ativos -= 1
+                continue
+            yield item
+        for tarefa in tarefas:
+            await tarefa  # propaga erros dos fluxos
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+
+async def agrupar_em_blocos(paginas, converter, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Junta os registros das páginas em DataFrames de linhas_por_bloco linhas (índice contínuo)"""
+    registros = []
+    inicio = 0
+
+    def bloco(lote):
+        df = converter(lote)
+        df.index = pd.RangeIndex(inicio, inicio + len(df))
+        return df
+
+    async for pagina in paginas:
+        registros.extend(pagina)
+        while len(registros) >= linhas_por_bloco:
+            lote, registros = registros[:linhas_por_bloco], registros[linhas_por_bloco:]
+            yield bloco(lote)
+            inicio += len(lote)
+    if registros:
+        yield bloco(registros)
+
+
+# ========================================== FLUXOS POR DATASET ==========================================
+
+async def blocos_metaads(url, inicio, fim, token=None, linhas_por_bloco=LINHAS_POR_BLOCO, **opcoes):
+    """Insights do Meta Ads por anúncio e dia no período, um fluxo paginado por dia, em blocos do export bruto"""
+    parametros = {
+        'level': 'ad',
+        'time_increment': 1,
+        'fields': ','.join(CAMPOS_ADS),
+        'limit': opcoes.pop('por_pagina', POR_PAGINA),
+    }
+    if token:
+        parametros['access_token'] = token
+
+    async with ClienteAPI(**opcoes) as cliente:
+        dias = pd.date_range(inicio, fim, freq='D').strftime('%Y-%m-%d')
+        fluxos = [
+            paginas_cursor(cliente, url, {**parametros, 'time_range': json.dumps({'since': dia, 'until': dia})})
+            for dia in dias
+        ]
+        async for bloco in agrupar_em_blocos(intercalar(fluxos), linhas_ads, linhas_por_bloco):
+            yield bloco
+
+
+async def blocos_crm(url, token=None, desde=None, linhas_por_bloco=LINHAS_POR_BLOCO, **opcoes):
+    """Leads do CRM (opcionalmente só os atualizados desde uma data), em blocos do export bruto"""
+    por_pagina = opcoes.pop('por_pagina', POR_PAGINA)
+    cabecalhos = {'Authorization': f'Bearer {token}'} if token else None
+    parametros = {'atualizado_desde': str(desde)} if desde else {}
+
+    async with ClienteAPI(cabecalhos=cabecalhos, **opcoes) as cliente:
+        paginas = paginas_numeradas(cliente, url, parametros, por_pagina)
+        async for bloco in agrupar_em_blocos(paginas, linhas_crm, linhas_por_bloco):
+            yield bloco
+
+
+def iterar_blocos(criar_fluxo, fila_max=BLOCOS_NA_FILA):
+    """
+    Consome um fluxo assíncrono de blocos em um laço de eventos próprio
+    (thread) e entrega os blocos a código síncrono (preprocessamento).
+
+    A fila limitada segura a busca quando a gravação fica para trás.
+    """
+    fila = queue.Queue(maxsize=fila_max)
+    fim = object()
+
+    def rodar():
+        async def alimentar():
+            async for bloco in criar_fluxo():
+                await asyncio.to_thread(fila.put, bloco)
+        try:
+            asyncio.run(alimentar())
+            fila.put(fim)
+        except BaseException as erro:
+            fila.put(erro)
+
+    thread = threading.Thread(target=rodar, name='ingestao_api', daemon=True)
+    thread.start()
+    while True:
+        item = fila.get()
+        if item is fim:
+            break
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+    thread.join()
+
+
+def _gravar_delta_csv(blocos, caminho):
+    """Grava os blocos em um CSV no formato do export bruto, bloco a bloco"""
+    cabecalho = True
+    for bloco in blocos:
+        bloco.to_csv(caminho, mode='w' if cabecalho else 'a', header=cabecalho)
+        cabecalho = False
+    return not cabecalho
+
+
+# ========================================== LINHA DE COMANDO ==========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingere Meta Ads e CRM direto das APIs para data/tratados.")
+    parser.add_argument('--ads-url', help="endpoint de insights do Meta Ads (ex: .../act_<id>/insights)")
+    parser.add_argument('--inicio', help="primeiro dia dos insights (AAAA-MM-DD)")
+    parser.add_argument('--fim', help="último dia dos insights (AAAA-MM-DD)")
+    parser.add_argument('--crm-url', help="endpoint de leads do CRM")
+    parser.add_argument('--crm-desde', help="só leads atualizados desde esta data (parâmetro atualizado_desde)")
+    parser.add_argument('--saida', default='data/tratados', help="pasta de destino dos dados tratados")
+    parser.add_argument('--linhas-por-bloco', type=int, default=LINHAS_POR_BLOCO, help="linhas por bloco gravado")
+    parser.add_argument('--concorrencia', type=int, default=CONCORRENCIA, help="requisições simultâneas por API")
+    parser.add_argument('--por-pagina', type=int, default=POR_PAGINA, help="registros pedidos por página")
+    parser.add_argument('--tentativas', type=int, default=TENTATIVAS, help="tentativas por página (429, 5xx, rede)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="acrescenta aos dados tratados (como preprocessamento.py --incremental)")
+    args = parser.parse_args(argv)
+
+    opcoes = {'concorrencia': args.concorrencia, 'tentativas': args.tentativas, 'por_pagina': args.por_pagina}
+    os.makedirs(args.saida, exist_ok=True)
+
+    if args.ads_url:
+        if not (args.inicio and args.fim):
+            parser.error("--ads-url precisa de --inicio e --fim")
+        blocos = iterar_blocos(lambda: blocos_metaads(
+            args.ads_url, args.inicio, args.fim, os.environ.get('META_ACCESS_TOKEN'),
+            args.linhas_por_bloco, **opcoes))
+        if args.incremental:
+            linhas, ignoradas = ingerir_metaads(None, args.saida, blocos=blocos)
+            print(f"META ADS: {linhas} linhas ingeridas, {ignoradas} ignoradas (datas já gravadas)")
+        else:
+            print(f"META ADS: {processar_metaads(None, args.saida, blocos=blocos)} linhas tratadas")
+
+    if args.crm_url:
+        blocos = iterar_blocos(lambda: blocos_crm(
+            args.crm_url, os.environ.get('CRM_API_TOKEN'), args.crm_desde, args.linhas_por_bloco, **opcoes))
+        if args.incremental:
+            # O upsert por lead precisa de todos os lead_id do delta antes de
+            # retirar as versões antigas: o delta vai para um CSV temporário
+            # (em disco, bloco a bloco) e segue o caminho de --incremental
+            with tempfile.TemporaryDirectory() as pasta:
+                if _gravar_delta_csv(blocos, os.path.join(pasta, 'crm_sales_data.csv')):
+                    linhas, substituidas = ingerir_crm(pasta, args.saida, args.linhas_por_bloco)
+                    print(f"CRM: {linhas} linhas ingeridas, {substituidas} linhas antigas substituídas")
+        else:
+            print(f"CRM: {processar_crm(None, args.saida, blocos=blocos)} linhas tratadas")
+
+    if args.ads_url or args.crm_url:
+        print(f"INSIGHTS: {gravar_insights(args.saida)} achados")
+        print(f"METADADOS: {'gravados' if gravar_metadados(args.saida) else 'faltam tabelas-resumo'}")
+
+
+if __name__ == "__main__":
+    main()
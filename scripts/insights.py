@@ -0,0 +1,320 @@
+import json
+import os
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from esquema import PADRAO_PUBLICO
+
+# ========================================== MOTOR DE INSIGHTS ==========================================
+# Os achados da aba de Insights saem das tabelas-resumo gravadas pelo
+# pré-processamento (campanha_geral, campanha_publico, campanha_vendas,
+# canal_conversao e as séries diárias serie_ads/serie_crm). Essas tabelas são
+# somas mantidas a cada carga: a ingestão incremental só soma o delta, então
+# recalcular os achados custa o número de grupos (campanhas, canais, dias),
+# nunca o histórico de linhas. O resultado fica em insights.json, lido pela aba.
+
+ARQUIVO_INSIGHTS = 'insights.json'
+
+# Grupos com menos que isso não entram nas comparações (taxas instáveis)
+LEADS_MINIMOS = 10
+CLIQUES_MINIMOS = 100
+
+# Diferenças relativas mínimas para um achado (ex: 0.05 = 5% mais barato)
+DIFERENCA_CUSTO = 0.05
+DIFERENCA_CTR = 0.10
+# Campanha com CPA acima de (1 + isso) x a mediana das campanhas
+CPA_ACIMA_MEDIANA = 0.5
+# Tempo médio até a compra acima disso vira alerta
+DIAS_COMPRA_ALERTA = 7
+
+# Tendências: últimos DIAS_RECENTES dias contra os DIAS_BASE dias anteriores
+DIAS_RECENTES = 7
+DIAS_BASE = 28
+VARIACAO_TENDENCIA = 0.20
+Z_TENDENCIA = 3.0
+
+
+def _decimal(valor, casas=1):
+    return f"{valor:.{casas}f}".replace(".", ",")
+
+
+def _pct(valor, casas=1):
+    return _decimal(valor, casas) + "%"
+
+
+def _real(valor):
+    return f"R${valor:.2f}".replace(".", ",")
+
+
+def _razao(numerador, denominador):
+    """Razão elemento a elemento, NaN onde o denominador é zero"""
+    numerador = np.asarray(numerador, dtype='float64')
+    denominador = np.asarray(denominador, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominador != 0, numerador / denominador, np.nan)
+
+
+def _achado(nivel, categoria, texto, recomendacao=None, **dados):
+    """
+    Um achado da aba de Insights.
+
+    - nivel: 'success', 'info', 'warning' ou 'error' (a caixa do Streamlit usada)
+    - categoria: 'canal', 'campanha', 'publico', 'funil' ou 'tendencia'
+    - texto, recomendacao: markdown
+    - dados: valores usados no texto (grupo, métrica, valor...)
+    """
+    return {'nivel': nivel, 'categoria': categoria, 'texto': texto, 'recomendacao': recomendacao, **dados}
+
+
+# ========================================== ACHADOS ==========================================
+
+def achados_canais(canal):
+    """Canal com a maior e a menor taxa de conversão de leads em compras (canal_conversao)"""
+    canal = canal[canal['total_leads'] >= LEADS_MINIMOS]
+    if len(canal) < 2:
+        return []
+    taxa = pd.Series(_razao(canal['compraram'], canal['total_leads']) * 100, index=canal['canal_origem'])
+    melhor, pior = taxa.idxmax(), taxa.idxmin()
+
+    achados = [_achado(
+        'success', 'canal',
+        f"Canal **{melhor}** teve a maior taxa de conversão: **{_pct(taxa[melhor])}**.",
+        f"Investir mais em **{melhor}**, o canal com a maior conversão de leads em vendas.",
+        grupo=melhor, metrica='taxa_conversao (%)', valor=float(taxa[melhor]),
+    )]
+    if taxa[pior] < taxa[melhor] / 2:
+        achados.append(_achado(
+            'info', 'canal',
+            f"Canal **{pior}** converte só **{_pct(taxa[pior])}** dos leads (menos da metade de {melhor}).",
+            f"Rever a qualificação dos leads que chegam por **{pior}**.",
+            grupo=pior, metrica='taxa_conversao (%)', valor=float(taxa[pior]),
+        ))
+    return achados
+
+
+def achados_campanhas(geral, vendas):
+    """
+    Campanhas com CTR alto sem leads/vendas e campanhas com CPA muito acima da mediana.
+
+    - geral: campanha_geral (somas do Meta Ads por campanha)
+    - vendas: campanha_vendas (leads e vendas do CRM por campanha_origem)
+    """
+    achados = []
+    geral = geral[geral['cliques'] >= CLIQUES_MINIMOS].assign(
+        ctr=lambda df: _razao(df['cliques'], df['impressoes']) * 100,
+        cpa=lambda df: _razao(df['gasto_total'], df['conversões']),
+    )
+    if geral.empty:
+        return achados
+
+    leads = vendas.set_index('campanha_origem')['leads'] if vendas is not None else pd.Series(dtype='float64')
+    vendas_campanha = vendas.set_index('campanha_origem')['vendas'] if vendas is not None else pd.Series(dtype='float64')
+    mediana_ctr = geral['ctr'].median()
+    for linha in geral.itertuples():
+        sem_leads = leads.get(linha.campanha, 0) == 0
+        sem_vendas = vendas_campanha.get(linha.campanha, 0) == 0
+        if linha.ctr >= mediana_ctr and (sem_leads or sem_vendas):
+            falta = "vendas nem leads" if sem_leads else "vendas"
+            achados.append(_achado(
+                'warning', 'campanha',
+                f"Campanha **{linha.campanha}** tem CTR de **{_pct(linha.ctr, 2)}** (acima da mediana), "
+                f"porém não gera {falta}.",
+                f"Rever a campanha **{linha.campanha}** para gerar {'leads' if sem_leads else 'vendas'} "
+                f"(oferta, página de destino, formulário).",
+                grupo=linha.campanha, metrica='ctr (%)', valor=float(linha.ctr),
+            ))
+
+    mediana_cpa = geral['cpa'].median()
+    for linha in geral[geral['cpa'] > mediana_cpa * (1 + CPA_ACIMA_MEDIANA)].itertuples():
+        achados.append(_achado(
+            'warning', 'campanha',
+            f"CPA da campanha **{linha.campanha}** ({_real(linha.cpa)}) está "
+            f"**{_pct((linha.cpa / mediana_cpa - 1) * 100, 0)}** acima da mediana das campanhas ({_real(mediana_cpa)}).",
+            f"Revisar segmentação e criativos da campanha **{linha.campanha}** ou realocar verba.",
+            grupo=linha.campanha, metrica='cpa (R$)', valor=float(linha.cpa),
+        ))
+    return achados
+
+
+def achados_publico(publico):
+    """Diferença de custo por gênero e faixa etária com o maior CTR (campanha_publico)"""
+    achados = []
+    partes = publico['conjunto_anuncio'].astype(str).str.extract(PADRAO_PUBLICO)
+    publico = publico.assign(sexo=partes['sexo'], idade=partes['idade'])
+
+    sexo = publico.groupby('sexo')[['impressoes', 'cliques', 'gasto_total', 'conversões']].sum()
+    sexo = sexo[sexo['cliques'] >= CLIQUES_MINIMOS]
+    if len(sexo) >= 2:
+        cpa = pd.Series(_razao(sexo['gasto_total'], sexo['conversões']), index=sexo.index).dropna()
+        cpc = pd.Series(_razao(sexo['gasto_total'], sexo['cliques']), index=sexo.index)
+        if len(cpa) >= 2 and cpa.min() <= cpa.max() * (1 - DIFERENCA_CUSTO):
+            barato, caro = cpa.idxmin(), cpa.idxmax()
+            achados.append(_achado(
+                'info', 'publico',
+                f"Atrair **{barato}** custa **{_pct((1 - cpa[barato] / cpa[caro]) * 100, 0)} menos** por conversão "
+                f"(CPA {_real(cpa[barato])} contra {_real(cpa[caro])} para {caro}; "
+                f"CPC {_real(cpc[barato])} contra {_real(cpc[caro])}).",
+                f"Segmentar anúncios para **{barato}**, público com custo por conversão mais baixo.",
+                grupo=barato, metrica='cpa (R$)', valor=float(cpa[barato]),
+            ))
+
+    idade = publico.groupby('idade')[['impressoes', 'cliques']].sum()
+    idade = idade[idade['cliques'] >= CLIQUES_MINIMOS]
+    if len(idade) >= 2:
+        ctr = pd.Series(_razao(idade['cliques'], idade['impressoes']) * 100, index=idade.index)
+        melhor, mediana = ctr.idxmax(), ctr.median()
+        if ctr[melhor] >= mediana * (1 + DIFERENCA_CTR):
+            achados.append(_achado(
+                'info', 'publico',
+                f"A faixa **{melhor}** tem o maior CTR: **{_pct(ctr[melhor], 2)}** (mediana das faixas: {_pct(mediana, 2)}).",
+                f"Priorizar criativos para a faixa **{melhor}**.",
+                grupo=melhor, metrica='ctr (%)', valor=float(ctr[melhor]),
+            ))
+    return achados
+
+
+def achados_funil(serie_crm):
+    """Tempo médio entre a captura e a compra (soma e contagem mantidas em serie_crm)"""
+    convertidos = serie_crm['convertidos'].sum()
+    if not convertidos:
+        return []
+    dias = serie_crm['dias_para_conversao'].sum() / convertidos
+    if dias > DIAS_COMPRA_ALERTA:
+        return [_achado(
+            'warning', 'funil',
+            f"Tempo médio até a compra está elevado: **{dias:.0f} dias**.",
+            "Criar uma régua de reengajamento para leads parados há mais de uma semana.",
+            metrica='dias_para_conversao', valor=float(dias),
+        )]
+    return [_achado('info', 'funil', f"Tempo médio até a compra: **{dias:.0f} dias**.",
+                    metrica='dias_para_conversao', valor=float(dias))]
+
+
+def _janelas(datas):
+    """Máscaras (recente, base) das duas janelas que terminam no último dia da série"""
+    datas = pd.to_datetime(datas)
+    fim = datas.max()
+    recente = datas > fim - pd.Timedelta(days=DIAS_RECENTES)
+    base = ~recente & (datas > fim - pd.Timedelta(days=DIAS_RECENTES + DIAS_BASE))
+    return recente.to_numpy(), base.to_numpy()
+
+
+def achados_tendencias(serie_ads, serie_crm):
+    """
+    Quebras de tendência: últimos DIAS_RECENTES dias contra os DIAS_BASE anteriores.
+
+    - CTR por campanha: teste z de duas proporções (cliques / impressões)
+    - leads por canal: taxa diária comparada pela aproximação normal da Poisson
+    Só entram variações de pelo menos VARIACAO_TENDENCIA com |z| >= Z_TENDENCIA.
+    """
+    achados = []
+    if serie_ads is not None and not serie_ads.empty:
+        recente, base = _janelas(serie_ads['data'])
+        janelas = pd.DataFrame({
+            'campanha': serie_ads['campanha'],
+            'janela': np.where(recente, 'recente', np.where(base, 'base', '')),
+            'cliques': serie_ads['cliques'],
+            'impressoes': serie_ads['impressoes'],
+        })
+        somas = janelas[janelas['janela'] != ''].pivot_table(
+            index='campanha', columns='janela', values=['cliques', 'impressoes'], aggfunc='sum', fill_value=0)
+        if {'recente', 'base'} <= set(somas.columns.get_level_values(1)):
+            for campanha, linha in somas.iterrows():
+                c1, n1 = linha[('cliques', 'recente')], linha[('impressoes', 'recente')]
+                c0, n0 = linha[('cliques', 'base')], linha[('impressoes', 'base')]
+                if min(c1, c0) < CLIQUES_MINIMOS:
+                    continue
+                p1, p0, p = c1 / n1, c0 / n0, (c1 + c0) / (n1 + n0)
+                z = (p1 - p0) / np.sqrt(p * (1 - p) * (1 / n1 + 1 / n0))
+                variacao = p1 / p0 - 1
+                if abs(variacao) >= VARIACAO_TENDENCIA and abs(z) >= Z_TENDENCIA:
+                    achados.append(_achado(
+                        'warning' if variacao < 0 else 'success', 'tendencia',
+                        f"CTR da campanha **{campanha}** {'caiu' if variacao < 0 else 'subiu'} "
+                        f"**{_pct(abs(variacao) * 100, 0)}** nos últimos {DIAS_RECENTES} dias "
+                        f"({_pct(p1 * 100, 2)} contra {_pct(p0 * 100, 2)} nos {DIAS_BASE} dias anteriores).",
+                        f"Trocar os criativos da campanha **{campanha}** (sinal de fadiga)." if variacao < 0 else None,
+                        grupo=campanha, metrica='ctr (%)', valor=float(p1 * 100), variacao=float(variacao),
+                    ))
+
+    if serie_crm is not None and not serie_crm.empty:
+        recente, base = _janelas(serie_crm['data_captura'])
+        canal = serie_crm['canal_origem']
+        leads_recentes = serie_crm['leads'][recente].groupby(canal[recente]).sum()
+        leads_base = serie_crm['leads'][base].groupby(canal[base]).sum()
+        for nome in leads_recentes.index.union(leads_base.index):
+            atual, anterior = leads_recentes.get(nome, 0), leads_base.get(nome, 0)
+            esperado = anterior * DIAS_RECENTES / DIAS_BASE
+            if esperado < LEADS_MINIMOS:
+                continue
+            z = (atual - esperado) / np.sqrt(esperado)
+            variacao = atual / esperado - 1
+            if abs(variacao) >= VARIACAO_TENDENCIA and abs(z) >= Z_TENDENCIA:
+                achados.append(_achado(
+                    'warning' if variacao < 0 else 'success', 'tendencia',
+                    f"Leads do canal **{nome}** {'caíram' if variacao < 0 else 'subiram'} "
+                    f"**{_pct(abs(variacao) * 100, 0)}** nos últimos {DIAS_RECENTES} dias "
+                    f"({_decimal(atual / DIAS_RECENTES)} por dia contra {_decimal(anterior / DIAS_BASE)} antes).",
+                    f"Verificar o que mudou na captação por **{nome}**." if variacao < 0 else None,
+                    grupo=nome, metrica='leads', valor=float(atual), variacao=float(variacao),
+                ))
+    return achados
+
+
+# ========================================== GERAÇÃO E LEITURA ==========================================
+
+def ler_resumo(pasta, nome):
+    """Tabela-resumo gravada (<nome>.csv) sem a coluna de índice, ou None se não existir"""
+    caminho = os.path.join(pasta, f'{nome}.csv')
+    if not os.path.exists(caminho):
+        return None
+    df = pd.read_csv(caminho)
+    return df.drop(columns=[c for c in df.columns if c.startswith('Unnamed')])
+
+
+def gerar_insights(pasta):
+    """
+    Achados calculados das tabelas-resumo de uma pasta de dados tratados.
+
+    Resumos ausentes (ex: séries diárias de uma pasta gerada antes delas)
+    só deixam de gerar os achados que dependem deles.
+
+    Retorna:
+    - {'gerado_em': data/hora ISO, 'achados': [dicts de _achado]}
+    """
+    resumos = {nome: ler_resumo(pasta, nome) for nome in
+               ['campanha_geral', 'campanha_publico', 'campanha_vendas', 'canal_conversao', 'serie_ads', 'serie_crm']}
+
+    achados = []
+    if resumos['canal_conversao'] is not None:
+        achados += achados_canais(resumos['canal_conversao'])
+    if resumos['campanha_geral'] is not None:
+        achados += achados_campanhas(resumos['campanha_geral'], resumos['campanha_vendas'])
+    if resumos['campanha_publico'] is not None:
+        achados += achados_publico(resumos['campanha_publico'])
+    if resumos['serie_crm'] is not None:
+        achados += achados_funil(resumos['serie_crm'])
+    achados += achados_tendencias(resumos['serie_ads'], resumos['serie_crm'])
+    return {'gerado_em': datetime.now().isoformat(timespec='seconds'), 'achados': achados}
+
+
+def gravar_insights(pasta):
+    """Gera os achados e grava <pasta>/insights.json (gravação atômica); retorna a quantidade de achados"""
+    insights = gerar_insights(pasta)
+    descritor, temporario = tempfile.mkstemp(dir=pasta, suffix='.tmp')
+    with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+        json.dump(insights, arquivo, ensure_ascii=False, indent=1)
+    os.replace(temporario, os.path.join(pasta, ARQUIVO_INSIGHTS))
+    return len(insights['achados'])
+
+
+def ler_insights(pasta):
+    """Achados gravados em <pasta>/insights.json, ou None se ainda não existirem"""
+    caminho = os.path.join(pasta, ARQUIVO_INSIGHTS)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
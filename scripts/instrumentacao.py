@@ -0,0 +1,181 @@
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+# ========================================== INSTRUMENTAÇÃO ==========================================
+# Medição opcional de tempo, linhas e memória por execução do dashboard.
+# As funções marcadas com @instrumentar e os blocos com `with medir(...)` só
+# registram alguma coisa quando há um coletor ativo no contexto atual (o
+# painel de desempenho ligado); sem coletor, o custo é uma consulta a uma
+# ContextVar por chamada.
+
+_coletor_ativo = ContextVar('coletor_desempenho', default=None)
+
+
+def _memoria_mb():
+    """Memória residente do processo em MB (Linux), ou None onde não dá para medir barato"""
+    try:
+        with open('/proc/self/statm') as arquivo:
+            paginas = int(arquivo.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def contar_linhas(*valores):
+    """Total de linhas dos DataFrames/Series/arrays entre os valores (None se não houver nenhum)"""
+    total = None
+    for valor in valores:
+        if isinstance(valor, tuple):
+            valor = contar_linhas(*valor)
+        elif isinstance(valor, (pd.DataFrame, pd.Series, np.ndarray)):
+            valor = len(valor)
+        else:
+            continue
+        if valor is not None:
+            total = (total or 0) + valor
+    return total
+
+
+class Coletor:
+    """
+    Registros de desempenho das últimas execuções de uma sessão.
+
+    Cada execução (rerun completo ou de um fragmento) guarda uma lista de
+    registros: nome, seção, nível de aninhamento, tempo, linhas de entrada
+    e saída e variação da memória residente. A memória é a do processo
+    inteiro, então com várias sessões simultâneas a variação é aproximada.
+    """
+
+    def __init__(self, max_execucoes=20, arquivo_jsonl=None):
+        self.execucoes = deque(maxlen=max_execucoes)
+        self.arquivo_jsonl = arquivo_jsonl
+        self._contador = 0
+        self._nivel = 0
+
+    def nova_execucao(self, tipo='rerun', **info):
+        """Abre uma execução; os registros seguintes entram nela"""
+        self._contador += 1
+        self._nivel = 0
+        self.execucoes.append({
+            'execucao': self._contador,
+            'tipo': tipo,
+            'inicio': datetime.now().isoformat(timespec='milliseconds'),
+            **info,
+            'registros': [],
+        })
+
+    def registrar(self, registro):
+        if not self.execucoes:
+            self.nova_execucao()
+        self.execucoes[-1]['registros'].append(registro)
+
+    def ultima(self):
+        """Registros da última execução como DataFrame"""
+        if not self.execucoes:
+            return pd.DataFrame()
+        return pd.DataFrame(self.execucoes[-1]['registros'])
+
+    def linhas_jsonl(self, execucoes=None):
+        """Uma linha JSON por registro, com os dados da execução em cada linha"""
+        for execucao in execucoes if execucoes is not None else self.execucoes:
+            info = {chave: valor for chave, valor in execucao.items() if chave != 'registros'}
+            for registro in execucao['registros']:
+                yield json.dumps({**info, **registro}, ensure_ascii=False, default=str)
+
+    def jsonl(self):
+        """Todas as execuções guardadas em JSON lines (para exportação)"""
+        return "\n".join(self.linhas_jsonl()) + "\n"
+
+    def gravar_ultima(self):
+        """Acrescenta a última execução ao arquivo JSONL configurado (pipeline de logs)"""
+        if self.arquivo_jsonl and self.execucoes:
+            with open(self.arquivo_jsonl, 'a', encoding='utf-8') as arquivo:
+                for linha in self.linhas_jsonl([self.execucoes[-1]]):
+                    arquivo.write(linha + "\n")
+
+
+# ========================================== ATIVAÇÃO ==========================================
+
+def ativar(coletor, tipo='rerun', **info):
+    """Ativa o coletor no contexto atual e abre uma execução (None desativa a coleta)"""
+    if coletor is not None:
+        coletor.nova_execucao(tipo, **info)
+    _coletor_ativo.set(coletor)
+
+
+def desativar():
+    """Encerra a coleta no contexto atual, gravando a execução no JSONL se configurado"""
+    coletor = _coletor_ativo.get()
+    if coletor is not None:
+        coletor.gravar_ultima()
+    _coletor_ativo.set(None)
+
+
+def coletor_ativo():
+    return _coletor_ativo.get()
+
+
+# ========================================== MEDIÇÃO ==========================================
+
+@contextmanager
+def medir(nome, secao='bloco', linhas_entrada=None):
+    """
+    Mede um bloco de código no coletor ativo.
+
+    O dict devolvido pode receber 'linhas_saida' (e outros campos) dentro do
+    bloco. Sem coletor ativo, não mede nada.
+
+    Ex:
+        with medir('aba Campanhas', 'aba') as registro:
+            ...
+    """
+    coletor = _coletor_ativo.get()
+    registro = {'nome': nome, 'secao': secao, 'linhas_entrada': linhas_entrada, 'linhas_saida': None}
+    if coletor is None:
+        yield registro
+        return
+
+    # Registrado já na entrada: blocos externos aparecem antes dos internos
+    registro['nivel'] = coletor._nivel
+    coletor.registrar(registro)
+    coletor._nivel += 1
+    memoria = _memoria_mb()
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    finally:
+        registro['tempo_ms'] = (time.perf_counter() - inicio) * 1000
+        depois = _memoria_mb()
+        registro['memoria_delta_mb'] = None if memoria is None or depois is None else depois - memoria
+        coletor._nivel -= 1
+
+
+def instrumentar(secao):
+    """
+    Decorador que mede cada chamada da função no coletor ativo.
+
+    Linhas de entrada são as dos DataFrames/Series passados como argumento;
+    linhas de saída, as do resultado (ou dos DataFrames de uma tupla).
+    """
+    def decorador(funcao):
+        @wraps(funcao)
+        def instrumentada(*args, **kwargs):
+            if _coletor_ativo.get() is None:
+                return funcao(*args, **kwargs)
+
+            entrada = contar_linhas(*args, *kwargs.values())
+            with medir(funcao.__name__, secao, entrada) as registro:
+                resultado = funcao(*args, **kwargs)
+                registro['linhas_saida'] = contar_linhas(resultado)
+            return resultado
+        return instrumentada
+    return decorador
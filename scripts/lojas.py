@@ -0,0 +1,197 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# ========================================== DATASETS POR LOJA ==========================================
+# Cada loja tem seus próprios dados tratados (Meta Ads + CRM) e, montados a
+# partir deles, o cubo, os índices de filtro e as contagens distintas. O
+# gerenciador carrega uma loja só quando ela é escolhida no dashboard, mede
+# quanto ela ocupa na memória e, acima do orçamento, descarta as lojas usadas
+# há mais tempo.
+
+
+def tamanho_em_memoria(objeto, vistos=None):
+    """
+    Bytes aproximados de um objeto montado para o dashboard.
+
+    Percorre DataFrames, índices, arrays e os atributos de objetos como
+    IndiceFiltro e ContagemDistinta, contando cada objeto uma vez. Arrays que
+    são visões de outro array (ex: a coluna de datas de um índice) não contam:
+    a memória já é contada no dono.
+    """
+    if vistos is None:
+        vistos = set()
+    if id(objeto) in vistos:
+        return 0
+    vistos.add(id(objeto))
+
+    if isinstance(objeto, pd.DataFrame):
+        return int(objeto.memory_usage(index=True, deep=True).sum())
+    if isinstance(objeto, (pd.Series, pd.Index)):
+        return int(objeto.memory_usage(deep=True))
+    if isinstance(objeto, pd.Categorical):
+        return int(objeto.nbytes)
+    if isinstance(objeto, np.ndarray):
+        return 0 if objeto.base is not None else int(objeto.nbytes)
+    if isinstance(objeto, dict):
+        return sum(tamanho_em_memoria(valor, vistos) for valor in objeto.values())
+    if isinstance(objeto, (list, tuple)):
+        return sum(tamanho_em_memoria(valor, vistos) for valor in objeto)
+    if hasattr(objeto, '__dict__'):
+        return tamanho_em_memoria(vars(objeto), vistos)
+    return sys.getsizeof(objeto)
+
+
+class DatasetLoja:
+    """
+    Objetos montados para uma loja (ver utils.montar_dataset_loja), acessados por nome.
+
+    Ex: dados['cubo_ads'], dados['indice_crm']
+    """
+
+    def __init__(self, loja, versao, objetos, segundos_carga):
+        self.loja = loja
+        self.versao = versao
+        self.objetos = objetos
+        self.segundos_carga = segundos_carga
+        self.bytes = tamanho_em_memoria(objetos)
+
+    def __getitem__(self, nome):
+        return self.objetos[nome]
+
+
+class GerenciadorLojas:
+    """
+    Datasets das lojas carregados sob demanda, com orçamento de memória e despejo LRU.
+
+    - listar(): {nome da loja: pasta com os dados tratados}; relida a cada
+      ttl segundos, para lojas criadas (ou removidas) com o app no ar
+      aparecerem sem reiniciar o processo
+    - montar(pasta): lê os dados de uma pasta e devolve {nome: objeto}
+    - versao(pasta): versão dos arquivos no disco; quando muda, a loja é
+      recarregada na próxima consulta
+    - orcamento_mb: acima disso, as lojas usadas há mais tempo são
+      descartadas (a loja pedida fica sempre, mesmo se sozinha passar do
+      orçamento)
+
+    Sessões que ainda estão usando uma loja descartada mantêm os objetos até
+    o fim do rerun; a memória volta quando a última referência some.
+    """
+
+    def __init__(self, listar, montar, versao, orcamento_mb=2048, ttl=30):
+        self.listar = listar
+        self.ttl = ttl
+        self._lojas = None
+        self._listadas_em = 0.0
+        self.montar = montar
+        self.versao = versao
+        self.orcamento = int(orcamento_mb * 2 ** 20)
+        self._residentes = OrderedDict()
+        self._tamanhos = {}
+        self._lock = threading.Lock()
+        self._carregando = {}
+        self.acertos = 0
+        self.cargas = 0
+        self.recargas = 0
+        self.despejos = 0
+        self.segundos_carga = 0.0
+
+    def _listar(self, forcar=False):
+        """Lojas no disco, relidas se a última listagem passou do ttl (ou se forcar)"""
+        agora = time.monotonic()
+        with self._lock:
+            if not forcar and self._lojas is not None and agora - self._listadas_em < self.ttl:
+                return self._lojas
+        lojas = dict(self.listar())
+        with self._lock:
+            self._lojas, self._listadas_em = lojas, agora
+        return lojas
+
+    @property
+    def lojas(self):
+        """{loja: pasta} das lojas disponíveis (ver listar/ttl)"""
+        return self._listar()
+
+    def _residente(self, loja, versao):
+        """Dataset já carregado na versão atual, marcado como usado agora (chamado com o lock)"""
+        dados = self._residentes.get(loja)
+        if dados is None or dados.versao != versao:
+            return None
+        self._residentes.move_to_end(loja)
+        self.acertos += 1
+        return dados
+
+    def _liberar(self, necessario, manter=None):
+        """Descarta as lojas menos usadas até caber 'necessario' bytes no orçamento (chamado com o lock)"""
+        ocupado = sum(dados.bytes for dados in self._residentes.values())
+        for loja in list(self._residentes):
+            if ocupado + necessario <= self.orcamento:
+                break
+            if loja == manter:
+                continue
+            ocupado -= self._residentes.pop(loja).bytes
+            self.despejos += 1
+
+    def obter(self, loja):
+        """
+        Dataset da loja, carregando (e liberando espaço) se ainda não estiver na memória.
+
+        Várias sessões pedindo a mesma loja ao mesmo tempo esperam uma única carga.
+        """
+        lojas = self.lojas
+        if loja not in lojas:
+            # Loja criada depois da última listagem: relista antes de recusar
+            lojas = self._listar(forcar=True)
+        if loja not in lojas:
+            raise ValueError(f"Loja desconhecida: {loja!r} (disponíveis: {', '.join(lojas)})")
+        pasta = lojas[loja]
+        versao = self.versao(pasta)
+
+        with self._lock:
+            dados = self._residente(loja, versao)
+            if dados is not None:
+                return dados
+            trava = self._carregando.setdefault(loja, threading.Lock())
+
+        with trava:
+            with self._lock:
+                dados = self._residente(loja, versao)
+                if dados is not None:
+                    return dados
+                # Versão antiga sai antes da carga; abre espaço pelo último tamanho conhecido da loja
+                recarga = self._residentes.pop(loja, None) is not None
+                self._liberar(self._tamanhos.get(loja, 0))
+
+            inicio = time.perf_counter()
+            objetos = self.montar(pasta)
+            dados = DatasetLoja(loja, versao, objetos, time.perf_counter() - inicio)
+
+            with self._lock:
+                self._residentes[loja] = dados
+                self._tamanhos[loja] = dados.bytes
+                self.cargas += 1
+                self.recargas += recarga
+                self.segundos_carga += dados.segundos_carga
+                self._liberar(0, manter=loja)
+        return dados
+
+    def estatisticas(self):
+        """Lojas na memória, uso do orçamento e contadores de cargas e despejos"""
+        lojas = self.lojas
+        with self._lock:
+            return {
+                'lojas': len(lojas),
+                'residentes': list(self._residentes),
+                'memoria_mb': sum(dados.bytes for dados in self._residentes.values()) / 2 ** 20,
+                'orcamento_mb': self.orcamento / 2 ** 20,
+                'tamanhos_mb': {loja: tamanho / 2 ** 20 for loja, tamanho in self._tamanhos.items()},
+                'acertos': self.acertos,
+                'cargas': self.cargas,
+                'recargas': self.recargas,
+                'despejos': self.despejos,
+                'segundos_carga': self.segundos_carga,
+            }
@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+
+from esquema import PADRAO_PUBLICO
+from insights import ler_resumo
+
+# ========================================== METADADOS DOS FILTROS ==========================================
+# Valores possíveis de cada filtro da sidebar e o período coberto pelos dados,
+# gravados pelo pré-processamento em metadados.json ao lado dos dados tratados.
+# Saem das tabelas-resumo (mantidas a cada carga, inclusive incremental), então
+# o dashboard desenha a sidebar sem ler nem varrer os datasets.
+
+ARQUIVO_METADADOS = 'metadados.json'
+
+
+def _valores(serie):
+    """Valores distintos não nulos de uma coluna, em ordem alfabética"""
+    return sorted(str(valor) for valor in pd.Series(serie).dropna().unique())
+
+
+def _limites(*datas):
+    """Menor e maior data ('AAAA-MM-DD') de várias colunas de datas, ou None se não houver nenhuma"""
+    datas = pd.concat([pd.to_datetime(pd.Series(coluna), errors='coerce') for coluna in datas]).dropna()
+    if datas.empty:
+        return None
+    return [datas.min().strftime('%Y-%m-%d'), datas.max().strftime('%Y-%m-%d')]
+
+
+def gerar_metadados(pasta):
+    """
+    Domínios dos filtros e período dos dados de uma pasta, calculados das tabelas-resumo.
+
+    Retorna:
+    - {'gerado_em', 'dominios': {coluna: valores}, 'datas': [início, fim]},
+      ou None se faltar algum resumo (pasta gerada antes das séries diárias)
+    """
+    resumos = {nome: ler_resumo(pasta, nome) for nome in
+               ['campanha_geral', 'campanha_publico', 'canal_conversao', 'campanha_vendas', 'serie_ads', 'serie_crm']}
+    if any(resumo is None for resumo in resumos.values()):
+        return None
+
+    publico = resumos['campanha_publico']['conjunto_anuncio'].astype(str).str.extract(PADRAO_PUBLICO)
+    return {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'dominios': {
+            'campanha': _valores(resumos['campanha_geral']['campanha']),
+            'sexo': _valores(publico['sexo']),
+            'idade': _valores(publico['idade']),
+            'canal_origem': _valores(resumos['canal_conversao']['canal_origem']),
+            'campanha_origem': _valores(resumos['campanha_vendas']['campanha_origem']),
+        },
+        'datas': _limites(resumos['serie_ads']['data'], resumos['serie_crm']['data_captura']),
+    }
+
+
+def metadados_dataset(cubo_ads, df_crm):
+    """
+    Os mesmos metadados de gerar_metadados, calculados dos dados já carregados.
+
+    Usado quando a pasta não tem metadados.json: a varredura acontece uma vez
+    por carga da loja, não a cada sessão.
+    """
+    return {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'dominios': {
+            **{coluna: _valores(cubo_ads[coluna]) if coluna in cubo_ads else []
+               for coluna in ['campanha', 'sexo', 'idade']},
+            **{coluna: _valores(df_crm[coluna]) if coluna in df_crm else []
+               for coluna in ['canal_origem', 'campanha_origem']},
+        },
+        'datas': _limites(cubo_ads['data'] if 'data' in cubo_ads else [],
+                          df_crm['data_captura'] if 'data_captura' in df_crm else []),
+    }
+
+
+def gravar_metadados(pasta):
+    """Gera e grava <pasta>/metadados.json (gravação atômica); retorna False se faltar algum resumo"""
+    metadados = gerar_metadados(pasta)
+    if metadados is None:
+        return False
+    descritor, temporario = tempfile.mkstemp(dir=pasta, suffix='.tmp')
+    with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+        json.dump(metadados, arquivo, ensure_ascii=False, indent=1)
+    os.replace(temporario, os.path.join(pasta, ARQUIVO_METADADOS))
+    return True
+
+
+def ler_metadados(pasta):
+    """Metadados gravados em <pasta>/metadados.json, ou None se ainda não existirem"""
+    caminho = os.path.join(pasta, ARQUIVO_METADADOS)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
@@ -0,0 +1,935 @@
+"""
+Pré-processamento dos exports brutos (data/raw) para os dados tratados (data/tratados).
+
+Substitui as etapas de tratamento e de gravação de notebooks/pre_processing.ipynb.
+Os CSVs brutos são lidos em blocos de tamanho fixo: cada bloco é tratado,
+anexado aos arquivos de saída (CSV e Parquet) e somado às tabelas-resumo,
+então a memória usada não depende do tamanho do arquivo.
+
+Com --incremental, a pasta de entrada traz só o delta (novos dias do Meta
+Ads, leads novos ou atualizados do CRM), que é acrescentado aos dados e às
+tabelas-resumo já gravados sem reprocessar o histórico.
+
+No fim, os achados da aba de Insights (insights.json, ver insights.py) e os
+metadados dos filtros da sidebar (metadados.json, ver metadados.py) são
+recalculados das tabelas-resumo atualizadas.
+
+Uso:
+    python scripts/preprocessamento.py
+    python scripts/preprocessamento.py --entrada data/raw --saida data/tratados --linhas-por-bloco 200000
+    python scripts/preprocessamento.py --processos 0
+    python scripts/preprocessamento.py --incremental --entrada data/delta/2025-05-01
+"""
+import argparse
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from coortes import resumir_coortes
+from esquema import ESQUEMA_ADS, ESQUEMA_CRM, PADRAO_PUBLICO
+from insights import gravar_insights
+from metadados import gravar_metadados
+
+LINHAS_POR_BLOCO = 100_000
+
+MEDIDAS_ADS = ['impressoes', 'cliques', 'gasto_total', 'conversões']
+
+
+# ========================================== TRATAMENTO DOS BLOCOS ==========================================
+
+def separar_publico(serie, tabela):
+    """
+    Separa 'conjunto_anuncio' em sexo e idade usando uma tabela de consulta.
+
+    A regex só roda para valores ainda não vistos (poucas dezenas no total);
+    cada linha é resolvida pelo código do valor.
+
+    Parâmetros:
+    - serie: coluna conjunto_anuncio do bloco
+    - tabela: dict conjunto_anuncio -> (sexo, idade), atualizado in place
+
+    Retorna:
+    - (sexo, idade) como arrays alinhados à série
+    """
+    codigos, valores = pd.factorize(serie)
+    novos = [v for v in valores if v not in tabela]
+    if novos:
+        extraido = pd.Series(novos, dtype=object).str.extract(PADRAO_PUBLICO)
+        tabela.update(zip(novos, zip(extraido['sexo'], extraido['idade'])))
+
+    # Código -1 (valor nulo) cai na última posição, sempre nula
+    sexos = np.array([tabela[v][0] for v in valores] + [np.nan], dtype=object)
+    idades = np.array([tabela[v][1] for v in valores] + [np.nan], dtype=object)
+    return sexos[codigos], idades[codigos]
+
+
+def tratar_bloco_ads(bloco, tabela_publicos):
+    """Datas e separação do público (sexo, idade) de um bloco do Meta Ads"""
+    bloco['data'] = pd.to_datetime(bloco['data'])
+    bloco['sexo'], bloco['idade'] = separar_publico(bloco['conjunto_anuncio'], tabela_publicos)
+    return bloco
+
+
+def tratar_bloco_crm(bloco):
+    """Datas, quantidade e dias até a conversão de um bloco do CRM"""
+    for col in ['ultima_interacao', 'data_captura', 'data_venda']:
+        bloco[col] = pd.to_datetime(bloco[col])
+    bloco['quantidade'] = bloco['quantidade'].fillna(0).astype('int32')
+    bloco['dias_para_conversao'] = (bloco['data_venda'] - bloco['data_captura']).dt.days
+    return bloco
+
+
+# ========================================== TABELAS-RESUMO ==========================================
+# Cada bloco gera somas parciais por grupo; as parciais são somadas às
+# anteriores, então o acumulado tem o tamanho do número de grupos, não de linhas.
+# Contagens distintas (nunique) não são somáveis: o bloco devolve os pares
+# (grupo, lead_id) distintos e a combinação é a união exata dos conjuntos.
+
+# Pares distintos (grupo, lead_id) -> chaves do grupo
+DISTINTOS = {
+    'leads_campanha': ['campanha_origem'],
+    'leads_canal': ['canal_origem'],
+}
+
+
+def acumular(acumulado, parcial):
+    """Soma as parciais de um bloco ao acumulado (grupos alinhados pelo índice)"""
+    if acumulado is None:
+        return parcial
+    return pd.concat([acumulado, parcial]).groupby(level=list(range(parcial.index.nlevels))).sum()
+
+
+def unir_distintos(acumulado, parcial):
+    """União de dois conjuntos de pares distintos (grupo, lead_id)"""
+    if acumulado is None:
+        return parcial
+    return pd.concat([acumulado, parcial], ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def combinar(nome, acumulado, parcial):
+    """Combina a parcial de um resumo: união para pares distintos, soma para o resto"""
+    if nome in DISTINTOS:
+        return unir_distintos(acumulado, parcial)
+    return acumular(acumulado, parcial)
+
+
+def contar_distintos(pares, chaves):
+    """Quantidade exata de lead_id distintos por grupo"""
+    return pares.groupby(chaves).size()
+
+
+# Séries diárias (somas por dia): base das tendências de insights.py
+SERIES_DIARIAS = ['serie_ads', 'serie_crm']
+
+
+def _datas_como_texto(resumo):
+    """Primeiro nível do índice (dias) como 'AAAA-MM-DD', o mesmo formato relido do CSV gravado"""
+    dias = resumo.index.levels[0].strftime('%Y-%m-%d')
+    return resumo.set_axis(resumo.index.set_levels(dias, level=0))
+
+
+def resumir_bloco_ads(bloco):
+    """Somas parciais de um bloco do Meta Ads para campanha_geral, campanha_publico, campanha_anuncio e serie_ads"""
+    por_anuncio = bloco[MEDIDAS_ADS].assign(dias_campanha=bloco['anuncio'].notna())
+    por_conjunto = bloco[MEDIDAS_ADS].assign(dias_campanha=bloco['conjunto_anuncio'].notna())
+    dia = bloco['data'].dt.normalize()
+    return {
+        'campanha_geral': por_anuncio.groupby(bloco['campanha']).sum(),
+        'campanha_publico': por_anuncio.groupby([bloco['campanha'], bloco['conjunto_anuncio']]).sum(),
+        'campanha_anuncio': por_conjunto.groupby([bloco['campanha'], bloco['anuncio']]).sum(),
+        'serie_ads': _datas_como_texto(bloco[MEDIDAS_ADS].groupby([dia, bloco['campanha'], bloco['sexo']]).sum()),
+    }
+
+
+def resumir_bloco_crm(bloco):
+    """Somas parciais de um bloco do CRM para campanha_vendas, campanha_funil, canal_conversao, serie_crm e coorte_leads"""
+    tem_lead = bloco['lead_id'].notna()
+    vendas = pd.DataFrame({
+        'leads': tem_lead,
+        'vendas_leads': bloco['status'] == 'Ganhou',
+        'vendas': bloco['sale_id'].notna(),
+        'receita_total': bloco['valor_total'].fillna(0),
+    })
+    canais = pd.DataFrame({
+        'total_leads': tem_lead,
+        'compraram': tem_lead & (bloco['etapa_funil'] == 'Comprou'),
+    })
+    convertidos = bloco['dias_para_conversao'].notna()
+    serie = pd.DataFrame({
+        'leads': tem_lead,
+        'vendas': bloco['sale_id'].notna(),
+        'compraram': canais['compraram'],
+        'dias_para_conversao': bloco['dias_para_conversao'].where(convertidos, 0),
+        'convertidos': convertidos,
+    })
+    dia = bloco['data_captura'].dt.normalize()
+    resumos = {
+        'campanha_vendas': vendas.groupby(bloco['campanha_origem']).sum(),
+        'campanha_funil': tem_lead.rename('qtd_leads').groupby([bloco['campanha_origem'], bloco['etapa_funil']]).sum().to_frame(),
+        'canal_conversao': canais.groupby(bloco['canal_origem']).sum(),
+        'serie_crm': _datas_como_texto(serie.groupby([dia, bloco['campanha_origem'], bloco['canal_origem']]).sum()),
+        'coorte_leads': _datas_como_texto(resumir_coortes(bloco)),
+    }
+    for nome, chaves in DISTINTOS.items():
+        resumos[nome] = bloco[chaves + ['lead_id']].dropna().drop_duplicates(ignore_index=True)
+    return resumos
+
+
+def adicionar_metricas_campanha(df):
+    """CTR, CPC e CPA (arredondados) das somas de uma tabela de campanhas"""
+    df['CTR(%)'] = np.round((df['cliques'] / df['impressoes']) * 100, 2)
+    df['CPC(R$)'] = np.round(df['gasto_total'] / df['cliques'], 2)
+    df['CPA(R$)'] = np.round(df['gasto_total'] / df['conversões'], 2)
+    return df
+
+
+def finalizar_resumos_ads(resumos):
+    """Transforma as somas acumuladas do Meta Ads nas tabelas gravadas em data/tratados"""
+    tabelas = {nome: adicionar_metricas_campanha(df.reset_index()) for nome, df in resumos.items()
+               if nome not in SERIES_DIARIAS}
+    if 'serie_ads' in resumos:
+        tabelas['serie_ads'] = resumos['serie_ads'].reset_index()
+
+    geral = tabelas['campanha_geral']
+    geral['impressoes_dia'] = geral['impressoes'] / geral['dias_campanha']
+    geral['cliques_dia'] = geral['cliques'] / geral['dias_campanha']
+    geral['gasto_dia'] = geral['gasto_total'] / geral['dias_campanha']
+    return tabelas
+
+
+def finalizar_resumos_crm(resumos):
+    """Transforma as somas acumuladas do CRM nas tabelas gravadas em data/tratados"""
+    vendas = resumos['campanha_vendas'].reset_index()
+    vendas['taxa_conversao'] = np.round((vendas['vendas'] / vendas['leads']) * 100, 2)
+    unicos = contar_distintos(resumos['leads_campanha'], DISTINTOS['leads_campanha'])
+    vendas['leads_unicos'] = vendas['campanha_origem'].map(unicos).fillna(0).astype(int)
+
+    funil = resumos['campanha_funil'].reset_index()
+    totais = funil.groupby('campanha_origem')['qtd_leads'].transform('sum')
+    funil['percentual'] = ((funil['qtd_leads'] / totais) * 100).round(2)
+
+    canal = resumos['canal_conversao']
+    canal['taxa_conversao_%'] = np.round((canal['compraram'] / canal['total_leads']) * 100, 2)
+    unicos = contar_distintos(resumos['leads_canal'], DISTINTOS['leads_canal'])
+    canal['leads_unicos'] = unicos.reindex(canal.index, fill_value=0).astype(int)
+    canal = canal.sort_values(by='taxa_conversao_%', ascending=False)
+
+    tabelas = {'campanha_vendas': vendas, 'campanha_funil': funil, 'canal_conversao': canal}
+    if 'serie_crm' in resumos:
+        tabelas['serie_crm'] = resumos['serie_crm'].reset_index()
+    if 'coorte_leads' in resumos:
+        tabelas['coorte_leads'] = resumos['coorte_leads'].reset_index()
+    return tabelas
+
+
+# ========================================== GRAVAÇÃO ==========================================
+# O Parquet tratado é uma pasta de partes (<dataset>.parquet/parte-00000.parquet, ...),
+# lida inteira por pd.read_parquet. A carga completa grava a parte 0; cada
+# ingestão incremental acrescenta uma parte nova em vez de reescrever o histórico.
+
+def _tipo_arrow(tipo):
+    """Tipo Arrow fixo para um tipo do esquema (categorias são gravadas como texto)"""
+    tipo = pd.api.types.pandas_dtype(tipo)
+    if isinstance(tipo, pd.CategoricalDtype) or tipo == object:
+        return pa.string()
+    return pa.from_numpy_dtype(tipo)
+
+
+def caminho_parquet(caminho_csv):
+    """Pasta Parquet (partes) equivalente a um CSV tratado"""
+    return os.path.splitext(caminho_csv)[0] + ".parquet"
+
+
+def listar_partes(caminho):
+    """Arquivos de parte de uma pasta Parquet, em ordem de gravação"""
+    if not os.path.isdir(caminho):
+        return []
+    return sorted(os.path.join(caminho, nome) for nome in os.listdir(caminho) if nome.endswith(".parquet"))
+
+
+def _nome_parte(numero):
+    return f"parte-{numero:05d}.parquet"
+
+
+def _proxima_parte(partes):
+    """Número da parte seguinte à última das partes gravadas"""
+    return int(os.path.basename(partes[-1])[len("parte-"):-len(".parquet")]) + 1
+
+
+def _tabela_arrow(bloco, schema):
+    """Bloco tratado como tabela Arrow no esquema das partes gravadas (falha se algum valor não couber no tipo)"""
+    return pa.Table.from_pandas(bloco, preserve_index=True).select(schema.names).cast(schema)
+
+
+def _recriar_pasta(caminho):
+    """Apaga um Parquet anterior (arquivo ou pasta) e cria a pasta vazia"""
+    if os.path.isdir(caminho):
+        shutil.rmtree(caminho)
+    elif os.path.exists(caminho):
+        os.remove(caminho)
+    os.makedirs(caminho)
+
+
+class GravadorBlocos:
+    """
+    Grava blocos tratados em um CSV e em uma parte nova da pasta Parquet.
+
+    O esquema Arrow é fixado no primeiro bloco (com os tipos de esquema.py
+    onde declarados, e texto para colunas vazias), para que blocos seguintes
+    não mudem o tipo gravado. Com anexar=True, os blocos vão para o fim do CSV e para
+    uma parte nova, usando o esquema das partes já gravadas.
+    """
+
+    def __init__(self, caminho_csv, esquema, anexar=False):
+        self.caminho_csv = caminho_csv
+        self.caminho_parquet = caminho_parquet(caminho_csv)
+        self.esquema = esquema
+        self.anexar = anexar
+        self._schema = None
+        self._parquet = None
+        self._cabecalho = not anexar
+
+        partes = listar_partes(self.caminho_parquet)
+        if anexar:
+            if not partes:
+                raise FileNotFoundError(f"{self.caminho_parquet} não tem partes; rode a carga completa primeiro")
+            self._schema = pq.read_schema(partes[0])
+            numero = _proxima_parte(partes)
+        else:
+            # CSV e Parquet zerados juntos: sem nenhum bloco, não sobra o CSV
+            # da carga anterior ao lado de uma pasta Parquet vazia
+            _recriar_pasta(self.caminho_parquet)
+            open(self.caminho_csv, 'w').close()
+            numero = 0
+        self.caminho_parte = os.path.join(self.caminho_parquet, _nome_parte(numero))
+
+    def _fixar_schema(self, tabela):
+        campos = []
+        for campo in tabela.schema:
+            if campo.name in self.esquema:
+                tipo = _tipo_arrow(self.esquema[campo.name])
+            elif tabela.column(campo.name).null_count == tabela.num_rows:
+                # Coluna vazia neste bloco (ex: sale_id sem vendas): o pandas
+                # a lê como float, mas as colunas fora do esquema são texto
+                tipo = pa.string()
+            else:
+                tipo = campo.type
+            campos.append(pa.field(campo.name, tipo))
+        return pa.schema(campos, metadata=tabela.schema.metadata)
+
+    def escrever(self, bloco):
+        bloco.to_csv(self.caminho_csv, mode='w' if self._cabecalho else 'a', header=self._cabecalho)
+        self._cabecalho = False
+
+        tabela = pa.Table.from_pandas(bloco, preserve_index=True)
+        if self._schema is None:
+            self._schema = self._fixar_schema(tabela)
+        if self._parquet is None:
+            self._parquet = pq.ParquetWriter(self.caminho_parte, self._schema)
+        self._parquet.write_table(tabela.select(self._schema.names).cast(self._schema))
+
+    def fechar(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def gravar_resumos(tabelas, saida):
+    """Grava as tabelas-resumo finalizadas como <nome>.csv"""
+    for nome, tabela in tabelas.items():
+        tabela.to_csv(os.path.join(saida, f'{nome}.csv'))
+
+
+def caminho_distintos(saida, nome):
+    return os.path.join(saida, 'distintos', f'{nome}.parquet')
+
+
+def gravar_distintos(resumos, saida):
+    """Grava os pares distintos (grupo, lead_id) usados pela ingestão incremental"""
+    os.makedirs(os.path.join(saida, 'distintos'), exist_ok=True)
+    for nome in DISTINTOS:
+        if nome in resumos:
+            resumos[nome].to_parquet(caminho_distintos(saida, nome), index=False)
+
+
+# ========================================== CARGA COMPLETA ==========================================
+
+def processar_blocos(blocos, caminho_saida, tratar, resumir, esquema, anexar=False):
+    """
+    Trata, grava e resume uma sequência de blocos brutos.
+
+    Parâmetros:
+    - blocos: iterável de DataFrames com as colunas do export bruto (blocos
+      de um CSV, páginas de uma API...)
+    - caminho_saida: CSV tratado (o Parquet é gravado ao lado)
+    - tratar: função bloco -> bloco tratado (ou None para descartar o bloco)
+    - resumir: função bloco -> dict nome -> somas parciais
+    - esquema: esquema declarado (esquema.py) usado para os tipos do Parquet
+    - anexar: acrescenta ao CSV e a uma parte nova em vez de recriar os arquivos
+
+    Retorna:
+    - dict nome -> resumos acumulados e o total de linhas processadas
+    """
+    resumos = {}
+    linhas = 0
+    gravador = GravadorBlocos(caminho_saida, esquema, anexar=anexar)
+    try:
+        for bloco in blocos:
+            bloco = tratar(bloco)
+            if bloco is None or bloco.empty:
+                continue
+            gravador.escrever(bloco)
+            for nome, parcial in resumir(bloco).items():
+                resumos[nome] = combinar(nome, resumos.get(nome), parcial)
+            linhas += len(bloco)
+    finally:
+        gravador.fechar()
+    return resumos, linhas
+
+
+def processar_arquivo(caminho, caminho_saida, tratar, resumir, esquema,
+                      linhas_por_bloco=LINHAS_POR_BLOCO, anexar=False):
+    """Lê um CSV bruto em blocos de linhas_por_bloco linhas e os passa por processar_blocos"""
+    blocos = pd.read_csv(caminho, index_col=0, chunksize=linhas_por_bloco)
+    return processar_blocos(blocos, caminho_saida, tratar, resumir, esquema, anexar=anexar)
+
+
+def _etapas(dataset):
+    """Função de tratamento, função de resumo e esquema de um dataset ('ads' ou 'crm')"""
+    if dataset == 'ads':
+        tabela_publicos = {}
+        return (lambda bloco: tratar_bloco_ads(bloco, tabela_publicos)), resumir_bloco_ads, ESQUEMA_ADS
+    return tratar_bloco_crm, resumir_bloco_crm, ESQUEMA_CRM
+
+
+def processar_metaads(entrada, saida, linhas_por_bloco=LINHAS_POR_BLOCO, processos=1, blocos=None):
+    """
+    Trata data/raw/metaads_data.csv e grava o dataset e os resumos de campanha.
+
+    Com blocos (ex: páginas da API, ver ingestao_api.py), eles substituem o CSV de entrada.
+    """
+    if blocos is not None:
+        resumos, linhas = processar_blocos(blocos, os.path.join(saida, 'metaads_data.csv'), *_etapas('ads'))
+    elif processos > 1:
+        resumos, linhas = processar_paralelo('ads', entrada, saida, linhas_por_bloco, processos)
+    else:
+        resumos, linhas = processar_arquivo(
+            os.path.join(entrada, 'metaads_data.csv'),
+            os.path.join(saida, 'metaads_data.csv'),
+            *_etapas('ads'),
+            linhas_por_bloco,
+        )
+    gravar_resumos(finalizar_resumos_ads(resumos), saida)
+    return linhas
+
+
+def processar_crm(entrada, saida, linhas_por_bloco=LINHAS_POR_BLOCO, processos=1, blocos=None):
+    """
+    Trata data/raw/crm_sales_data.csv e grava o dataset e os resumos de vendas.
+
+    Com blocos (ex: páginas da API, ver ingestao_api.py), eles substituem o CSV de entrada.
+    """
+    if blocos is not None:
+        resumos, linhas = processar_blocos(blocos, os.path.join(saida, 'crm_sales_data.csv'), *_etapas('crm'))
+    elif processos > 1:
+        resumos, linhas = processar_paralelo('crm', entrada, saida, linhas_por_bloco, processos)
+    else:
+        resumos, linhas = processar_arquivo(
+            os.path.join(entrada, 'crm_sales_data.csv'),
+            os.path.join(saida, 'crm_sales_data.csv'),
+            *_etapas('crm'),
+            linhas_por_bloco,
+        )
+    gravar_resumos(finalizar_resumos_crm(resumos), saida)
+    gravar_distintos(resumos, saida)
+    return linhas
+
+
+# ========================================== EXECUÇÃO PARALELA ==========================================
+# Com --processos N, a carga completa divide cada CSV bruto em partições
+# mês x campanha (arquivos temporários, gravados em blocos). Cada partição é
+# tratada e resumida por um processo do pool e vira uma parte do Parquet; no
+# fim as parciais são combinadas (somas somadas, pares distintos unidos) e
+# os CSVs das partições são concatenados.
+
+# Dataset -> (arquivo, coluna de data, coluna de campanha) usados no particionamento
+PARTICOES = {
+    'ads': ('metaads_data.csv', 'data', 'campanha'),
+    'crm': ('crm_sales_data.csv', 'data_captura', 'campanha_origem'),
+}
+
+
+def particionar(caminho, coluna_data, coluna_campanha, pasta, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """
+    Divide um CSV bruto em um arquivo por mês x campanha.
+
+    Parâmetros:
+    - caminho: CSV bruto
+    - coluna_data, coluna_campanha: colunas que definem a partição
+    - pasta: pasta onde as partições são gravadas
+    - linhas_por_bloco: tamanho de cada bloco lido
+
+    Retorna:
+    - lista com o caminho de cada partição
+    """
+    particoes = {}
+    for bloco in pd.read_csv(caminho, index_col=0, chunksize=linhas_por_bloco):
+        meses = pd.to_datetime(bloco[coluna_data]).dt.strftime('%Y-%m').fillna('sem_data')
+        campanhas = bloco[coluna_campanha].fillna('')
+        for chave, parte in bloco.groupby([meses, campanhas], sort=False):
+            nova = chave not in particoes
+            if nova:
+                particoes[chave] = os.path.join(pasta, f'particao-{len(particoes):05d}.csv')
+            parte.to_csv(particoes[chave], mode='w' if nova else 'a', header=nova)
+    return list(particoes.values())
+
+
+def _processar_particao(dataset, caminho, linhas_por_bloco):
+    """
+    Trata e resume uma partição (roda em um processo do pool).
+
+    Retorna:
+    - (resumos parciais, linhas, CSV tratado, parte Parquet)
+    """
+    caminho_saida = caminho[:-len('.csv')] + '-tratado.csv'
+    resumos, linhas = processar_arquivo(caminho, caminho_saida, *_etapas(dataset), linhas_por_bloco)
+    parte = os.path.join(caminho_parquet(caminho_saida), _nome_parte(0))
+    return resumos, linhas, caminho_saida, parte
+
+
+def processar_paralelo(dataset, entrada, saida, linhas_por_bloco=LINHAS_POR_BLOCO, processos=None):
+    """
+    Carga completa de um dataset ('ads' ou 'crm') em paralelo.
+
+    Parâmetros:
+    - dataset: 'ads' ou 'crm' (ver PARTICOES)
+    - entrada, saida: pastas dos dados brutos e tratados
+    - linhas_por_bloco: tamanho dos blocos lidos (no particionamento e nos processos)
+    - processos: tamanho do pool (None usa todos os núcleos)
+
+    Retorna:
+    - dict nome -> resumos combinados e o total de linhas processadas
+    """
+    arquivo, coluna_data, coluna_campanha = PARTICOES[dataset]
+    caminho_saida = os.path.join(saida, arquivo)
+    temporaria = tempfile.mkdtemp(prefix='particoes-', dir=saida)
+    try:
+        particoes = particionar(os.path.join(entrada, arquivo), coluna_data, coluna_campanha,
+                                temporaria, linhas_por_bloco)
+        with ProcessPoolExecutor(max_workers=processos) as pool:
+            resultados = list(pool.map(_processar_particao, repeat(dataset), particoes, repeat(linhas_por_bloco)))
+
+        resumos, linhas = {}, 0
+        pasta = caminho_parquet(caminho_saida)
+        _recriar_pasta(pasta)
+        with open(caminho_saida, 'w', encoding='utf-8', newline='') as destino:
+            for numero, (parciais, n, csv_particao, parte) in enumerate(resultados):
+                for nome, parcial in parciais.items():
+                    resumos[nome] = combinar(nome, resumos.get(nome), parcial)
+                linhas += n
+
+                os.replace(parte, os.path.join(pasta, _nome_parte(numero)))
+                with open(csv_particao, encoding='utf-8', newline='') as origem:
+                    if numero > 0:
+                        origem.readline()  # cabeçalho já gravado pela primeira partição
+                    shutil.copyfileobj(origem, destino)
+    finally:
+        shutil.rmtree(temporaria, ignore_errors=True)
+    return resumos, linhas
+
+
+# ========================================== INGESTÃO INCREMENTAL ==========================================
+# Os resumos gravados guardam as somas (impressões, dias_campanha, leads...)
+# além das razões; a ingestão relê só essas somas, soma (ou subtrai) as
+# parciais do delta e recalcula as razões. O custo depende do delta e do
+# número de grupos, não do histórico.
+
+CHAVES_RESUMOS = {
+    'campanha_geral': ['campanha'],
+    'campanha_publico': ['campanha', 'conjunto_anuncio'],
+    'campanha_anuncio': ['campanha', 'anuncio'],
+    'campanha_vendas': ['campanha_origem'],
+    'campanha_funil': ['campanha_origem', 'etapa_funil'],
+    'canal_conversao': ['canal_origem'],
+    'serie_ads': ['data', 'campanha', 'sexo'],
+    'serie_crm': ['data_captura', 'campanha_origem', 'canal_origem'],
+    'coorte_leads': ['semana', 'campanha_origem', 'canal_origem'],
+}
+
+
+def carregar_somas(saida, nome, colunas):
+    """Relê as colunas de soma de um resumo gravado, indexadas pelas chaves do resumo"""
+    df = pd.read_csv(os.path.join(saida, f'{nome}.csv'))
+    df = df.drop(columns=[c for c in df.columns if c.startswith('Unnamed')])
+    return df.set_index(CHAVES_RESUMOS[nome])[list(colunas)]
+
+
+def atualizar_somas(saida, parciais, partes=None):
+    """
+    Aplica as parciais de um delta às somas gravadas.
+
+    Parâmetros:
+    - saida: pasta dos dados tratados
+    - parciais: dict nome -> somas parciais (saída de resumir_bloco_*), que
+      podem ser negativas para retirar a versão antiga de leads atualizados
+    - partes: partes Parquet já com o delta, usadas para recalcular um resumo
+      que ainda não existe (padrão: as gravadas em saida)
+
+    Retorna:
+    - dict nome -> somas atualizadas (grupos tocados pelo delta que ficaram
+      zerados são removidos)
+    """
+    somas = {}
+    for nome, parcial in parciais.items():
+        if nome in DISTINTOS:
+            continue
+        if not os.path.exists(os.path.join(saida, f'{nome}.csv')):
+            # Resumo criado depois da última carga completa: sai inteiro das partes gravadas (uma vez só)
+            recalculado = recalcular_resumo(saida, nome, partes)
+            if recalculado is not None:
+                somas[nome] = recalculado
+            continue
+        atualizado = acumular(carregar_somas(saida, nome, parcial.columns), parcial)
+        zerados = (atualizado == 0).all(axis=1) & atualizado.index.isin(parcial.index)
+        somas[nome] = atualizado[~zerados]
+    return somas
+
+
+def recalcular_resumo(saida, nome, partes=None):
+    """
+    Resumo calculado das partes Parquet tratadas, que já incluem o delta.
+
+    Usado quando um resumo ainda não existe na pasta (dados gerados por uma
+    versão anterior do pré-processamento).
+    """
+    # Resumos do Meta Ads são agrupados pela coluna 'campanha'; os do CRM, por campanha_origem/canal_origem
+    dataset = 'ads' if PARTICOES['ads'][2] in CHAVES_RESUMOS[nome] else 'crm'
+    resumir = resumir_bloco_ads if dataset == 'ads' else resumir_bloco_crm
+    if partes is None:
+        partes = listar_partes(caminho_parquet(os.path.join(saida, PARTICOES[dataset][0])))
+    resumo = None
+    for parte in partes:
+        resumo = acumular(resumo, resumir(pd.read_parquet(parte))[nome])
+    return resumo
+
+
+def atualizar_distintos(saida, parciais, leads):
+    """
+    Troca nos pares distintos gravados os leads do delta pelos pares novos.
+
+    Como as linhas de um lead no delta substituem todas as gravadas, os
+    pares antigos desses leads saem antes da união.
+    """
+    distintos = {}
+    for nome in DISTINTOS:
+        gravados = pd.read_parquet(caminho_distintos(saida, nome))
+        gravados = gravados[~gravados['lead_id'].isin(leads)]
+        distintos[nome] = unir_distintos(gravados, parciais.get(nome))
+    return distintos
+
+
+def ultima_data(caminho_csv, coluna):
+    """Maior data já gravada, pelas estatísticas das partes Parquet (sem ler as linhas)"""
+    maior = None
+    for parte in listar_partes(caminho_parquet(caminho_csv)):
+        metadados = pq.read_metadata(parte)
+        indice = metadados.schema.names.index(coluna)
+        for i in range(metadados.num_row_groups):
+            estatisticas = metadados.row_group(i).column(indice).statistics
+            if estatisticas is None or not estatisticas.has_min_max:
+                valor = pq.read_table(parte, columns=[coluna]).column(0).to_pandas().max()
+            else:
+                valor = pd.Timestamp(estatisticas.max)
+            if pd.notna(valor) and (maior is None or valor > maior):
+                maior = valor
+    return maior
+
+
+# Uma ingestão só muda os dados tratados no fim. O delta inteiro é lido,
+# tratado, tipado no esquema das partes gravadas e resumido antes de qualquer
+# gravação; as partes reescritas, a parte nova, o CSV e os resumos vão para
+# uma pasta de preparo e só então são movidos para o lugar. Um valor inválido
+# no delta falha antes de tocar em qualquer arquivo.
+
+class PreparoIngestao:
+    """
+    Pasta de preparo de uma ingestão incremental (saida/.ingestao-*).
+
+    Fica fora das pastas Parquet, que o dashboard lê inteiras. Cada arquivo é
+    gravado com o mesmo caminho relativo que terá em saida; efetivar() os move
+    para o lugar (os.replace) e acrescenta os anexos aos CSVs. Ao sair do
+    bloco with, a pasta é apagada, tenha a ingestão terminado ou não.
+    """
+
+    def __init__(self, saida):
+        self.saida = saida
+        self.pasta = tempfile.mkdtemp(prefix='.ingestao-', dir=saida)
+        self.anexos = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def _relativo(self, destino):
+        return os.path.join(self.pasta, os.path.relpath(destino, self.saida))
+
+    def caminho(self, destino):
+        """Caminho no preparo do arquivo que substituirá destino (um caminho dentro de saida)"""
+        caminho = self._relativo(destino)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        return caminho
+
+    def anexo(self, destino):
+        """Caminho no preparo das linhas que serão acrescentadas ao fim do CSV destino"""
+        if destino not in self.anexos:
+            self.anexos[destino] = self.caminho(destino) + ".anexo"
+        return self.anexos[destino]
+
+    def partes(self, pasta):
+        """Partes de uma pasta Parquet como ficarão depois de efetivar()"""
+        preparadas = listar_partes(self._relativo(pasta))
+        nomes = {os.path.basename(parte) for parte in preparadas}
+        gravadas = [parte for parte in listar_partes(pasta) if os.path.basename(parte) not in nomes]
+        return sorted(gravadas + preparadas, key=os.path.basename)
+
+    def efetivar(self):
+        """Move os arquivos preparados para saida e acrescenta os anexos aos CSVs"""
+        anexos = set(self.anexos.values())
+        for raiz, _, nomes in os.walk(self.pasta):
+            for nome in nomes:
+                origem = os.path.join(raiz, nome)
+                if origem not in anexos:
+                    os.replace(origem, os.path.join(self.saida, os.path.relpath(origem, self.pasta)))
+        for destino, origem in self.anexos.items():
+            with open(origem, 'rb') as linhas, open(destino, 'ab') as csv:
+                shutil.copyfileobj(linhas, csv)
+
+
+def _schema_gravado(caminho_saida):
+    """Esquema Arrow das partes já gravadas de um dataset"""
+    partes = listar_partes(caminho_parquet(caminho_saida))
+    if not partes:
+        raise FileNotFoundError(f"{caminho_parquet(caminho_saida)} não tem partes; rode a carga completa primeiro")
+    return pq.read_schema(partes[0])
+
+
+def _ler_delta(blocos, tratar, resumir, schema):
+    """
+    Trata, tipa e resume um delta inteiro, sem gravar nada.
+
+    Retorna:
+    - blocos tratados, as mesmas linhas como tabelas Arrow no schema gravado
+      e dict nome -> parciais dos resumos
+    """
+    tratados, tabelas, parciais = [], [], {}
+    for bloco in blocos:
+        bloco = tratar(bloco)
+        if bloco is None or bloco.empty:
+            continue
+        tabelas.append(_tabela_arrow(bloco, schema))
+        for nome, parcial in resumir(bloco).items():
+            parciais[nome] = combinar(nome, parciais.get(nome), parcial)
+        tratados.append(bloco)
+    return tratados, tabelas, parciais
+
+
+def _gravar_delta(preparo, caminho_saida, tratados, tabelas, schema):
+    """
+    Grava o delta no preparo: uma parte nova depois da última gravada e as
+    linhas do CSV (no fim do CSV reescrito, se houver, ou como anexo)
+    """
+    pasta = caminho_parquet(caminho_saida)
+    parte = preparo.caminho(os.path.join(pasta, _nome_parte(_proxima_parte(listar_partes(pasta)))))
+    with pq.ParquetWriter(parte, schema) as escritor:
+        for tabela in tabelas:
+            escritor.write_table(tabela)
+
+    csv = preparo.caminho(caminho_saida)
+    if not os.path.exists(csv):
+        csv = preparo.anexo(caminho_saida)
+    for bloco in tratados:
+        bloco.to_csv(csv, mode='a', header=False)
+
+
+def ingerir_metaads(entrada, saida, linhas_por_bloco=LINHAS_POR_BLOCO, blocos=None):
+    """
+    Acrescenta um delta do Meta Ads (entrada/metaads_data.csv, ou os blocos
+    informados) aos dados tratados.
+
+    Só entram datas posteriores à última já gravada: reenviar um dia já
+    ingerido não duplica linhas nem somas.
+
+    Retorna:
+    - (linhas ingeridas, linhas ignoradas)
+    """
+    caminho_saida = os.path.join(saida, 'metaads_data.csv')
+    limite = ultima_data(caminho_saida, 'data')
+    tabela_publicos = {}
+    ignoradas = 0
+
+    def tratar(bloco):
+        nonlocal ignoradas
+        bloco = tratar_bloco_ads(bloco, tabela_publicos)
+        if limite is None:
+            return bloco
+        novas = bloco['data'] > limite
+        ignoradas += int((~novas).sum())
+        return bloco[novas]
+
+    if blocos is None:
+        blocos = pd.read_csv(os.path.join(entrada, 'metaads_data.csv'), index_col=0, chunksize=linhas_por_bloco)
+    schema = _schema_gravado(caminho_saida)
+    tratados, tabelas, parciais = _ler_delta(blocos, tratar, resumir_bloco_ads, schema)
+    if not tratados:
+        return 0, ignoradas
+
+    with PreparoIngestao(saida) as preparo:
+        _gravar_delta(preparo, caminho_saida, tratados, tabelas, schema)
+        somas = atualizar_somas(saida, parciais, preparo.partes(caminho_parquet(caminho_saida)))
+        gravar_resumos(finalizar_resumos_ads(somas), preparo.pasta)
+        preparo.efetivar()
+    return sum(len(bloco) for bloco in tratados), ignoradas
+
+
+def _linhas_substituidas(lead_id, sale_id, leads, vendas):
+    """
+    Máscara das linhas gravadas que o delta substitui.
+
+    Uma linha é identificada pelo lead_id; vendas sem lead (tráfego direto)
+    são identificadas pelo sale_id.
+    """
+    return pc.or_(
+        pc.is_in(lead_id, value_set=leads),
+        pc.and_(pc.is_null(lead_id), pc.is_in(sale_id, value_set=vendas)),
+    )
+
+
+def _retirar_linhas_parquet(caminho, leads, vendas, preparo):
+    """
+    Grava no preparo as partes Parquet que contêm linhas substituídas pelo
+    delta, sem essas linhas. As demais partes não são reescritas.
+
+    Retorna:
+    - DataFrame com as linhas removidas (a versão antiga) ou None
+    """
+    leads = pa.array(sorted(leads), type=pa.string())
+    vendas = pa.array(sorted(vendas), type=pa.string())
+    removidas = []
+    for parte in listar_partes(caminho):
+        chaves = pq.read_table(parte, columns=['lead_id', 'sale_id'])
+        if not pc.any(_linhas_substituidas(chaves['lead_id'], chaves['sale_id'], leads, vendas)).as_py():
+            continue
+
+        tabela = pq.read_table(parte)
+        antigas = _linhas_substituidas(tabela['lead_id'], tabela['sale_id'], leads, vendas)
+        removidas.append(tabela.filter(antigas).to_pandas())
+        pq.write_table(tabela.filter(pc.invert(antigas)), preparo.caminho(parte))
+
+    if not removidas:
+        return None
+    return pd.concat(removidas)
+
+
+def _retirar_linhas_csv(caminho, leads, vendas, destino, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Grava em destino o CSV tratado do CRM sem as linhas substituídas pelo delta (em blocos)"""
+    cabecalho = True
+    for bloco in pd.read_csv(caminho, index_col=0, chunksize=linhas_por_bloco):
+        substituidas = bloco['lead_id'].isin(leads) | (bloco['lead_id'].isna() & bloco['sale_id'].isin(vendas))
+        bloco[~substituidas].to_csv(destino, mode='w' if cabecalho else 'a', header=cabecalho)
+        cabecalho = False
+
+
+def ingerir_crm(entrada, saida, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """
+    Aplica um delta do CRM (entrada/crm_sales_data.csv) aos dados tratados.
+
+    As linhas de um lead no delta substituem todas as linhas gravadas desse
+    lead (vendas que chegaram depois, mudança de etapa_funil/sale_id): a
+    versão antiga sai das somas e das partes Parquet onde estava, e a nova
+    entra como parte nova. Vendas sem lead são substituídas pelo sale_id.
+    Reaplicar o mesmo delta não duplica linhas.
+
+    O CSV tratado só é reescrito (em blocos) quando há linhas substituídas,
+    já que um CSV não permite trocar linhas no lugar.
+
+    Retorna:
+    - (linhas ingeridas, linhas substituídas)
+    """
+    caminho_delta = os.path.join(entrada, 'crm_sales_data.csv')
+    caminho_saida = os.path.join(saida, 'crm_sales_data.csv')
+    pasta = caminho_parquet(caminho_saida)
+
+    schema = _schema_gravado(caminho_saida)
+    blocos = pd.read_csv(caminho_delta, index_col=0, chunksize=linhas_por_bloco)
+    tratados, tabelas, parciais = _ler_delta(blocos, tratar_bloco_crm, resumir_bloco_crm, schema)
+    if not tratados:
+        return 0, 0
+
+    leads, vendas = set(), set()
+    for bloco in tratados:
+        leads.update(bloco['lead_id'].dropna())
+        vendas.update(bloco.loc[bloco['lead_id'].isna(), 'sale_id'].dropna())
+
+    with PreparoIngestao(saida) as preparo:
+        antigas = _retirar_linhas_parquet(pasta, leads, vendas, preparo)
+        if antigas is not None:
+            _retirar_linhas_csv(caminho_saida, leads, vendas, preparo.caminho(caminho_saida), linhas_por_bloco)
+            for nome, parcial in resumir_bloco_crm(antigas).items():
+                if nome not in DISTINTOS:
+                    parciais[nome] = acumular(parciais.get(nome), -parcial)
+        _gravar_delta(preparo, caminho_saida, tratados, tabelas, schema)
+
+        distintos = atualizar_distintos(saida, parciais, leads)
+        somas = atualizar_somas(saida, parciais, preparo.partes(pasta))
+        gravar_resumos(finalizar_resumos_crm({**somas, **distintos}), preparo.pasta)
+        gravar_distintos(distintos, preparo.pasta)
+        preparo.efetivar()
+
+    return sum(len(bloco) for bloco in tratados), 0 if antigas is None else len(antigas)
+
+
+# ========================================== LINHA DE COMANDO ==========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera data/tratados a partir dos exports brutos do Meta Ads e do CRM.")
+    parser.add_argument('--entrada', default='data/raw', help="pasta com metaads_data.csv e crm_sales_data.csv brutos")
+    parser.add_argument('--saida', default='data/tratados', help="pasta de destino dos dados tratados")
+    parser.add_argument('--linhas-por-bloco', type=int, default=LINHAS_POR_BLOCO, help="linhas lidas por bloco")
+    parser.add_argument('--processos', type=int, default=1,
+                        help="processos da carga completa (partições mês x campanha); 0 usa todos os núcleos")
+    parser.add_argument('--incremental', action='store_true',
+                        help="ingere só o delta da pasta de entrada (novos dias de anúncios, leads novos ou atualizados)")
+    args = parser.parse_args(argv)
+
+    if args.incremental:
+        if os.path.exists(os.path.join(args.entrada, 'metaads_data.csv')):
+            linhas, ignoradas = ingerir_metaads(args.entrada, args.saida, args.linhas_por_bloco)
+            print(f"META ADS: {linhas} linhas ingeridas, {ignoradas} ignoradas (datas já gravadas)")
+        if os.path.exists(os.path.join(args.entrada, 'crm_sales_data.csv')):
+            linhas, substituidas = ingerir_crm(args.entrada, args.saida, args.linhas_por_bloco)
+            print(f"CRM: {linhas} linhas ingeridas, {substituidas} linhas antigas substituídas")
+    else:
+        processos = args.processos or os.cpu_count()
+        os.makedirs(args.saida, exist_ok=True)
+        linhas_ads = processar_metaads(args.entrada, args.saida, args.linhas_por_bloco, processos)
+        print(f"META ADS: {linhas_ads} linhas tratadas")
+        linhas_crm = processar_crm(args.entrada, args.saida, args.linhas_por_bloco, processos)
+        print(f"CRM: {linhas_crm} linhas tratadas")
+
+    # Achados da aba de Insights, das tabelas-resumo já atualizadas
+    print(f"INSIGHTS: {gravar_insights(args.saida)} achados")
+    # Domínios dos filtros e período dos dados, lidos pelo dashboard na abertura
+    print(f"METADADOS: {'gravados' if gravar_metadados(args.saida) else 'faltam tabelas-resumo'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Relatórios estáticos do dashboard, gerados sem abrir o app.
+
+Cada estado de filtro (período, campanhas, canais, gêneros, idades e grão)
+vira uma pasta com os mesmos KPIs, tabelas e gráficos das abas:
+relatorio.html, uma tabela .parquet por tabela e, com --png, os gráficos em
+PNG (exige o pacote kaleido). Os dados da loja são lidos e indexados uma vez;
+os estados são divididos entre os processos de um pool, que recebem os dados
+já montados (fork) em vez de relê-los.
+
+Uso (a partir da raiz do projeto):
+    python scripts/relatorios.py --periodos 7 30 90
+    python scripts/relatorios.py --por-campanha --por-canal --periodos 7 30 90 --processos 0
+    python scripts/relatorios.py --estados estados.json --saida relatorios/diario --png
+
+O arquivo de --estados é uma lista JSON de estados, ex:
+    [{"nome": "acessorios_30d", "inicio": "2025-04-01", "fim": "2025-04-30",
+      "campanhas": ["Acessórios"], "canais": null, "granularidade": "semana"}]
+(campos ausentes ou null = todos os valores; período ausente = todo o período dos dados)
+"""
+import argparse
+import html
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib.util import find_spec
+
+import pandas as pd
+
+import data_processing as dp
+from atribuicao import JANELA_PADRAO_DIAS, atribuir_leads, custo_por_anuncio
+from coortes import MEDIDAS_COORTE
+from cubo import GRANULARIDADES
+from graficos import grafico_barras, grafico_funil, grafico_linha
+from utils import COLUNAS_ADS, COLUNAS_CRM, LOJA_PADRAO, listar_lojas, montar_dataset_loja
+
+pd.set_option('mode.copy_on_write', True)
+
+METRICAS = ['impressoes', 'cliques', 'conversões', 'gasto_total', 'ctr (%)', 'cpc (R$)', 'cpa (R$)', 'taxa_conversao (%)']
+
+# Métrica -> maior valor é melhor (rankings da Visão Geral)
+RANKINGS = {'ctr (%)': True, 'cpc (R$)': False, 'cpa (R$)': False, 'taxa_conversao (%)': True}
+
+PONTOS_GRAFICO_LINHA = 1000
+
+# Dados da loja no processo (montados no pai antes do fork, ou por _iniciar_processo)
+_dados = None
+
+
+# ========================================== ESTADOS ==========================================
+
+def _nome_arquivo(texto):
+    """Texto livre como nome de pasta (letras, números, '-' e '_')"""
+    return re.sub(r'[^\w-]+', '_', str(texto)).strip('_') or 'todos'
+
+
+def gerar_estados(dados, periodos=(30,), por_campanha=False, por_canal=False, granularidade='dia', fim=None):
+    """
+    Grade de estados: (cada campanha ou todas) x (cada canal ou todos) x últimos N dias.
+
+    Parâmetros:
+    - dados: objetos da loja (ver utils.montar_dataset_loja)
+    - periodos: quantidade de dias de cada período, terminando em 'fim'
+    - por_campanha, por_canal: um estado por valor (senão, todos juntos)
+    - fim: último dia dos períodos (padrão: último dia com dados)
+
+    Retorna:
+    - lista de dicts (nome, inicio, fim, campanhas, canais, generos, idades, granularidade)
+    """
+    if fim is None:
+        fim = dp.obter_limites_datas(dados['cubo_ads'], dados['df_crm'])[1]
+    fim = pd.Timestamp(fim).normalize()
+
+    campanhas = sorted(dados['cubo_ads']['campanha'].dropna().unique()) if por_campanha else [None]
+    canais = sorted(dados['df_crm']['canal_origem'].dropna().unique()) if por_canal else [None]
+
+    estados = []
+    for campanha in campanhas:
+        for canal in canais:
+            for dias in periodos:
+                estados.append({
+                    'nome': f"{_nome_arquivo(campanha or 'todas')}__{_nome_arquivo(canal or 'todos')}__{dias}d",
+                    'inicio': (fim - pd.Timedelta(days=dias - 1)).date().isoformat(),
+                    'fim': fim.date().isoformat(),
+                    'campanhas': None if campanha is None else [campanha],
+                    'canais': None if canal is None else [canal],
+                    'generos': None,
+                    'idades': None,
+                    'granularidade': granularidade,
+                })
+    return estados
+
+
+def ler_estados(caminho):
+    """Lista de estados de um arquivo JSON (ver o topo do módulo)"""
+    with open(caminho, encoding='utf-8') as arquivo:
+        estados = json.load(arquivo)
+    for numero, estado in enumerate(estados):
+        estado.setdefault('nome', f'estado_{numero:04d}')
+        if estado.get('granularidade', 'dia') not in GRANULARIDADES:
+            raise ValueError(f"{estado['nome']}: granularidade inválida {estado['granularidade']!r}")
+    return estados
+
+
+# ========================================== CÁLCULO DE UM ESTADO ==========================================
+
+def _selecao(valores, serie):
+    """Valores selecionados no estado, ou todos os valores da coluna"""
+    return list(valores) if valores else list(serie.dropna().unique())
+
+
+def calcular_relatorio(dados, estado):
+    """
+    KPIs, tabelas e figuras de um estado, com as mesmas funções das abas do dashboard.
+
+    Diferente do app, a campanha do estado filtra também o CRM (campanha_origem)
+    e os rankings usam só o período do estado.
+
+    Retorna:
+    - (kpis, tabelas, figuras): dicts nome -> valor / DataFrame / figura plotly
+    """
+    cubo, df_crm = dados['cubo_ads'], dados['df_crm']
+    limites = dp.obter_limites_datas(cubo, df_crm)
+    inicio = pd.Timestamp(estado.get('inicio') or limites[0])
+    fim = pd.Timestamp(estado.get('fim') or limites[1])
+    granularidade = estado.get('granularidade', 'dia')
+
+    campanhas = _selecao(estado.get('campanhas'), cubo['campanha'])
+    generos = _selecao(estado.get('generos'), cubo['sexo'])
+    idades = _selecao(estado.get('idades'), cubo['idade'])
+    canais = _selecao(estado.get('canais'), df_crm['canal_origem'])
+    campanhas_origem = _selecao(estado.get('campanhas'), df_crm['campanha_origem'])
+
+    cubo_filtrado = dp.filtrar_metaads(cubo, inicio, fim, campanhas, generos, idades, indice=dados['indice_ads'])
+    crm_filtrado = dp.filtrar_crm(df_crm, inicio, fim, canais, campanhas_origem, indice=dados['indice_crm'])
+    distintos = dp.contar_distintos_crm(crm_filtrado, inicio, fim, canais, campanhas_origem,
+                                        contagem=dados['contagem_crm'])
+    coortes = dp.agregar_coortes(dados['coortes_crm'], inicio, fim, canais, campanhas_origem, por_semana=True)
+    totais = coortes[MEDIDAS_COORTE].sum()
+    mediana_compra, p90_compra = dp.calcular_percentis_compra(totais)
+    if granularidade == 'dia':
+        cubo_periodo = cubo_filtrado
+    else:
+        cubo_periodo = dp.filtrar_metaads_granularidade(dados['indices_periodo'], granularidade,
+                                                        inicio, fim, campanhas, generos, idades)
+
+    # Visão Geral
+    dias = (fim - inicio).days + 1
+    ctr, cpc, cpa = dp.calcular_metricas_media(cubo_filtrado)
+    gasto_dia, cliques_dia, impressoes_dia, leads_dia, compras_dia = dp.calcular_metricas_diarias(
+        cubo_filtrado, crm_filtrado, dias, distintos=distintos)
+    kpis = {
+        'CTR médio (%)': ctr,
+        'CPC médio (R$)': cpc,
+        'CPA médio (R$)': cpa,
+        'Taxa Conversão Média (%)': dp.calcular_taxa_conversao_geral(cubo_filtrado),
+        'Gasto/dia (R$)': gasto_dia,
+        'Cliques/dia': cliques_dia,
+        'Impressões/dia': impressoes_dia,
+        'Leads/dia': leads_dia,
+        'Compras/dia': compras_dia,
+        'Tempo até a compra (dias)': dp.calcular_tempo_medio_compra(crm_filtrado, totais=totais),
+        'Mediana até a compra (dias)': mediana_compra,
+        '90% compram em até (dias)': p90_compra,
+        'Taxa de Conversão (Compra/Lead)': dp.calcular_taxa_conversao_leads(crm_filtrado, distintos=distintos),
+    }
+
+    tabelas = {}
+    for metrica, maior_valor in RANKINGS.items():
+        tabelas[f"ranking {metrica}"] = dp.gerar_ranking_campanhas(cubo_filtrado, metrica, maior_valor=maior_valor,
+                                                                   formatar=False)
+
+    # Campanhas
+    tabelas['metricas por campanha'] = dp.calcular_metricas(cubo_filtrado, ['campanha'], METRICAS)
+    tabelas['crm por campanha'] = dp.agrupar_crm_por_campanha(crm_filtrado)
+    atribuidos = atribuir_leads(cubo_filtrado, crm_filtrado, JANELA_PADRAO_DIAS)
+    tabelas['custo por anuncio'] = custo_por_anuncio(cubo_filtrado, atribuidos)
+    tabelas[f"metricas por {GRANULARIDADES[granularidade].lower()}"] = dp.calcular_metricas(
+        cubo_periodo, ['data', 'campanha'], METRICAS)
+
+    # Públicos
+    tabelas['metricas por publico'] = dp.calcular_metricas(cubo_filtrado, ['sexo', 'idade'], METRICAS)
+
+    # Canais
+    canal_campanha = dp.agrupar_crm_por_canal_campanha(crm_filtrado)
+    tabelas['vendas por canal'] = dp.agrupar_vendas_por_canal(canal_campanha, campanhas_origem)
+    tabelas['taxa conversao por canal'] = dp.calcular_taxa_conversao_canais(canal_campanha)
+
+    # Funil
+    tabelas['coortes por semana'] = dp.calcular_metricas_coortes(coortes)
+
+    por_periodo = tabelas[f"metricas por {GRANULARIDADES[granularidade].lower()}"]
+    figuras = {
+        'gasto por campanha': grafico_barras(tabelas['metricas por campanha'].sort_values('gasto_total', ascending=False),
+                                             eixo_x='campanha', eixo_y='gasto_total', text_auto=True),
+        'cliques ao longo do tempo': grafico_linha(por_periodo, eixo_x='data', eixo_y='cliques', hue='campanha',
+                                                   max_pontos=PONTOS_GRAFICO_LINHA),
+        'ctr ao longo do tempo': grafico_linha(por_periodo, eixo_x='data', eixo_y='ctr (%)', hue='campanha',
+                                               max_pontos=PONTOS_GRAFICO_LINHA),
+        'ctr por publico': grafico_barras(tabelas['metricas por publico'], eixo_x='idade', eixo_y='ctr (%)',
+                                          hue='sexo', text_auto=True),
+        'vendas por campanha': grafico_barras(tabelas['crm por campanha'].sort_values('vendas', ascending=False),
+                                              eixo_x='campanha_origem', eixo_y='vendas', text_auto=True),
+        'funil': grafico_funil(dp.contar_etapas_funil(totais), coluna_etapa='etapa_funil', titulo='Funil Leads',
+                               coluna_quantidade='quantidade'),
+        'conversao acumulada por coorte': grafico_linha(dp.calcular_curvas_conversao(coortes), eixo_x='dias',
+                                                        eixo_y='convertidos (%)', hue='semana'),
+        'vendas por canal': grafico_barras(tabelas['vendas por canal'], eixo_x='canal_origem', eixo_y='Vendas',
+                                           text_auto=True),
+        'taxa conversao por canal': grafico_barras(tabelas['taxa conversao por canal'], eixo_x='canal_origem',
+                                                   eixo_y='Taxa Conversão (%)', text_auto=True),
+    }
+    return kpis, tabelas, figuras
+
+
+# ========================================== SAÍDA ==========================================
+
+def _formatar_kpi(valor):
+    return f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def gravar_relatorio(estado, kpis, tabelas, figuras, pasta, png=False):
+    """
+    Grava relatorio.html, as tabelas em Parquet e (com png) os gráficos em PNG na pasta do estado.
+
+    O HTML carrega o plotly.js de CDN (um relatório pequeno por estado).
+    """
+    os.makedirs(pasta, exist_ok=True)
+    filtros = {chave: valor for chave, valor in estado.items() if chave != 'nome'}
+
+    partes = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>",
+        f"<title>{html.escape(estado['nome'])}</title>",
+        "<script src='https://cdn.plot.ly/plotly-2.35.2.min.js'></script>",
+        "<style>body{font-family:sans-serif;margin:2em} table{border-collapse:collapse;margin-bottom:1.5em}"
+        " td,th{border:1px solid #ccc;padding:4px 8px;text-align:right}</style></head><body>",
+        f"<h1>{html.escape(estado['nome'])}</h1>",
+        f"<pre>{html.escape(json.dumps(filtros, ensure_ascii=False, default=str))}</pre>",
+        "<h2>Principais Indicadores</h2><table>",
+    ]
+    partes += [f"<tr><th>{html.escape(nome)}</th><td>{_formatar_kpi(valor)}</td></tr>" for nome, valor in kpis.items()]
+    partes.append("</table>")
+
+    for nome, fig in figuras.items():
+        partes.append(f"<h2>{html.escape(nome.capitalize())}</h2>")
+        partes.append(fig.to_html(full_html=False, include_plotlyjs=False))
+        if png:
+            fig.write_image(os.path.join(pasta, f"{_nome_arquivo(nome)}.png"))
+
+    for nome, tabela in tabelas.items():
+        partes.append(f"<h2>{html.escape(nome.capitalize())}</h2>")
+        partes.append(tabela.to_html(index=False, float_format=_formatar_kpi, na_rep=''))
+        tabela.to_parquet(os.path.join(pasta, f"{_nome_arquivo(nome)}.parquet"), index=False)
+
+    partes.append("</body></html>")
+    with open(os.path.join(pasta, 'relatorio.html'), 'w', encoding='utf-8') as arquivo:
+        arquivo.write('\n'.join(partes))
+
+
+def _iniciar_processo(pasta_loja):
+    """Monta os dados da loja num processo do pool (sem fork, os dados não vêm do pai)"""
+    global _dados
+    if _dados is None:
+        _dados = montar_dataset_loja(pasta_loja, COLUNAS_ADS, COLUNAS_CRM)
+
+
+def _renderizar(estado, saida, png):
+    """Calcula e grava um estado com os dados do processo; retorna (nome, segundos)"""
+    inicio = time.perf_counter()
+    kpis, tabelas, figuras = calcular_relatorio(_dados, estado)
+    gravar_relatorio(estado, kpis, tabelas, figuras, os.path.join(saida, _nome_arquivo(estado['nome'])), png=png)
+    return estado['nome'], time.perf_counter() - inicio
+
+
+def gravar_indice(resultados, saida):
+    """indice.html com um link para o relatório de cada estado"""
+    linhas = [f"<li><a href='{_nome_arquivo(nome)}/relatorio.html'>{html.escape(nome)}</a> ({segundos:.2f}s)</li>"
+              for nome, segundos in resultados]
+    with open(os.path.join(saida, 'indice.html'), 'w', encoding='utf-8') as arquivo:
+        arquivo.write("<!DOCTYPE html><html><head><meta charset='utf-8'><title>Relatórios</title></head><body>"
+                      f"<h1>Relatórios</h1><ul>{''.join(linhas)}</ul></body></html>")
+
+
+def renderizar_relatorios(pasta_loja, estados, saida, processos=1, png=False):
+    """
+    Renderiza todos os estados, em paralelo com processos > 1.
+
+    Parâmetros:
+    - pasta_loja: pasta com os dados tratados da loja
+    - estados: lista de estados (ver gerar_estados / ler_estados), ou uma
+      função (dados) -> estados, chamada depois da carga
+    - saida: pasta dos relatórios (uma subpasta por estado + indice.html)
+    - processos: tamanho do pool (1 renderiza no próprio processo)
+    - png: grava também os gráficos em PNG (kaleido)
+
+    Retorna:
+    - lista de (nome do estado, segundos)
+    """
+    global _dados
+    _dados = montar_dataset_loja(pasta_loja, COLUNAS_ADS, COLUNAS_CRM)
+    if callable(estados):
+        estados = estados(_dados)
+    os.makedirs(saida, exist_ok=True)
+
+    n = len(estados)
+    if processos <= 1 or n <= 1:
+        resultados = [_renderizar(estado, saida, png) for estado in estados]
+    else:
+        # Com fork, os processos herdam _dados já montado (páginas compartilhadas até serem escritas)
+        if 'fork' in multiprocessing.get_all_start_methods():
+            contexto, inicializar = multiprocessing.get_context('fork'), None
+        else:
+            contexto, inicializar = multiprocessing.get_context(), _iniciar_processo
+        with ProcessPoolExecutor(max_workers=processos, mp_context=contexto, initializer=inicializar,
+                                 initargs=(pasta_loja,) if inicializar else ()) as pool:
+            lote = max(1, n // (processos * 4))
+            resultados = list(pool.map(_renderizar, estados, [saida] * n, [png] * n, chunksize=lote))
+
+    gravar_indice(resultados, saida)
+    return resultados
+
+
+# ========================================== LINHA DE COMANDO ==========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera relatórios estáticos (HTML/PNG/Parquet) por estado de filtro.")
+    parser.add_argument('--loja', default=LOJA_PADRAO, help="loja (ver utils.listar_lojas)")
+    parser.add_argument('--estados', help="arquivo JSON com a lista de estados (senão, a grade abaixo)")
+    parser.add_argument('--periodos', type=int, nargs='+', default=[30], help="últimos N dias de cada período da grade")
+    parser.add_argument('--fim', help="último dia dos períodos da grade (padrão: último dia com dados)")
+    parser.add_argument('--por-campanha', action='store_true', help="um estado por campanha")
+    parser.add_argument('--por-canal', action='store_true', help="um estado por canal de origem")
+    parser.add_argument('--granularidade', choices=list(GRANULARIDADES), default='dia', help="grão dos gráficos no tempo")
+    parser.add_argument('--saida', default='relatorios', help="pasta dos relatórios")
+    parser.add_argument('--processos', type=int, default=1, help="processos do pool; 0 usa todos os núcleos")
+    parser.add_argument('--png', action='store_true', help="grava também os gráficos em PNG (exige kaleido)")
+    args = parser.parse_args(argv)
+
+    if args.png and find_spec('kaleido') is None:
+        parser.error("--png exige o pacote kaleido (pip install kaleido)")
+    lojas = listar_lojas()
+    if args.loja not in lojas:
+        parser.error(f"loja desconhecida: {args.loja} (disponíveis: {', '.join(lojas) or 'nenhuma'})")
+
+    if args.estados:
+        estados = ler_estados(args.estados)
+    else:
+        def estados(dados):
+            return gerar_estados(dados, args.periodos, args.por_campanha, args.por_canal, args.granularidade, args.fim)
+
+    inicio = time.perf_counter()
+    resultados = renderizar_relatorios(lojas[args.loja], estados, args.saida,
+                                       processos=args.processos or os.cpu_count(), png=args.png)
+    print(f"{len(resultados)} relatórios em {time.perf_counter() - inicio:.1f}s -> {os.path.join(args.saida, 'indice.html')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,278 @@
-# utils.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-@st.cache_data
-def carregar_dados(path):
+from cache import CacheConsultas, CacheDisco, versao_codigo
+from contagem_distinta import ContagemDistinta
+from coortes import CoortesLeads
+from cubo import GRANULARIDADES, construir_cubo_metaads, construir_rollup
+from esquema import aplicar_esquema
+from indices import IndiceFiltro
+from insights import ARQUIVO_INSIGHTS, gerar_insights, ler_insights, ler_resumo
+from instrumentacao import medir
+from lojas import GerenciadorLojas
+from metadados import ARQUIVO_METADADOS, ler_metadados, metadados_dataset
+
+# Colunas usadas pelo dashboard (o restante nem é lido do disco)
+COLUNAS_ADS = ['data', 'campanha', 'anuncio', 'sexo', 'idade', 'impressoes', 'cliques',
+               'conversões', 'gasto_total', 'Receita', 'ctr (%)', 'cpc (R$)', 'cpa (R$)']
+COLUNAS_CRM = ['lead_id', 'data_captura', 'campanha_origem', 'ad_clicked', 'canal_origem', 'etapa_funil',
+               'status', 'sale_id', 'valor_total', 'dias_para_conversao']
+
+
+def caminho_parquet(path):
+    """Retorna o caminho do Parquet equivalente a um CSV tratado (arquivo ou pasta de partes)"""
+    return os.path.splitext(path)[0] + ".parquet"
+
+
+def versao_dados(path):
+    """
+    Versão do dataset no disco (mtime do Parquet, ou do CSV).
+
+    Para uma pasta de partes (scripts/preprocessamento.py), o mtime da pasta
+    muda a cada parte acrescentada ou reescrita.
+
+    Usada pelo gerenciador de lojas e pelo cache de consultas: quando o
+    arquivo muda, as chaves mudam e os dados são recarregados.
+    """
+    parquet = caminho_parquet(path)
+    arquivo = parquet if os.path.exists(parquet) else path
     try:
-        df = pd.read_csv(path, index_col=0)
+        return os.stat(arquivo).st_mtime_ns
+    except OSError:
+        return None
+
+
+def carregar_dados(path, colunas=None, esquema=None):
+    """
+    Carrega um dataset tratado.
+
+    Usa o arquivo Parquet ao lado do CSV quando existir, lendo apenas as
+    colunas pedidas. Caso contrário, lê o CSV (também só com as colunas pedidas).
+    Se um esquema for informado ('ads' ou 'crm', ver esquema.ESQUEMAS), valida
+    as colunas pedidas e já devolve os tipos aplicados (datas, categorias e
+    numéricos reduzidos).
+
+    Não guarda nada: quem mantém os datasets na memória é o gerenciador de
+    lojas (ver obter_gerenciador_lojas).
+    """
+    try:
+        parquet = caminho_parquet(path)
+        if os.path.exists(parquet):
+            # Arquivo mapeado em memória: as páginas são lidas direto do cache do SO
+            df = pd.read_parquet(parquet, columns=colunas, memory_map=True)
+        elif colunas is None:
+            df = pd.read_csv(path, index_col=0)
+        else:
+            selecionadas = set(colunas)
+            df = pd.read_csv(path, index_col=0, usecols=lambda c: c in selecionadas or c == "Unnamed: 0")
+
+        if esquema is not None:
+            df = aplicar_esquema(df, esquema, obrigatorias=colunas)
         return df
     except Exception as e:
         st.error(f"Erro ao carregar os dados: {e}")
         return pd.DataFrame()
+
+
+# ========================================== LOJAS ==========================================
+
+# Loja padrão (data/tratados) e pasta com uma subpasta de dados tratados por loja
+# (ex: python scripts/preprocessamento.py --entrada data/raw/Loja --saida data/lojas/Loja)
+LOJA_PADRAO = os.environ.get('DASHBOARD_LOJA_PADRAO', 'GeekWear')
+PASTA_PADRAO = "data/tratados"
+PASTA_LOJAS = os.environ.get('DASHBOARD_LOJAS_DIR', 'data/lojas')
+ARQUIVO_ADS = "metaads_data.csv"
+ARQUIVO_CRM = "crm_sales_data.csv"
+
+# Memória máxima dos datasets das lojas (cubo, CRM, índices) num processo
+MEMORIA_LOJAS_MB = float(os.environ.get('DASHBOARD_MEMORIA_MB', 2048))
+# Segundos entre duas listagens das pastas das lojas (lojas novas aparecem sem reiniciar)
+TTL_LOJAS = float(os.environ.get('DASHBOARD_LOJAS_TTL', 30))
+
+
+def _tem_dados(pasta):
+    """True se a pasta tem o Meta Ads e o CRM tratados (CSV ou Parquet)"""
+    return all(
+        os.path.exists(os.path.join(pasta, arquivo)) or os.path.exists(caminho_parquet(os.path.join(pasta, arquivo)))
+        for arquivo in (ARQUIVO_ADS, ARQUIVO_CRM)
+    )
+
+
+def listar_lojas(pasta_lojas=PASTA_LOJAS):
+    """
+    Lojas com dados tratados no disco.
+
+    Retorna:
+    - {loja: pasta}, com a loja padrão (data/tratados) primeiro e as
+      subpastas de pasta_lojas em ordem alfabética
+    """
+    lojas = {LOJA_PADRAO: PASTA_PADRAO} if _tem_dados(PASTA_PADRAO) else {}
+    if os.path.isdir(pasta_lojas):
+        for entrada in sorted(os.scandir(pasta_lojas), key=lambda e: e.name):
+            if entrada.is_dir() and _tem_dados(entrada.path):
+                lojas.setdefault(entrada.name, entrada.path)
+    return lojas
+
+
+def versao_loja(pasta):
+    """Versão dos dados de uma loja: (versão do Meta Ads, versão do CRM), ver versao_dados"""
+    return (versao_dados(os.path.join(pasta, ARQUIVO_ADS)), versao_dados(os.path.join(pasta, ARQUIVO_CRM)))
+
+
+def _gravado_apos_dados(pasta, arquivo, datasets=(ARQUIVO_ADS, ARQUIVO_CRM)):
+    """
+    mtime de um arquivo derivado dos datasets da loja (metadados, resumos), ou None.
+
+    None se o arquivo não existir ou for mais antigo que algum dos datasets
+    de que depende (ex: dados trocados sem rodar o pré-processamento).
+    """
+    try:
+        versao = os.stat(os.path.join(pasta, arquivo)).st_mtime_ns
+    except OSError:
+        return None
+    for dataset in datasets:
+        dados = versao_dados(os.path.join(pasta, dataset))
+        if dados is None or dados > versao:
+            return None
+    return versao
+
+
+def _montar_ads(pasta, colunas):
+    """Cubo do Meta Ads, seu índice e os índices dos rollups por semana e mês"""
+    df_ads = carregar_dados(os.path.join(pasta, ARQUIVO_ADS), colunas=colunas, esquema='ads')
+    cubo = df_ads if df_ads.empty else construir_cubo_metaads(df_ads)
+    del df_ads
+
+    indice_ads = IndiceFiltro(cubo, 'data', ['campanha', 'sexo', 'idade'])
+    cubo = indice_ads.df
+    indices_periodo = {'dia': indice_ads}
+    for granularidade in GRANULARIDADES:
+        if granularidade not in indices_periodo:
+            rollup = construir_rollup(cubo, granularidade)
+            indices_periodo[granularidade] = IndiceFiltro(rollup, 'data', ['campanha', 'sexo', 'idade'])
+    return {'cubo_ads': cubo, 'indice_ads': indice_ads, 'indices_periodo': indices_periodo}
+
+
+def _montar_crm(pasta, colunas):
+    """CRM, seu índice, as contagens distintas por célula e as coortes semanais de leads"""
+    # O CRM fica só na ordem do índice (por data_captura): df_crm é o próprio indice_crm.df
+    indice_crm = IndiceFiltro(carregar_dados(os.path.join(pasta, ARQUIVO_CRM), colunas=colunas, esquema='crm'),
+                              'data_captura', ['canal_origem', 'campanha_origem'])
+    df_crm = indice_crm.df
+    # Coortes mantidas pelo pré-processamento, se não forem mais antigas que os dados
+    resumo = ler_resumo(pasta, 'coorte_leads') if _gravado_apos_dados(pasta, 'coorte_leads.csv', [ARQUIVO_CRM]) else None
+    return {
+        'df_crm': df_crm,
+        'indice_crm': indice_crm,
+        'contagem_crm': ContagemDistinta(df_crm),
+        'coortes_crm': CoortesLeads(indice_crm, resumo=resumo),
+    }
+
+
+def montar_dataset_loja(pasta, colunas_ads=None, colunas_crm=None):
+    """
+    Lê os dados tratados de uma loja e monta tudo o que o dashboard consulta.
+
+    O Meta Ads e o CRM são montados ao mesmo tempo, em duas threads (a leitura
+    do Parquet e boa parte do pandas liberam o GIL); o tempo de carga fica
+    perto do maior dos dois, não da soma.
+
+    Retorna:
+    - dict com df_crm, cubo_ads (data x campanha x sexo x idade x anuncio),
+      indice_ads, indice_crm, indices_periodo ({granularidade: IndiceFiltro}
+      sobre os rollups do cubo; o rollup de cada grão fica em indice.df),
+      contagem_crm (leads/vendas distintos por célula do CRM), coortes_crm
+      (coortes semanais de leads, ver coortes.CoortesLeads) e metadados
+      (domínios dos filtros e período, ver metadados.metadados_dataset)
+    """
+    # As threads herdam o contexto do script: st.error de carregar_dados aparece na página
+    contexto = get_script_run_ctx(suppress_warning=True)
+    iniciar = None if contexto is None else partial(add_script_run_ctx, None, contexto)
+    with medir('montar_dataset_loja', 'carga') as registro:
+        with ThreadPoolExecutor(max_workers=2, initializer=iniciar) as threads:
+            ads = threads.submit(_montar_ads, pasta, colunas_ads)
+            crm = threads.submit(_montar_crm, pasta, colunas_crm)
+            objetos = {**ads.result(), **crm.result()}
+        registro['linhas_saida'] = len(objetos['cubo_ads']) + len(objetos['df_crm'])
+
+    objetos['metadados'] = metadados_dataset(objetos['cubo_ads'], objetos['df_crm'])
+    return objetos
+
+
+@st.cache_resource
+def obter_gerenciador_lojas(colunas_ads=None, colunas_crm=None):
+    """
+    Gerenciador dos datasets das lojas, único por processo (compartilhado entre sessões).
+
+    Cada loja é montada na primeira vez em que é escolhida e fica na memória
+    até passar de MEMORIA_LOJAS_MB (despejo LRU, ver lojas.GerenciadorLojas).
+    A lista de lojas é relida do disco a cada TTL_LOJAS segundos.
+    Os objetos são compartilhados entre as sessões e não devem ser alterados.
+    """
+    montar = partial(montar_dataset_loja, colunas_ads=colunas_ads, colunas_crm=colunas_crm)
+    return GerenciadorLojas(listar_lojas, montar, versao_loja, orcamento_mb=MEMORIA_LOJAS_MB, ttl=TTL_LOJAS)
+
+
+@st.cache_data
+def _carregar_insights(pasta, versao=None):
+    return ler_insights(pasta) or gerar_insights(pasta)
+
+
+def obter_insights(pasta):
+    """
+    Achados da aba de Insights de uma loja (insights.json, gravado pelo pré-processamento).
+
+    Sem o arquivo (dados tratados antes do motor de insights), os achados são
+    calculados das tabelas-resumo, que são pequenas. Recarrega quando o
+    arquivo (ou, sem ele, os dados da loja) muda.
+    """
+    caminho = os.path.join(pasta, ARQUIVO_INSIGHTS)
+    versao = os.stat(caminho).st_mtime_ns if os.path.exists(caminho) else versao_loja(pasta)
+    return _carregar_insights(pasta, versao)
+
+
+@st.cache_data
+def _carregar_metadados(pasta, versao=None):
+    return ler_metadados(pasta)
+
+
+def obter_metadados(pasta):
+    """
+    Domínios dos filtros e período dos dados de uma loja (metadados.json, gravado pelo pré-processamento).
+
+    Lido antes de carregar a loja: a sidebar aparece sem esperar os datasets.
+    Retorna None se o arquivo não existir ou for mais antigo que os dados
+    (ex: dados trocados sem rodar o pré-processamento); aí os metadados vêm
+    do dataset carregado (DatasetLoja['metadados']).
+    """
+    versao = _gravado_apos_dados(pasta, ARQUIVO_METADADOS)
+    if versao is None:
+        return None
+    return _carregar_metadados(pasta, versao)
+
+
+# Pasta e limite do cache de consultas em disco (pasta vazia desliga o disco)
+PASTA_CACHE_DISCO = os.environ.get('DASHBOARD_CACHE_DIR', '.cache/consultas')
+CACHE_DISCO_MB = float(os.environ.get('DASHBOARD_CACHE_MB', 256))
+# Limite em memória do cache de consultas, somado ao orçamento das lojas (MEMORIA_LOJAS_MB)
+CACHE_MEMORIA_MB = float(os.environ.get('DASHBOARD_CACHE_MEMORIA_MB', 128))
+
+
+@st.cache_resource
+def obter_cache_consultas(tamanho_max_mb=CACHE_MEMORIA_MB):
+    """
+    Cache LRU das agregações do dashboard, único por processo (compartilhado entre sessões),
+    limitado a tamanho_max_mb de resultados.
+
+    Com PASTA_CACHE_DISCO definida, os resultados também ficam em disco e
+    sobrevivem a reinícios (ver cache.CacheDisco e scripts/aquecer_cache.py).
+    As chaves levam o hash do código de scripts/: um deploy invalida o cache.
+    """
+    disco = CacheDisco(PASTA_CACHE_DISCO, CACHE_DISCO_MB) if PASTA_CACHE_DISCO else None
+    return CacheConsultas(tamanho_max_mb=tamanho_max_mb, disco=disco,
+                          versao_codigo=versao_codigo(os.path.dirname(os.path.abspath(__file__))))